@@ -1,15 +1,38 @@
 
+import argparse
+import socket
+
 import networking
+from networking.admission import AdmissionController
 from core.logger import logger
 from core.console import start_command_listener
 
 _version = '0.0.1'
 
 def main():
+    parser = argparse.ArgumentParser(prog='python -m core')
+    parser.add_argument('--port', type=int, default=25565)
+    parser.add_argument('--workers', type=int, default=1, help='processes sharing the port, usually one per core')
+    parser.add_argument('--backlog', type=int, default=socket.SOMAXCONN, help='pending connections the kernel queues per process')
+    parser.add_argument('--offline', action='store_true', help='skip encryption and the session server, players get offline UUIDs')
+    parser.add_argument('--forwarding-secret', metavar='FILE',
+                        help='file holding the secret of a Velocity proxy using modern forwarding; logins are then throttled per player address the proxy forwards, not per proxy IP')
+    parser.add_argument('--exempt-ip', action='append', default=[], metavar='IP',
+                        help='never throttle logins from this IP, such as a NAT in front of many players or a proxy without --forwarding-secret; repeatable')
+    parser.add_argument('--no-ip-throttle', action='store_true', help='turn the per IP login throttle off')
+    args = parser.parse_args()
+    forwarding_secret = None
+    if args.forwarding_secret:
+        with open(args.forwarding_secret, 'rb') as f:
+            forwarding_secret = f.read().strip()
+
     logger.info("MC Server Py is running version " + _version)
 
     # Start connection listener daemon
-    networking.start_server(port=25565)
+    admission = AdmissionController(exempt_ips=args.exempt_ip)
+    if args.no_ip_throttle:
+        admission.ip_rate = None
+    networking.start_server(port=args.port, backlog=args.backlog, workers=args.workers, online_mode=not args.offline, forwarding_secret=forwarding_secret, admission=admission)
 
     # Start Command listener daemon
     start_command_listener()
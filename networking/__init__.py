@@ -1,14 +1,32 @@
 
+import socket
+
+from networking.admission import AdmissionController
+from networking.cluster import Cluster
 from networking.connection import ConnectionListener
+from networking.status import read_favicon
 
 _listener = None
+_cluster = None
 
-def start_server(port=25565):
-    global _listener
-    _listener = ConnectionListener()
-    _listener.start_server(port=port)
+def start_server(port=25565, backlog=socket.SOMAXCONN, workers=1, online_mode=True, forwarding_secret=None, admission: AdmissionController = None):
+    '''
+    More than one worker runs a Cluster of processes sharing the port.
+    The server list shows server-icon.png from the working directory, when there is one.
+    Each worker gets its own copy of admission, limiting the logins it takes on.
+    '''
+    global _listener, _cluster
+    favicon = read_favicon('server-icon.png')
+    if workers > 1:
+        _cluster = Cluster(workers, port=port, backlog=backlog, favicon=favicon, online_mode=online_mode, forwarding_secret=forwarding_secret, admission=admission)
+        _cluster.start()
+        return
+    _listener = ConnectionListener(favicon=favicon, online_mode=online_mode, forwarding_secret=forwarding_secret, admission=admission)
+    _listener.start_server(port=port, backlog=backlog)
 
 def stop_server():
-    global _listener
+    global _listener, _cluster
+    if _cluster:
+        _cluster.stop()
+        return
     _listener.stop_server()
-    
\ No newline at end of file
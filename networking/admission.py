@@ -0,0 +1,181 @@
+'''
+Admission control in the accept path, so a burst of reconnects after a restart or a bot flood
+costs the server little more than the sockets, instead of handshakes, RSA decryptions and session server calls.
+'''
+import threading
+import time
+from collections import deque
+from typing import Iterable
+
+
+class TokenBucket:
+    '''
+    Allows rate events per second on average, and bursts of up to burst events.
+    '''
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: float = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float = None) -> bool:
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+    def wait(self, now: float = None) -> float:
+        '''
+        Seconds until the next token.
+        '''
+        self._refill(time.monotonic() if now is None else now)
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+    def full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class AdmissionController:
+    '''
+    Decides which sockets the listener takes on. Thread safe.
+
+    - Pending: sockets accepted and not logged in yet, whether pinging the server list, logging in or waiting to.
+      Beyond max_pending, new sockets are closed right away.
+    - Per IP: logins from one IP are throttled by a token bucket, as the Notchian connection throttle does.
+      IPs many players share, such as a proxy or a NAT, can be exempted.
+    - Login rate: logins start at login_rate per second at most. Those beyond wait in a queue of at most max_login_queue.
+
+    Parameters:
+    max_pending (int): Sockets that may be handshaking or logging in at once.
+    ip_rate (float): Logins per second allowed from one IP on average. None disables the per IP throttle.
+    ip_burst (int): Logins allowed from one IP back to back, such as a few quick reconnects.
+    login_rate (float): Logins started per second across every IP.
+    login_burst (int): Logins started back to back once the server was quiet for a while.
+    max_login_queue (int): Logins waiting for their turn. Further ones are turned away as the server being busy.
+    exempt_ips (Iterable[str]): IPs never throttled per IP, such as a proxy in front of the server.
+        They still count towards max_pending and wait for their turn at login_rate.
+
+    Pickles as its configuration, so each Cluster worker gets a fresh controller of its own.
+    '''
+    PRUNE_AT = 4096
+    '''
+    IPs tracked before buckets that filled up again are dropped, they would allow a full burst anyway.
+    '''
+
+    def __init__(self, max_pending: int = 512, ip_rate: float = 0.25, ip_burst: int = 3, login_rate: float = 20.0, login_burst: int = 20, max_login_queue: int = 512,
+                 exempt_ips: Iterable[str] = ()):
+        self.max_pending = max_pending
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.max_login_queue = max_login_queue
+        self.exempt_ips = frozenset(exempt_ips)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._ips = {}
+        self._prune_at = self.PRUNE_AT
+        self._logins = TokenBucket(login_rate, login_burst)
+        self._login_queue = deque()
+        self.rejected = {'pending': 0, 'throttled': 0, 'queue': 0}
+        '''
+        Sockets turned away by each limit so far.
+        '''
+
+    def __reduce__(self):
+        return (AdmissionController, (self.max_pending, self.ip_rate, self.ip_burst, self._logins.rate, self._logins.burst, self.max_login_queue, self.exempt_ips))
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def queued_logins(self) -> int:
+        return len(self._login_queue)
+
+    def accept(self) -> bool:
+        '''
+        Takes a pending slot for a socket just accepted, False when it should be closed instead.
+        Every slot taken must be given back with release().
+        '''
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected['pending'] += 1
+                return False
+            self._pending += 1
+            return True
+
+    def release(self):
+        '''
+        Gives a pending slot back, once its socket logged in or closed.
+        '''
+        with self._lock:
+            self._pending -= 1
+
+    def allow_login(self, ip: str) -> bool:
+        '''
+        Takes a token from the IP's bucket, False when it logs in too often.
+        '''
+        if self.ip_rate is None or ip in self.exempt_ips:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._ips.get(ip)
+            if bucket is None:
+                if len(self._ips) >= self._prune_at:
+                    self._prune(now)
+                bucket = self._ips[ip] = TokenBucket(self.ip_rate, self.ip_burst, now)
+            if not bucket.take(now):
+                self.rejected['throttled'] += 1
+                return False
+            return True
+
+    def _prune(self, now: float):
+        for ip in [ip for ip, bucket in self._ips.items() if bucket.full(now)]:
+            del self._ips[ip]
+        # Pruning again only once the table doubled keeps it amortized constant time
+        self._prune_at = max(self.PRUNE_AT, 2 * len(self._ips))
+
+    def queue_login(self, entry) -> bool:
+        '''
+        Puts a login in line, False when the queue is full.
+        Logins are taken out in order by admit().
+        '''
+        with self._lock:
+            if len(self._login_queue) >= self.max_login_queue:
+                self.rejected['queue'] += 1
+                return False
+            self._login_queue.append((time.monotonic(), entry))
+            return True
+
+    def admit(self) -> list:
+        '''
+        Takes the logins whose turn came out of the queue, as (time queued, entry) pairs.
+        '''
+        admitted = []
+        with self._lock:
+            while self._login_queue and self._logins.take():
+                admitted.append(self._login_queue.popleft())
+        return admitted
+
+    def next_admission(self) -> float:
+        '''
+        Seconds until admit() takes the next login out of the queue, None when it is empty.
+        '''
+        with self._lock:
+            if not self._login_queue:
+                return None
+            return self._logins.wait()
+
+    def drain(self) -> list:
+        '''
+        Empties the queue, returning the entries it held.
+        '''
+        with self._lock:
+            queue, self._login_queue = self._login_queue, deque()
+        return [entry for _, entry in queue]
@@ -0,0 +1,119 @@
+'''
+Session server authentication for online mode logins, and the identity of players in offline mode.
+https://minecraft.wiki/w/Java_Edition_protocol/Encryption#Server
+
+Requests run on a small worker pool over one keep-alive HTTP session, so a slow session server never blocks an event loop.
+'''
+import hashlib
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from core.logger import logger
+from networking.exception import AuthenticationError
+from networking.latency import LatencySamples
+
+MOJANG_SESSION_SERVER = 'https://sessionserver.mojang.com/session/minecraft/hasJoined'
+
+
+def offline_uuid(username: str) -> uuid.UUID:
+    '''
+    UUID the Notchian server gives a player in offline mode, version 3 from the MD5 of OfflinePlayer:<username>.
+    Same as Java's UUID.nameUUIDFromBytes(), which unlike uuid.uuid3() hashes no namespace.
+    '''
+    return uuid.UUID(bytes=hashlib.md5(f'OfflinePlayer:{username}'.encode('utf-8')).digest(), version=3)
+
+def chain_future(future: Future, function: Callable) -> Future:
+    '''
+    Returns a future resolving to function(result) once future resolves, or failing with the same exception.
+    function runs on whichever thread completes future.
+    '''
+    chained = Future()
+    def _done(done: Future):
+        try:
+            chained.set_result(function(done.result()))
+        except BaseException as e:
+            chained.set_exception(e)
+    future.add_done_callback(_done)
+    return chained
+
+
+class SessionAuthenticator:
+    '''
+    Asks the session server whether a player has joined, without blocking the caller.
+    At most max_concurrency requests are in flight, the rest wait in the pool's queue.
+    Connection failures and 5xx responses are retried with backoff, each attempt bounded by timeout.
+    '''
+
+    LATENCY_SAMPLES = 1024
+    '''
+    Number of recent requests latency percentiles are computed over.
+    '''
+
+    def __init__(self, endpoint: str = MOJANG_SESSION_SERVER, max_concurrency: int = 8, timeout: float = 5.0, retries: int = 2):
+        '''
+        Parameters:
+        endpoint (str): hasJoined URL, point it at a local fake session server for tests and load runs.
+        max_concurrency (int): Requests in flight at once, which is also the size of the HTTP connection pool.
+        timeout (float): Seconds to connect, and then to wait for the response, per attempt.
+        retries (int): Extra attempts after a connection failure or a 5xx response.
+        '''
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self._session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.1,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=('GET',),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=retry)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='SessionAuth')
+        self._latencies = LatencySamples(self.LATENCY_SAMPLES)
+
+    def has_joined(self, username: str, server_hash: str, ip: str = None) -> Future:
+        '''
+        Returns a future resolving to the player's profile as sent by the session server (id, name, properties).
+        The future fails with AuthenticationError when the player is not confirmed or the server cannot be reached.
+        '''
+        params = {'username': username, 'serverId': server_hash}
+        if ip:
+            params['ip'] = ip
+        return self._pool.submit(self._request, params)
+
+    def _request(self, params: dict) -> dict:
+        start = time.monotonic()
+        try:
+            response = self._session.get(self.endpoint, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise AuthenticationError(f'Session server unreachable: {e}')
+        finally:
+            self._latencies.add(time.monotonic() - start)
+        # The session server answers 204 with no body when the player did not join
+        if response.status_code != 200:
+            raise AuthenticationError(f'Authentication failed: {response.status_code}')
+        try:
+            profile = response.json()
+            profile['id'], profile['name']
+        except (ValueError, KeyError, TypeError) as e:
+            raise AuthenticationError(f'Malformed session server response: {e}')
+        return profile
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)) -> dict:
+        '''
+        Seconds taken by recent requests at each percentile, including retries. Empty when nothing was requested yet.
+        '''
+        return self._latencies.percentiles(percentiles)
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._session.close()
+        logger.debug(f'Session authenticator closed, latency percentiles: {self.latency_percentiles()}')
@@ -0,0 +1,227 @@
+'''
+Scale-out over several processes, each running its own ConnectionListener on the same port with SO_REUSEPORT.
+The kernel spreads incoming connections between the workers, and every worker owns the connections it accepted,
+so packet handling runs on as many interpreters, and cores, as there are workers.
+
+The launching process only relays messages between the workers over one pipe each:
+- Player counts, so the server list shows the players of the whole cluster.
+- Topics published by a worker, such as chat or kicks, forwarded to every other worker.
+'''
+import multiprocessing
+import socket
+import threading
+from multiprocessing.connection import Connection as Pipe, wait
+from typing import Callable
+
+from core.logger import logger
+from networking.connection import ConnectionListener
+
+REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+
+
+class ClusterHub:
+    '''
+    Runs in the launching process, holding one pipe per worker.
+    Workers report their player count and get the total back whenever it changes.
+    Any other message from a worker is forwarded to every other worker.
+    '''
+
+    def __init__(self, pipes: list):
+        self._pipes = pipes
+        self._counts = [0] * len(pipes)
+        self._total = 0
+        self._send_lock = threading.Lock()
+
+    def run(self):
+        '''
+        Relays until every worker closed its pipe.
+        '''
+        open_pipes = list(self._pipes)
+        while open_pipes:
+            for pipe in wait(open_pipes):
+                worker = self._pipes.index(pipe)
+                try:
+                    message = pipe.recv()
+                except (EOFError, OSError):
+                    open_pipes.remove(pipe)
+                    # A worker that is gone has no players left
+                    message = ('players', 0)
+                self._on_message(worker, message)
+
+    def _on_message(self, worker: int, message: tuple):
+        if message[0] == 'players':
+            self._counts[worker] = message[1]
+            total = sum(self._counts)
+            if total != self._total:
+                self._total = total
+                self._send(('players', total))
+            return
+        self._send(message, skip=worker)
+
+    def _send(self, message: tuple, skip: int = None):
+        with self._send_lock:
+            for worker, pipe in enumerate(self._pipes):
+                if worker == skip:
+                    continue
+                try:
+                    pipe.send(message)
+                except OSError:
+                    # Worker exited, run() notices
+                    pass
+
+    def stop(self):
+        '''
+        Asks every worker to stop. Thread safe.
+        '''
+        self._send(('stop',))
+
+
+class ClusterChannel:
+    '''
+    A worker's end of its pipe to the hub. Reachable as ConnectionListener.cluster in worker processes.
+
+    Handlers subscribed to a topic run on the channel thread with the arguments it was published with,
+    whichever worker published it, this one included. The kick topic is built in.
+    '''
+    REPORT_INTERVAL = 0.5
+    '''
+    Seconds between checks of the local player count, which is only sent when it changed.
+    '''
+
+    def __init__(self, pipe: Pipe, listener):
+        self.listener = listener
+        self.online_players = 0
+        self._pipe = pipe
+        self._send_lock = threading.Lock()
+        self._handlers = {'kick': self._on_kick}
+        self._stop_event = threading.Event()
+        listener.cluster = self
+        listener.status.online_players = lambda: self.online_players
+
+    def subscribe(self, topic: str, handler: Callable):
+        self._handlers[topic] = handler
+
+    def publish(self, topic: str, *args):
+        '''
+        Thread safe. Hands the message to this worker's handler and to every other worker.
+        '''
+        self._send((topic, *args))
+        self._dispatch((topic, *args))
+
+    def kick(self, username: str):
+        '''
+        Closes the player's connection, whichever worker owns it.
+        '''
+        self.publish('kick', username)
+
+    def _on_kick(self, username: str):
+        connection = self.listener.connections.by_username(username)
+        if connection:
+            logger.info(f'Kicking {username}', log_thread=False)
+            connection.interrupt()
+
+    def _send(self, message: tuple):
+        with self._send_lock:
+            self._pipe.send(message)
+
+    def _dispatch(self, message: tuple):
+        handler = self._handlers.get(message[0])
+        if handler is None:
+            logger.warning(f'No handler for cluster topic {message[0]}')
+            return
+        try:
+            handler(*message[1:])
+        except Exception:
+            logger.exception(f'Error while handling cluster topic {message[0]}')
+
+    def run(self):
+        '''
+        Reads the pipe on the calling thread until the hub says stop or goes away.
+        '''
+        reporter = threading.Thread(target=self._report, name='ClusterReporter', daemon=True)
+        reporter.start()
+        try:
+            while True:
+                try:
+                    message = self._pipe.recv()
+                except (EOFError, OSError):
+                    return
+                if message[0] == 'stop':
+                    return
+                if message[0] == 'players':
+                    self.online_players = message[1]
+                    continue
+                self._dispatch(message)
+        finally:
+            self._stop_event.set()
+            reporter.join()
+
+    def _report(self):
+        reported = None
+        while not self._stop_event.wait(0 if reported is None else self.REPORT_INTERVAL):
+            count = self.listener.connections.player_count
+            if count == reported:
+                continue
+            try:
+                self._send(('players', count))
+            except OSError:
+                return
+            reported = count
+
+
+def _run_worker(pipe: Pipe, address: str, port: int, backlog: int, listener_options: dict):
+    listener = ConnectionListener(**listener_options)
+    channel = ClusterChannel(pipe, listener)
+    listener.start_server(address, port, backlog=backlog, reuse_port=True)
+    try:
+        channel.run()
+    finally:
+        listener.stop_server()
+
+
+class Cluster:
+    '''
+    Launches worker processes sharing one port and relays their messages from this process.
+
+    Parameters:
+    workers (int): Worker processes, usually one per core.
+    backlog (int): Listen backlog of each worker's socket.
+    listener_options (dict): Keyword arguments of each worker's ConnectionListener.
+    '''
+
+    def __init__(self, workers: int, address: str = '0.0.0.0', port: int = 25565, backlog: int = socket.SOMAXCONN, **listener_options):
+        if not REUSE_PORT:
+            raise OSError('SO_REUSEPORT is not supported on this platform')
+        self.workers = workers
+        self.address = address
+        self.port = port
+        self.backlog = backlog
+        self.listener_options = listener_options
+        self._processes = []
+        self._hub: ClusterHub = None
+        self._hub_thread: threading.Thread = None
+
+    def start(self):
+        logger.info(f'Starting {self.workers} worker processes...')
+        pipes = []
+        # Forking a process full of threads may copy locks held by them, workers start from a fresh interpreter instead
+        context = multiprocessing.get_context('spawn')
+        for worker in range(self.workers):
+            hub_end, worker_end = context.Pipe()
+            process = context.Process(target=_run_worker, name=f'Worker-{worker}',
+                                              args=(worker_end, self.address, self.port, self.backlog, self.listener_options))
+            process.start()
+            # The worker holds its own copy, the hub has to see EOF once the worker exits
+            worker_end.close()
+            pipes.append(hub_end)
+            self._processes.append(process)
+        self._hub = ClusterHub(pipes)
+        self._hub_thread = threading.Thread(target=self._hub.run, name='ClusterHub', daemon=True)
+        self._hub_thread.start()
+
+    def stop(self):
+        logger.info('Stopping worker processes...')
+        self._hub.stop()
+        for process in self._processes:
+            process.join()
+        self._hub_thread.join()
@@ -1,201 +1,986 @@
-
+import os
+import selectors
 import socket
 import threading
+import time
+import weakref
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import List
+from typing import Callable, Iterable, List
 
 from core.logger import logger
 import networking.packet as packet
 from networking.packet.client_bound import configuration as c_config
+from networking.packet.client_bound import login as c_login
+from networking.packet.client_bound import play as c_play
+from networking.packet.dispatch import GameQueue, GameTicker, HandlerPool, Route
+from networking.packet.scheduler import PacketScheduler, Priority
 from networking.packet.server_bound import configuration as s_config
+from networking.packet.server_bound import play as s_play
 from networking.socket_io import MCPacketInputStream, MCPacketOutputStream
 from networking.protocol import ConnectionState
 from networking.packet.packet_connection import PacketConnectionState
+from networking.event_loop import EventLoop, EventLoopGroup, TimerHandle
+from networking.mc_crypto import ServerKeyPair
+from networking.admission import AdmissionController
+from networking.auth import SessionAuthenticator
+from networking.connection_registry import ConnectionRegistry
+from networking.status import ServerStatus, StatusResponder
+from networking.exception import AuthenticationError, ConnectionClosedError, LoginThrottledError, ServerBusyError
 
 class ConnectionListener:
-    
-    def __init__(self):
-        self.connections: List[Connection] = []
-        self.connection_list_lock = threading.Lock()
-        self.server_stop_event = threading.Event()
-        self.server_thread = None
-        self.server = None
 
+    def __init__(self, event_loops: int = None, compression_threshold: int = 256, compression_level: int = zlib.Z_DEFAULT_COMPRESSION, frame_workers: int = None, key_pair: ServerKeyPair = None, authenticator: SessionAuthenticator = None, tcp_nodelay: bool = True,
+                 high_water_mark: int = 1 << 20, low_water_mark: int = 256 << 10, max_queued_bytes: int = 8 << 20, slow_client_timeout: float = 30.0,
+                 handler_workers: int = 4, max_queued_handlers: int = 1024, game_queue: GameQueue = None, fast_status: bool = True, favicon: bytes = None,
+                 admission: AdmissionController = None, online_mode: bool = True, forwarding_secret: bytes = None):
+        '''
+        Parameters:
+        event_loops (int): Number of event loops driving connections. Defaults to one per core.
+        compression_threshold (int): Packets of at least this many bytes are zlib compressed once logged in. Negative disables compression.
+        compression_level (int): zlib level from 0 to 9, trading CPU for bandwidth.
+        frame_workers (int): Number of threads compressing large outbound packets, shared by every connection. Defaults to one per core.
+        key_pair (ServerKeyPair): RSA keypair for every login. A new one is generated once here when not given.
+        authenticator (SessionAuthenticator): Session server client for online mode logins, closed with the listener.
+        tcp_nodelay (bool): Disables Nagle's algorithm on accepted sockets.
+            Connections already coalesce their writes into one flush per loop iteration, so Nagle would only hold the last partial segment back for a delayed ACK.
+        high_water_mark (int): A connection with more outbound bytes queued than this stops being writable.
+            Droppable packets to it are dropped, and senders such as chunk streaming should wait on Connection.when_writable().
+        low_water_mark (int): A connection that stopped being writable is writable again once its queue drains below this.
+        max_queued_bytes (int): A connection queueing more than this is disconnected right away, bounding memory per player.
+        slow_client_timeout (float): Seconds a connection may stay above the high water mark before it is disconnected.
+        handler_workers (int): Threads running login, authentication and plugin message handlers, shared by every connection.
+        max_queued_handlers (int): Handlers that may wait for those threads at once. Logins beyond it are turned away as the server being busy.
+        game_queue (GameQueue): Queue the game loop drains every tick, receiving play state packets.
+            A GameTicker drains it 20 times a second when not given.
+        fast_status (bool): Answers server list pings with a StatusResponder from a cached response, only logins get a full Connection.
+        favicon (bytes): PNG image of 64x64 pixels the server list shows, see networking.status.read_favicon().
+        admission (AdmissionController): Limits on sockets handshaking, on logins per IP and on the login rate.
+            Logins are only told apart from server list pings on the fast status path, without it only the pending limit applies.
+        online_mode (bool): Verifies players with the session server over an encrypted connection.
+            Offline, players log in right away under the UUID their name derives, as on the Notchian server.
+        forwarding_secret (bytes): Secret shared with a Velocity proxy using modern forwarding. Players then get the UUID,
+            properties and address the proxy authenticated, and only connections through the proxy can log in.
+            Every socket comes from the proxy then, so logins are throttled per IP on the forwarded address, once its signature checks out.
+        '''
+        if not 0 <= low_water_mark <= high_water_mark <= max_queued_bytes:
+            raise ValueError('Water marks must satisfy 0 <= low_water_mark <= high_water_mark <= max_queued_bytes')
+        self.key_pair = key_pair or ServerKeyPair()
+        self.authenticator = authenticator or SessionAuthenticator()
+        self.online_mode = online_mode
+        self.forwarding_secret = forwarding_secret
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+        self.tcp_nodelay = tcp_nodelay
+        self.high_water_mark = high_water_mark
+        self.low_water_mark = low_water_mark
+        self.max_queued_bytes = max_queued_bytes
+        self.slow_client_timeout = slow_client_timeout
+        self.connections = ConnectionRegistry()
+        self.status = ServerStatus(online_players=lambda: self.connections.player_count, favicon=favicon)
+        self.fast_status = fast_status
+        # Server list pings in flight, closed with the listener
+        self._responders = weakref.WeakSet()
+        self.admission = admission or AdmissionController()
+        self._admission_timer: TimerHandle = None
+        # ClusterChannel of this process when it is a worker of a cluster
+        self.cluster = None
+        self.loop_group = EventLoopGroup(event_loops)
+        self.frame_pool = ThreadPoolExecutor(max_workers=frame_workers or os.cpu_count() or 1, thread_name_prefix='FrameWorker')
+        self.handler_pool = HandlerPool(handler_workers, max_queued_handlers)
+        self.game_queue = game_queue or GameQueue()
+        self._game_ticker = GameTicker(self.game_queue) if game_queue is None else None
+        self.acceptor_loop: EventLoop = self.loop_group.loops[0]
+        self.server = None
+        self._started = False
 
-    def listen_connection(self):
-        logger.info('Listening for connections...')
-        while not self.server_stop_event.is_set():
+    def _on_acceptable(self, mask: int):
+        '''
+        Runs on the acceptor loop whenever the server socket is readable.
+        '''
+        while True:
             try:
                 client, addr = self.server.accept()
-            except socket.timeout:
+            except (BlockingIOError, InterruptedError):
+                return
+            if not self.admission.accept():
+                client.close()
+                continue
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.tcp_nodelay))
+            loop = self.loop_group.next_loop()
+            if self.fast_status:
+                responder = StatusResponder(self.status, client, addr, loop, self._handover,
+                                            (Connection.READ_TIMEOUTS[ConnectionState.HANDSHAKE], Connection.READ_TIMEOUTS[ConnectionState.STATUS]),
+                                            self.admission.release)
+                self._responders.add(responder)
+                responder.start()
                 continue
-            con = Connection(client, addr, self)
-            con.start()
-            with self.connection_list_lock:
-                self.connections.append(con)
+            self._start_connection(client, addr, loop)
 
-        logger.info('Connection listener is shutting down...')
-        with self.connection_list_lock:
-            active_connections = list(self.connections)
-        for connection in active_connections:
-            connection: Connection = connection
-            connection.interrupt()
-        for connection in active_connections:
-            connection.join()
-        
-        self.server.close()
-        logger.info('Terminating listener')
+    def _handover(self, client: socket.socket, addr, loop: EventLoop, received: bytes, next_state: int):
+        '''
+        Runs on the loop of a StatusResponder handing a socket over.
+        Logins are throttled per IP and wait in the admission queue for their turn, anything else gets its Connection right away.
+        Behind a proxy, the per IP throttle waits for the forwarded address instead, see SLoginPluginResponse.
+        '''
+        # Login, or transfer which logs in as well
+        if next_state not in (2, 3):
+            self._start_connection(client, addr, loop, received)
+            return
+        if not self.forwarding_secret and not self.admission.allow_login(addr[0]):
+            logger.info(f'Throttling logins from {addr[0]}', log_thread=False)
+            self._refuse(client, self._THROTTLED)
+            return
+        if not self.admission.queue_login((client, addr, loop, received)):
+            logger.info(f'Turning {addr[0]} away: login queue is full', log_thread=False)
+            self._refuse(client, self._BUSY)
+            return
+        self.acceptor_loop.call_soon(self._on_admit)
+
+    def _on_admit(self):
+        '''
+        Starts the logins whose turn came, on the acceptor loop, and comes back once the next one's turn comes.
+        '''
+        timeout = Connection.READ_TIMEOUTS[ConnectionState.LOGIN]
+        now = time.monotonic()
+        for queued_at, (client, addr, loop, received) in self.admission.admit():
+            if now - queued_at > timeout:
+                # The client gave up waiting by now
+                self._refuse(client, self._BUSY)
+                continue
+            self._start_connection(client, addr, loop, received)
+        wait = self.admission.next_admission()
+        if wait is not None and self._admission_timer is None:
+            self._admission_timer = self.acceptor_loop.call_later(wait, self._on_admission_timer)
+
+    def _on_admission_timer(self):
+        self._admission_timer = None
+        self._on_admit()
+
+    def _start_connection(self, client: socket.socket, addr, loop: EventLoop, received: bytes = b''):
+        '''
+        Sets up the full Connection of an accepted socket, along with the bytes a StatusResponder already read from it.
+        The Connection gives the socket's admission slot back once logged in or closed.
+        '''
+        con = Connection(client, addr, self, admitted=True)
+        # Registered first, so closing right away finds it
+        self.connections.add(con)
+        con.start(loop, received)
+
+    _THROTTLED = b''.join(packet.SharedFrame(c_login.CDisconnect('Connection throttled! Please wait before reconnecting.')).frame())
+    _BUSY = b''.join(packet.SharedFrame(c_login.CDisconnect('Server is busy, try again later')).frame())
+
+    def _refuse(self, client: socket.socket, disconnect: bytes):
+        '''
+        Sends a Disconnect serialized once for all refusals, which always fits an empty socket buffer, and closes the socket.
+        '''
+        try:
+            client.setblocking(False)
+            client.send(disconnect)
+        except OSError:
+            pass
+        client.close()
+        self.admission.release()
 
-    def start_server(self, address='0.0.0.0', port=25565, max_players=20):
+    def broadcast(self, clientbound_packet: packet.ClientboundPacket, predicate: Callable[['Connection'], bool] = None,
+                  recipients: Iterable['Connection'] = None, state: ConnectionState = ConnectionState.PLAY, droppable: bool = False) -> int:
+        '''
+        Sends one packet to many connections, serializing and compressing it once for all of them.
+        Each recipient only encrypts the shared frame into its own output arena, on its own event loop.
+        Never blocks, returns the number of recipients the packet was queued for.
+
+        Parameters:
+        clientbound_packet (ClientboundPacket | SharedFrame): Must not depend on the receiving connection.
+        predicate (Callable): Recipients are only those for which this returns true.
+        recipients (Iterable): Connections to consider, such as the players within view of an entity. Defaults to every connection.
+        state (ConnectionState): Recipients must be in this state, None for any.
+        droppable (bool): Skips recipients that are not writable, see Connection.send().
+        '''
+        shared = clientbound_packet if isinstance(clientbound_packet, packet.SharedFrame) else packet.SharedFrame(clientbound_packet, self.compression_level)
+        if recipients is None:
+            recipients = self.connections.snapshot()
+        queued = 0
+        # One wakeup per event loop instead of one per recipient
+        wakeups = {}
+        for connection in recipients:
+            if connection.loop is None or (state is not None and connection.packet_state.state != state):
+                continue
+            if connection.connection_stop_event.is_set():
+                continue
+            if (droppable and not connection.writable) or (predicate and not predicate(connection)):
+                continue
+            if connection._enqueue_shared(shared.frame(connection.packet_state.compress_threshold), shared.priority):
+                wakeups.setdefault(connection.loop, []).append(connection)
+            queued += 1
+        for loop, connections in wakeups.items():
+            loop.call_soon(Connection._on_outbounds, connections)
+        return queued
+
+    def start_server(self, address='0.0.0.0', port=25565, max_players=20, backlog: int = socket.SOMAXCONN, reuse_port: bool = False):
+        '''
+        Parameters:
+        backlog (int): Connections the kernel queues before they are accepted, capped by net.core.somaxconn.
+        reuse_port (bool): Lets several processes bind the same port with SO_REUSEPORT, the kernel spreads new connections between them.
+        '''
         logger.info('Starting server...')
+        self.status.max_players = max_players
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.server.bind((address, port))
-        self.server.listen(1)
-        self.server.settimeout(1.0)
-        self.server_thread = threading.Thread(target=self.listen_connection, name='ConnectionListener')
-        self.server_thread.start()
+        self.server.listen(backlog)
+        self.server.setblocking(False)
+        self.loop_group.start()
+        if self._game_ticker:
+            self._game_ticker.start()
+        self.acceptor_loop.call_soon(self.acceptor_loop.register, self.server, selectors.EVENT_READ, self._on_acceptable)
+        self._started = True
+        logger.info('Listening for connections...')
         logger.info('Server started!')
-    
+
     def stop_server(self):
-        if not self.server_thread:
+        if not self._started:
             logger.warning(f'Connection listener not started.')
             return
-        self.server_stop_event.set()
-        self.server_thread.join()
+        logger.info('Connection listener is shutting down...')
+        self.acceptor_loop.call_soon(self.acceptor_loop.unregister, self.server)
+        active_connections = self.connections.snapshot()
+        for connection in active_connections:
+            connection: Connection = connection
+            connection.interrupt()
+        for connection in active_connections:
+            connection.join()
+        self.frame_pool.shutdown(wait=True, cancel_futures=True)
+        self.handler_pool.shutdown()
+        if self._game_ticker:
+            self._game_ticker.stop()
+        self.authenticator.close()
+        self.loop_group.stop()
+        self.loop_group.join()
+        for responder in list(self._responders):
+            responder.close()
+        for client, _, _, _ in self.admission.drain():
+            client.close()
+            self.admission.release()
+        self.server.close()
+        logger.info('Terminating listener')
 
 class Connection:
     ###
     # Client connection representation
     # Lifecycle:
-    # Call start() to start the connection
+    # Call start() with an event loop to attach the connection to the loop
     # When the connection is no longer needed, call interrupt() to stop the connection
     # Call join() to wait for the connection to gracefully terminate
+    #
+    # Every method prefixed with _on runs on the event loop thread and must never block.
     ###
 
-    def __init__(self, client: socket.socket, address, listener: ConnectionListener):
+    READ_TIMEOUTS = {
+        ConnectionState.HANDSHAKE: 10.0,
+        ConnectionState.STATUS: 15.0,
+        ConnectionState.LOGIN: 30.0,
+        ConnectionState.CONFIGURATION: 30.0,
+        ConnectionState.PLAY: 30.0,
+    }
+    '''
+    Seconds a connection may stay without completing a packet, per connection state.
+    '''
+    KEEP_ALIVE_INTERVAL = 15.0
+    KEEP_ALIVE_TIMEOUT = 30.0
+    '''
+    In configuration and play state a Keep Alive is sent every KEEP_ALIVE_INTERVAL seconds once the previous one was answered,
+    and a client not answering within KEEP_ALIVE_TIMEOUT seconds is disconnected. The round trip goes to packet_state.latency.
+    '''
+    SCHEDULE_AHEAD = 65536
+    '''
+    Bytes of scheduled packets released into the output arena ahead of the socket.
+    Enough to keep the link busy between two writable events, more only delays urgent packets.
+    '''
+
+    def __init__(self, client: socket.socket, address, listener: ConnectionListener, admitted: bool = False):
+        '''
+        Parameters:
+        admitted (bool): Holds an admission slot of the listener, given back once logged in or closed.
+        '''
         self.client = client
-        self.listener_thread = None
+        self.loop: EventLoop = None
         self.connection_stop_event = threading.Event()
-        self.connections_list = listener.connections
-        self.lock = listener.connection_list_lock
+        self.connection_closed_event = threading.Event()
+        self.registry = listener.connections
+        self.admission = listener.admission if admitted else None
+        self.frame_pool = listener.frame_pool
+        self.handler_pool = listener.handler_pool
+        self.game_queue = listener.game_queue
+
+        # Outbound backpressure
+        self.high_water_mark = listener.high_water_mark
+        self.low_water_mark = listener.low_water_mark
+        self.max_queued_bytes = listener.max_queued_bytes
+        self.slow_client_timeout = listener.slow_client_timeout
+        self._writable = True
+        self._writable_waiters: List[Future] = []
+        self._slow_client_timer: TimerHandle = None
 
         # Packet configuration
         self.packet_state = PacketConnectionState()
         self.packet_state.client_ip = address[0]
+        self.packet_state.network_compression_threshold = listener.compression_threshold
+        self.packet_state.compression_level = listener.compression_level
+        self.packet_state.key_pair = listener.key_pair
+        self.packet_state.authenticator = listener.authenticator
+        self.packet_state.online_mode = listener.online_mode
+        self.packet_state.forwarding_secret = listener.forwarding_secret
+        self.packet_state.admission = listener.admission
+        self.packet_state.server_status = listener.status
+
+        # i/o streams, created once the connection is attached to a loop
+        self.input_stream: MCPacketInputStream = None
+        self.output_stream: MCPacketOutputStream = None
+        self._interest = selectors.EVENT_READ
+        self._flush_scheduled = False
+        self._read_deadline = 0.0
+        self._read_timer: TimerHandle = None
+        self._keep_alive_timer: TimerHandle = None
+        # Id and time of the Keep Alive waiting for its answer
+        self._keep_alive_id = None
+        self._keep_alive_sent = 0.0
 
-        # For server initiated connections
-        self.bundle_lock = threading.Lock()
-        self.bundle = []
-        self.response_lock = threading.Condition()
-        self.response = None
+        # Configuration state bookkeeping
+        self._finish_configuration_sent = False
 
-    def start(self):
-        if self.listener_thread:
-            logger.warning('Listener already set')
-        self.packet_state.connection_id = len(self.connections_list)
-        self.listener_thread = threading.Thread(target=self._handle_connection, name=f'ConnectionListener-{len(self.connections_list)}')
-        self.listener_thread.start()   
-    
-    def send_packet(self, *clientbound_packets: packet.ClientboundPacket) -> packet.ServerboundPacket:
+        # Server initiated packets, queued from any thread as (packets, future, reply waiter) and written on the loop.
+        # Frames of a broadcast queue here too, as (None, frame, priority), so they keep their place among sends.
+        self._outbound_lock = threading.Lock()
+        self._outbound = deque()
+        # Play state packets waiting for room in the output arena, most urgent first
+        self._scheduler = PacketScheduler()
+        # Futures of packets in the output arena, resolved once it is flushed
+        self._unflushed = deque()
+        # Requests waiting for their reply, as [reply type, match, future, timer]
+        self._replies = []
+
+        # Response of a handler running on the handler pool or waiting on an external service, such as the session server.
+        # Reading pauses meanwhile, the handler may switch encryption on for the bytes that follow.
+        self._deferred: Future = None
+
+    def start(self, loop: EventLoop, received: bytes = b''):
+        '''
+        Parameters:
+        received (bytes): Bytes already read from the socket, handled before anything read after.
+        '''
+        if self.loop:
+            logger.warning('Event loop already set')
+            return
+        self.loop = loop
+        self.client.setblocking(False)
+        self.input_stream = MCPacketInputStream(self.client, self.packet_state)
+        if received:
+            self.input_stream.feed(received)
+        self.output_stream = MCPacketOutputStream(self.client, self.packet_state, self.frame_pool, self._frame_ready)
+        self.loop.call_soon(self._on_attach)
+
+    def send(self, *clientbound_packets: packet.ClientboundPacket, droppable: bool = False, priority: Priority = None) -> Future:
         '''
-        Queue packets to be sent to the client.
-        Packets given in this function are guaranteed to be sent in the order they are given as soon as next opportunity within network flow is available, and receives a response from the client.
+        Queues packets to be sent to the client. Thread safe and never blocks, so game logic may push any number of packets per tick.
+        Packets are written in the order they are queued, after everything queued earlier by any thread.
+        The future resolves to None once the packets have been handed to the socket, or fails with ConnectionClosedError,
+        also when the connection is not started yet.
+        Cancelling it before the loop writes the packets drops them. Ignore it to fire and forget.
+        Droppable packets, such as particles or entity movement superseded by the next tick, are dropped with a cancelled future while the connection is not writable.
+
+        In play state, packets wait in the connection's PacketScheduler until the socket has room, so they may be overtaken by more urgent packets sent later.
+        Packets of one call stay together, in order, with the most urgent priority among them unless priority is given.
 
         Packets can be sent as a bundle as long as it won't break the protocol.
         Generally, bundle packets are only acceptable in play state, where packets are surrounded by bundle delimiters (id = 0x00).
-        As of 1.20.6, the Notchian server only uses bundle delimiter to ensure Spawn Entity and associated packets used to configure the entity happen on the same tick. 
-        Each entity gets a separate bundle. 
+        As of 1.20.6, the Notchian server only uses bundle delimiter to ensure Spawn Entity and associated packets used to configure the entity happen on the same tick.
+        Each entity gets a separate bundle.
         The Notchian client doesn't allow more than 4096 packets in the same bundle.
         '''
-        with self.response_lock:
-            self.response = None
-        with self.bundle_lock:
-            self.bundle.extend(clientbound_packets)
-        with self.response_lock:
-            while not self.response:
-                self.response_lock.wait()
-        return self.response
+        future = Future()
+        if droppable and not self._writable:
+            future.cancel()
+            return future
+        future.priority = priority
+        self._enqueue(clientbound_packets, future, None)
+        return future
+
+    def request(self, clientbound_packet: packet.ClientboundPacket, reply: type, match: Callable[[packet.ServerboundPacket], bool] = None, timeout: float = None) -> Future:
+        '''
+        Sends a packet the client answers, such as Keep Alive, Ping or Cookie Request, and returns a future resolving to the reply.
+        Only packets of the reply type accepted by match answer the request, e.g. match=lambda reply: reply.keep_alive_id == keep_alive_id.
+        The reply is still handled as usual afterwards.
+        The future fails with TimeoutError after timeout seconds, or with ConnectionClosedError.
+        '''
+        future = Future()
+        self._enqueue((clientbound_packet,), None, [reply, match, future, timeout])
+        return future
+
+    @property
+    def queued_bytes(self) -> int:
+        '''
+        Outbound bytes the socket has not taken yet, including packets held back by the scheduler.
+        '''
+        return self.output_stream.queued_bytes + self._scheduler.queued_bytes if self.output_stream else 0
+
+    @property
+    def writable(self) -> bool:
+        '''
+        False from the moment the outbound queue exceeds the high water mark until it drains below the low water mark.
+        '''
+        return self._writable
+
+    def when_writable(self) -> Future:
+        '''
+        Returns a future resolving once the connection is writable, right away when it already is. Thread safe.
+        Bulk senders such as chunk streaming pause on it instead of queueing without bound.
+        Fails with ConnectionClosedError if the connection closes first, or was never started.
+        '''
+        future = Future()
+        if self.connection_stop_event.is_set() or self.loop is None:
+            future.set_exception(self._closed_error())
+        elif self._writable and not self._outbound:
+            future.set_result(None)
+        else:
+            # Packets still in the outbound queue count too, so ask the loop once it has written them
+            self.loop.call_soon(self._on_writable_waiter, future)
+        return future
+
+    def _on_writable_waiter(self, future: Future):
+        if not self.connection_stop_event.is_set():
+            self._update_backpressure()
+        if self.connection_stop_event.is_set():
+            future.set_exception(ConnectionClosedError('Connection is closed'))
+        elif self._writable:
+            future.set_result(None)
+        else:
+            self._writable_waiters.append(future)
+
+    def _update_backpressure(self) -> bool:
+        '''
+        Tracks the water marks after a flush. Returns False when the connection had to be dropped.
+        '''
+        queued = self.queued_bytes
+        if queued > self.max_queued_bytes:
+            logger.info(f'Disconnecting {self.packet_state.username or self.packet_state.client_ip}: {queued} bytes queued', log_thread=False)
+            self.interrupt()
+            return False
+        if self._writable and queued > self.high_water_mark:
+            self._writable = False
+            self._slow_client_timer = self.loop.call_timeout(self.slow_client_timeout, self._on_slow_client)
+        elif not self._writable and queued <= self.low_water_mark:
+            self._writable = True
+            self._slow_client_timer.cancel()
+            self._slow_client_timer = None
+            waiters, self._writable_waiters = self._writable_waiters, []
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+        return True
+
+    def _on_slow_client(self):
+        self._slow_client_timer = None
+        if self.connection_stop_event.is_set() or self._writable:
+            return
+        logger.info(f'Disconnecting {self.packet_state.username or self.packet_state.client_ip}: not reading for {self.slow_client_timeout}s', log_thread=False)
+        self.interrupt()
+
+    def _closed_error(self) -> ConnectionClosedError:
+        return ConnectionClosedError('Connection is not started' if self.loop is None else 'Connection is closed')
+
+    def _enqueue(self, clientbound_packets: tuple, future: Future, waiter: list):
+        if self.connection_stop_event.is_set() or self.loop is None:
+            (future or waiter[2]).set_exception(self._closed_error())
+            return
+        with self._outbound_lock:
+            self._outbound.append((clientbound_packets, future, waiter))
+            # A single wakeup covers everything queued until the loop takes the queue
+            wakeup = len(self._outbound) == 1
+        if wakeup:
+            self.loop.call_soon(self._on_outbound)
+
+    def _enqueue_shared(self, frame: list, priority: Priority) -> bool:
+        '''
+        Queues a frame of a broadcast behind everything sent earlier. Returns whether the loop has to be woken up for it.
+        '''
+        with self._outbound_lock:
+            self._outbound.append((None, frame, priority))
+            return len(self._outbound) == 1
 
     def _per_connection_configuration(self, input_stream, output_stream):
         '''
         Define sequence of packets to be sent to the client to configure the connection.
         Packets here are sent during configuration state, after receiving the client information packet (SConfig/0x00) and before finish configuration (CConfig/0x03).
         '''
-        pass     
+        pass
+
+    def _on_attach(self):
+        self.loop.register(self.client, self._interest, self._on_event)
+        self._extend_read_deadline()
+        self._update_keep_alive()
+        if self.input_stream.available():
+            try:
+                self._process_frames()
+                self._schedule_flush()
+            except OSError as e:
+                logger.debug(f'Connection lost: {e}')
+                self.interrupt()
+            except Exception:
+                logger.exception('Error while handling connection')
+                self.interrupt()
+
+    def _extend_read_deadline(self):
+        '''
+        Pushes the read deadline out by the timeout of the current state.
+        The timer is only rescheduled when the deadline moves earlier, which happens on state changes.
+        Otherwise the pending timer notices the extension when it fires.
+        '''
+        timeout = self.READ_TIMEOUTS.get(self.packet_state.state)
+        if timeout is None:
+            return
+        self._read_deadline = time.monotonic() + timeout
+        if self._read_timer and self._read_timer.when <= self._read_deadline:
+            return
+        if self._read_timer:
+            self._read_timer.cancel()
+        self._read_timer = self.loop.call_timeout(timeout, self._on_read_deadline)
 
-    def _handle_connection(self):
-        # i/o streams
-        input_stream = MCPacketInputStream(self.client, self.packet_state)
-        output_stream = MCPacketOutputStream(self.client, self.packet_state)
+    def _on_read_deadline(self):
+        self._read_timer = None
+        if self.connection_stop_event.is_set():
+            return
+        now = time.monotonic()
+        if now < self._read_deadline:
+            self._read_timer = self.loop.call_timeout(self._read_deadline - now, self._on_read_deadline)
+            return
+        logger.debug(f'Read timed out in {self.packet_state.state.name} state')
+        self.interrupt()
+
+    def _update_keep_alive(self):
+        '''
+        Starts sending Keep Alives once the connection reached configuration state.
+        '''
+        if self._keep_alive_timer is None and self.packet_state.state in (ConnectionState.CONFIGURATION, ConnectionState.PLAY):
+            self._keep_alive_timer = self.loop.call_timeout(self.KEEP_ALIVE_INTERVAL, self._on_keep_alive)
 
-        while not self.connection_stop_event.is_set():
-            if self.packet_state.state == ConnectionState.CLOSE:
+    def _on_keep_alive(self):
+        self._keep_alive_timer = None
+        if self.connection_stop_event.is_set():
+            return
+        now = time.monotonic()
+        if self._keep_alive_id is not None:
+            if now - self._keep_alive_sent >= self.KEEP_ALIVE_TIMEOUT:
+                logger.info(f'Disconnecting {self.packet_state.username or self.packet_state.client_ip}: no Keep Alive answered for {self.KEEP_ALIVE_TIMEOUT}s', log_thread=False)
                 self.interrupt()
-                continue
+                return
+            self._keep_alive_timer = self.loop.call_timeout(self._keep_alive_sent + self.KEEP_ALIVE_TIMEOUT - now, self._on_keep_alive)
+            return
+        # The Notchian server uses the time in milliseconds as the id
+        self._keep_alive_id = int(time.time() * 1000)
+        self._keep_alive_sent = now
+        keep_alive = c_play.CKeepAlive if self.packet_state.state == ConnectionState.PLAY else c_config.CKeepAlive
+        self.send(keep_alive(self._keep_alive_id))
+        self._keep_alive_timer = self.loop.call_timeout(self.KEEP_ALIVE_INTERVAL, self._on_keep_alive)
 
-            if input_stream.available() == 0:
-                ### Server initiated connection ###
-
-                # Per-connection initial configuration
-                if self.packet_state.state == ConnectionState.CONFIGURATION:
-                    with self.packet_state.client_information_lock:
-                        if self.packet_state.client_information_config_ready and not self.packet_state.client_information_initial_config_flag:
-                            self._per_connection_configuration(input_stream, output_stream)
-                            output_stream.write_packet(c_config.CFinishConfiguration())
-                            output_stream.flush()
-                            logger.debug(f'Sent Finish Configuration packet')
-                            config_acknowledgement = input_stream.read_packet(self.packet_state)
-                            if not isinstance(config_acknowledgement, s_config.SFinishConfigurationAcknowledged):
-                                logger.error(f'Invalid packet received: {config_acknowledgement.__class__.__name__}')
-                                self.interrupt()
-                                continue
-                            config_acknowledgement.handle(self.packet_state)
-                            self.packet_state.client_information_initial_config_flag = True
-                            logger.debug('Initial configuration completed')
-                            continue
-
-                # Flush packets in queue
-                with self.bundle_lock:
-                    if self.bundle:
-                        for packets in self.bundle:
-                            output_stream.write_packet(packets)
-                        output_stream.flush()
-                        self.bundle = []
-                        with self.response_lock:
-                            self.response = input_stream.read_packet(self.packet_state)
-                            self.response_lock.notify()
-                continue
+    def _on_keep_alive_answer(self, keep_alive_id: int):
+        '''
+        Answers to Keep Alives sent with Connection.request() are left to it.
+        '''
+        if keep_alive_id != self._keep_alive_id:
+            return
+        latency = (time.monotonic() - self._keep_alive_sent) * 1000
+        self._keep_alive_id = None
+        self.packet_state.latency = int((self.packet_state.latency * 3 + latency) / 4)
 
-            ### Client initiated connection ###
+    def _on_event(self, mask: int):
+        try:
+            if mask & selectors.EVENT_READ:
+                self._on_readable()
+            if mask & selectors.EVENT_WRITE and not self.connection_stop_event.is_set():
+                self._on_writable()
+        except OSError as e:
+            logger.debug(f'Connection lost: {e}')
+            self.interrupt()
+        except Exception:
+            logger.exception('Error while handling connection')
+            self.interrupt()
+
+    def _on_readable(self):
+        if not self.input_stream.fill():
+            logger.debug('Connection closed by client')
+            self.interrupt()
+            return
+        self._process_frames()
+        self._schedule_flush()
+
+    def _process_frames(self):
+        '''
+        Handles every complete frame buffered, unless a handler is still waiting on a deferred response.
+        '''
+        received = False
+        while self._deferred is None and self.input_stream.frame_available() and not self.connection_stop_event.is_set():
             logger.debug(f'Current connection state is: {self.packet_state.state.name}')
-            incoming_packet = input_stream.read_packet(self.packet_state)
+            incoming_packet = self.input_stream.read_packet(self.packet_state)
+            received = True
             logger.debug(f'Packet received: {incoming_packet.__class__.__name__}')
             if not incoming_packet:
                 continue
-            response_packet = incoming_packet.handle(self.packet_state)
-            if not response_packet:
+
+            ### Server initiated connection ###
+            if self._replies:
+                self._resolve_reply(incoming_packet)
+            if isinstance(incoming_packet, (s_config.SKeepAlive, s_play.SKeepAlive)):
+                self._on_keep_alive_answer(incoming_packet.keep_alive_id)
                 continue
-            output_stream.write_packet(response_packet)
-            output_stream.flush()
-            logger.debug(f'Packet sent: {response_packet.__class__.__name__}')
 
-        logger.debug('Connection is shutting down...')
-        input_stream.close()
-        self.close()
-    
+            if self._finish_configuration_sent and not self.packet_state.client_information_initial_config_flag:
+                if not isinstance(incoming_packet, s_config.SFinishConfigurationAcknowledged):
+                    logger.error(f'Invalid packet received: {incoming_packet.__class__.__name__}')
+                    self.interrupt()
+                    return
+                incoming_packet.handle(self.packet_state)
+                self.packet_state.client_information_initial_config_flag = True
+                logger.debug('Initial configuration completed')
+                continue
+
+            ### Client initiated connection ###
+            route = incoming_packet.route
+            if route is Route.GAME:
+                if not self.game_queue.put(self, incoming_packet):
+                    logger.info(f'Disconnecting {self.packet_state.username or self.packet_state.client_ip}: too many packets waiting for the game tick', log_thread=False)
+                    self.interrupt()
+                    return
+                continue
+            if route is Route.WORKER:
+                response_packet = self.handler_pool.submit(incoming_packet, self.packet_state)
+            else:
+                response_packet = incoming_packet.handle(self.packet_state)
+            if isinstance(response_packet, Future):
+                # Frames behind this one stay buffered until the response is sent
+                self._deferred = response_packet
+                self._update_interest()
+                response_packet.add_done_callback(self._deferred_done)
+                break
+            self._send_responses(response_packet)
+            self._configure()
+
+        if received:
+            self._extend_read_deadline()
+            self._update_keep_alive()
+
+    def _send_responses(self, response_packet):
+        if not response_packet:
+            return
+        if not isinstance(response_packet, tuple):
+            response_packet = (response_packet,)
+        for response in response_packet:
+            self.output_stream.write_packet(response)
+            logger.debug(f'Packet sent: {response.__class__.__name__}')
+            if isinstance(response, c_login.CLoginSuccess):
+                self._identify()
+
+    def _release_admission(self):
+        if self.admission:
+            self.admission.release()
+            self.admission = None
+
+    def _identify(self):
+        self._release_admission()
+        previous = self.registry.identify(self)
+        if previous:
+            logger.info(f'{self.packet_state.username} logged in again, closing the previous connection', log_thread=False)
+            previous.interrupt()
+
+    def _deferred_done(self, future: Future):
+        '''
+        Runs on whichever thread resolved the deferred response.
+        '''
+        if not self.connection_stop_event.is_set():
+            self.loop.call_soon(self._on_deferred_done, future)
+
+    def _on_deferred_done(self, future: Future):
+        self._deferred = None
+        if self.connection_stop_event.is_set():
+            return
+        try:
+            self._update_interest()
+            try:
+                self._send_responses(future.result())
+            except (AuthenticationError, ServerBusyError) as e:
+                if self.packet_state.state != ConnectionState.LOGIN:
+                    raise
+                if isinstance(e, AuthenticationError):
+                    logger.info(f'{self.packet_state.username} failed to authenticate: {e}', log_thread=False)
+                    self.output_stream.write_packet(c_login.CDisconnect('Failed to verify username!'))
+                elif isinstance(e, LoginThrottledError):
+                    logger.info(str(e), log_thread=False)
+                    self.output_stream.write_packet(c_login.CDisconnect('Connection throttled! Please wait before reconnecting.'))
+                else:
+                    logger.info(f'Turning {self.packet_state.client_ip} away: {e}', log_thread=False)
+                    self.output_stream.write_packet(c_login.CDisconnect('Server is busy, try again later'))
+                self.packet_state.state = ConnectionState.CLOSE
+                self._schedule_flush()
+                return
+            self._configure()
+            self._process_frames()
+            self._schedule_flush()
+        except OSError as e:
+            logger.debug(f'Connection lost: {e}')
+            self.interrupt()
+        except Exception:
+            logger.exception('Error while handling connection')
+            self.interrupt()
+
+    @staticmethod
+    def _on_outbounds(connections: list):
+        '''
+        Runs on the loop thread for the recipients of a broadcast belonging to this loop, whose outbound queues were empty.
+        '''
+        for connection in connections:
+            connection._on_outbound()
+
+    def _on_writable(self):
+        self._flush()
+
+    def _on_outbound(self):
+        with self._outbound_lock:
+            outbound, self._outbound = self._outbound, deque()
+        if self.connection_stop_event.is_set():
+            self._fail_pending(outbound)
+            return
+        for entry in outbound:
+            if entry[0] is None:
+                # Frame of a broadcast
+                _, frame, priority = entry
+                if self._scheduling():
+                    self._scheduler.push(priority, sum(map(len, frame)), (None, frame))
+                else:
+                    self.output_stream.write_frame(frame)
+                continue
+            clientbound_packets, future, waiter = entry
+            if waiter:
+                reply_future, timeout = waiter[2], waiter[3]
+                if reply_future.cancelled():
+                    continue
+                waiter[3] = self.loop.call_timeout(timeout, self._on_reply_timeout, waiter) if timeout is not None else None
+                self._replies.append(waiter)
+            elif not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self._scheduling():
+                    # Serialized now, packets may carry state the caller changes afterwards
+                    threshold = self.packet_state.compress_threshold
+                    bodies = [(clientbound_packet.packet_id, clientbound_packet.encode_body(self.packet_state), threshold) for clientbound_packet in clientbound_packets]
+                    priority = future.priority if future and future.priority is not None else min(clientbound_packet.priority for clientbound_packet in clientbound_packets)
+                    self._scheduler.push(priority, sum(len(body) for _, body, _ in bodies), (bodies, future))
+                    continue
+                for clientbound_packet in clientbound_packets:
+                    self.output_stream.write_packet(clientbound_packet)
+            except Exception as e:
+                logger.exception('Error while writing packets')
+                if future:
+                    future.set_exception(e)
+                continue
+            if future:
+                self._unflushed.append(future)
+        self._schedule_flush()
+
+    def _scheduling(self) -> bool:
+        '''
+        Play state packets go through the scheduler, as does anything queued behind them while it drains.
+        '''
+        return self.packet_state.state == ConnectionState.PLAY or len(self._scheduler) > 0
+
+    def _pump(self):
+        '''
+        Moves scheduled packets into the output arena until SCHEDULE_AHEAD bytes are waiting for the socket.
+        Keeping the arena short is what lets an urgent packet overtake bulk data, anything already in it goes out first.
+        '''
+        while self._scheduler and self.output_stream.queued_bytes < self.SCHEDULE_AHEAD:
+            bodies, future = self._scheduler.pop()
+            if bodies is None:
+                # Shared frame of a broadcast
+                self.output_stream.write_frame(future)
+                continue
+            try:
+                for packet_id, body, threshold in bodies:
+                    self.output_stream.write_body(packet_id, body, threshold)
+            except Exception as e:
+                logger.exception('Error while writing packets')
+                if future:
+                    future.set_exception(e)
+                continue
+            if future:
+                self._unflushed.append(future)
+
+    def _resolve_reply(self, incoming_packet: packet.ServerboundPacket):
+        '''
+        Hands the packet to the oldest request it answers.
+        '''
+        for waiter in self._replies:
+            reply, match, future, timer = waiter
+            if isinstance(incoming_packet, reply) and (match is None or match(incoming_packet)):
+                self._replies.remove(waiter)
+                if timer:
+                    timer.cancel()
+                if not future.done():
+                    future.set_result(incoming_packet)
+                return
+
+    def _on_reply_timeout(self, waiter: list):
+        if waiter in self._replies:
+            self._replies.remove(waiter)
+            if not waiter[2].done():
+                waiter[2].set_exception(TimeoutError(f'No {waiter[0].__name__} received in time'))
+
+    def _fail_pending(self, outbound=()):
+        error = ConnectionClosedError('Connection is closed')
+        futures = [future or waiter[2] for clientbound_packets, future, waiter in outbound if clientbound_packets is not None]
+        futures.extend(future for bodies, future in self._scheduler.clear() if bodies is not None and future)
+        futures.extend(self._unflushed)
+        futures.extend(waiter[2] for waiter in self._replies)
+        futures.extend(self._writable_waiters)
+        self._writable_waiters = []
+        if self._slow_client_timer:
+            self._slow_client_timer.cancel()
+        self._unflushed.clear()
+        for waiter in self._replies:
+            if waiter[3]:
+                waiter[3].cancel()
+        self._replies.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    def _configure(self):
+        '''
+        Per-connection initial configuration, kicked off once the client information arrives.
+        '''
+        if self.packet_state.state != ConnectionState.CONFIGURATION or self._finish_configuration_sent:
+            return
+        with self.packet_state.client_information_lock:
+            if not self.packet_state.client_information_config_ready or self.packet_state.client_information_initial_config_flag:
+                return
+        self._per_connection_configuration(self.input_stream, self.output_stream)
+        self.output_stream.write_packet(c_config.CFinishConfiguration())
+        self._finish_configuration_sent = True
+        logger.debug(f'Sent Finish Configuration packet')
+
+    def _frame_ready(self):
+        '''
+        Runs on a frame pool thread once offloaded packets are in the arena, or one of them failed.
+        '''
+        if not self.connection_stop_event.is_set():
+            self.loop.call_soon(self._on_frame_ready)
+
+    def _on_frame_ready(self):
+        if not self.connection_stop_event.is_set():
+            self._schedule_flush()
+
+    def _on_frame_error(self, error: Exception):
+        '''
+        A packet failed to be framed on the frame pool, the output stream sends nothing from there on.
+        Sends waiting to be flushed fail with the error, close() fails the rest.
+        '''
+        logger.error(f'Error while framing a packet: {error!r}')
+        while self._unflushed:
+            future = self._unflushed.popleft()
+            if not future.done():
+                future.set_exception(error)
+        self.interrupt()
+
+    def _schedule_flush(self):
+        '''
+        Flushes once at the end of the loop iteration, so everything written by this iteration's events and callbacks goes out in one go.
+        '''
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_at_iteration_end(self._on_scheduled_flush)
+
+    def _on_scheduled_flush(self):
+        self._flush_scheduled = False
+        if self.connection_stop_event.is_set():
+            return
+        try:
+            self._flush()
+        except OSError as e:
+            logger.debug(f'Connection lost: {e}')
+            self.interrupt()
+
+    def _flush(self):
+        if self.output_stream.error:
+            self._on_frame_error(self.output_stream.error)
+            return
+        # Bytes still being compressed don't need write interest, _frame_ready() brings us back here
+        self._pump()
+        drained = self.output_stream.flush()
+        while drained and self._scheduler and not self.output_stream.pending:
+            self._pump()
+            drained = self.output_stream.flush()
+        if not self._update_backpressure():
+            return
+        if drained and self._unflushed and not self.output_stream.pending:
+            while self._unflushed:
+                future = self._unflushed.popleft()
+                if not future.done():
+                    future.set_result(None)
+        if drained and self.packet_state.state == ConnectionState.CLOSE and not self.output_stream.pending:
+            self.interrupt()
+            return
+        self._update_interest(not drained)
+
+    def _update_interest(self, writing: bool = None):
+        '''
+        Reads while no handler is deferred, writes while the socket has not taken everything. Unchanged writing when None.
+        '''
+        if writing is None:
+            writing = bool(self._interest & selectors.EVENT_WRITE)
+        interest = (0 if self._deferred else selectors.EVENT_READ) | (selectors.EVENT_WRITE if writing else 0)
+        if interest == self._interest:
+            return
+        # Selectors reject an empty event mask
+        if not interest:
+            self.loop.unregister(self.client)
+        elif not self._interest:
+            self.loop.register(self.client, interest, self._on_event)
+        else:
+            self.loop.modify(self.client, interest, self._on_event)
+        self._interest = interest
 
     def interrupt(self):
+        if self.connection_stop_event.is_set():
+            return
         self.connection_stop_event.set()
+        if self.loop:
+            self.loop.call_soon(self.close)
+        else:
+            self.close()
 
     def join(self):
-        self.listener_thread.join()
+        self.connection_closed_event.wait()
 
     def close(self):
-        with self.lock:
-            self.connections_list.remove(self)
+        logger.debug('Connection is shutting down...')
+        self.registry.remove(self)
+        self._release_admission()
+        if self._read_timer:
+            self._read_timer.cancel()
+        if self._keep_alive_timer:
+            self._keep_alive_timer.cancel()
+        with self._outbound_lock:
+            outbound, self._outbound = self._outbound, deque()
+        self._fail_pending(outbound)
+        if self.loop:
+            self.loop.unregister(self.client)
+        if self.input_stream:
+            self.input_stream.close()
         self.client.close()
+        self.connection_closed_event.set()
 
     def get_connection(self):
         return self.client
-        
+
@@ -0,0 +1,122 @@
+'''
+Every open connection of a listener, indexed for constant time lookups by id, UUID, username and IP.
+'''
+import itertools
+import threading
+import uuid
+
+
+class ConnectionRegistry:
+    '''
+    Thread safe. Writes take a lock, reads never do.
+
+    Ids are handed out in increasing order and never reused, so an id kept around can't point to a newer connection.
+    UUID and username are indexed once the player logged in, see identify(). Usernames are matched case insensitively, as the client does.
+    Iterating walks an immutable snapshot, rebuilt only after connections come or go,
+    so broadcasts and ticks see a consistent set without holding up logins and disconnects.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._by_id = {}
+        self._by_uuid = {}
+        self._by_username = {}
+        # Insertion ordered dicts used as sets
+        self._by_ip = {}
+        self._snapshot = ()
+
+    def add(self, connection) -> int:
+        '''
+        Registers a connection that was just accepted, and returns the id it was given.
+        '''
+        p_state = connection.packet_state
+        with self._lock:
+            connection_id = next(self._ids)
+            p_state.connection_id = connection_id
+            self._by_id[connection_id] = connection
+            self._by_ip.setdefault(p_state.client_ip, {})[connection] = None
+            self._snapshot = None
+        return connection_id
+
+    def identify(self, connection):
+        '''
+        Indexes the connection by the UUID and username it logged in with.
+        Returns the connection previously logged in with the same UUID, which the caller should disconnect, or None.
+        '''
+        p_state = connection.packet_state
+        with self._lock:
+            if self._by_id.get(p_state.connection_id) is not connection:
+                # Already closed
+                return None
+            previous = self._by_uuid.get(p_state.uuid)
+            if previous is not None and previous is not connection:
+                self._unindex(previous)
+            self._by_uuid[p_state.uuid] = connection
+            self._by_username[p_state.username.lower()] = connection
+        return previous if previous is not connection else None
+
+    def remove(self, connection):
+        '''
+        Forgets the connection. Does nothing when it is not registered.
+        '''
+        with self._lock:
+            if self._by_id.get(connection.packet_state.connection_id) is not connection:
+                return
+            del self._by_id[connection.packet_state.connection_id]
+            same_ip = self._by_ip[connection.packet_state.client_ip]
+            del same_ip[connection]
+            if not same_ip:
+                del self._by_ip[connection.packet_state.client_ip]
+            self._unindex(connection)
+            self._snapshot = None
+
+    def _unindex(self, connection):
+        p_state = connection.packet_state
+        if self._by_uuid.get(p_state.uuid) is connection:
+            del self._by_uuid[p_state.uuid]
+        if p_state.username and self._by_username.get(p_state.username.lower()) is connection:
+            del self._by_username[p_state.username.lower()]
+
+    def get(self, connection_id: int):
+        return self._by_id.get(connection_id)
+
+    def by_uuid(self, player_uuid: uuid.UUID):
+        return self._by_uuid.get(player_uuid)
+
+    def by_username(self, username: str):
+        return self._by_username.get(username.lower())
+
+    def by_ip(self, ip: str) -> tuple:
+        return tuple(self._by_ip.get(ip, ()))
+
+    def count_ip(self, ip: str) -> int:
+        return len(self._by_ip.get(ip, ()))
+
+    @property
+    def player_count(self) -> int:
+        '''
+        Connections that logged in.
+        '''
+        return len(self._by_uuid)
+
+    def snapshot(self) -> tuple:
+        '''
+        Every registered connection, in the order they were added.
+        '''
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._snapshot = tuple(self._by_id.values())
+        return snapshot
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, connection) -> bool:
+        return self._by_id.get(connection.packet_state.connection_id) is connection
@@ -2,40 +2,123 @@ import struct
 import uuid
 import math
 
+from networking.varint import decode_varint, decode_varlong, decode_varints, encode_varint, encode_varlong, encode_varints
+
+class _Codecs:
+    '''
+    Precompiled struct codecs for one byte order.
+    '''
+    def __init__(self, notation: str):
+        self.notation = notation
+        self.int8 = struct.Struct(f'{notation}b')
+        self.uint8 = struct.Struct(f'{notation}B')
+        self.int16 = struct.Struct(f'{notation}h')
+        self.uint16 = struct.Struct(f'{notation}H')
+        self.int32 = struct.Struct(f'{notation}i')
+        self.int64 = struct.Struct(f'{notation}q')
+        self.float = struct.Struct(f'{notation}f')
+        self.double = struct.Struct(f'{notation}d')
+        self.structs = {}
+
+    def compile(self, fmt: str) -> struct.Struct:
+        '''
+        Cached struct for a read_many() or write_fields() format, in this byte order unless fmt starts with one.
+        Formats stay cached for good, so they must be fixed in code, never sized by the peer.
+        '''
+        codec = self.structs.get(fmt)
+        if codec is None:
+            codec = self.structs[fmt] = struct.Struct(fmt if fmt[0] in '<>!=@' else self.notation + fmt)
+        return codec
+
+_CODECS = {'big': _Codecs('>'), 'little': _Codecs('<')}
+
 class ByteBuffer:
+    '''
+    Growable byte buffer with a separate read index (position) and write index (buffer_size).
+    Writes append in place into preallocated capacity, reads slice from the read index.
+    Byte order only affects how primitives are packed, bytes are always kept in the order they are written.
+    '''
 
-    def __init__(self, byte_order='big'):
+    def __init__(self, byte_order='big', capacity=64):
         """
         Parameters:
         byte_order (str): The byte order of the buffer. Can be either 'little' or 'big'. Defaults to 'big'.
+        capacity (int): Initial capacity in bytes. The buffer grows as needed.
         """
-        self.buffer = bytearray()
+        self._data = bytearray(capacity)
+        self._write_index = 0
         self.position = 0
-        self.buffer_size = 0
         self.byte_order = byte_order
+        self._codecs = _CODECS['little' if byte_order == 'little' else 'big']
     
     def __str__(self):
         return f'ByteBuffer(position={self.position}, buffer_size={self.buffer_size}, byte_order={self.byte_order})'
     
     def _byte_order_notation(self):
         return '<' if self.byte_order == 'little' else '>'
-    
-    def _shift_position(self, shift: int, read: bool):
-        self.position += shift
-        if not read:
-            self.buffer_size += shift
+
+    @property
+    def buffer(self) -> memoryview:
+        '''
+        Zero-copy view of everything written so far.
+        '''
+        return memoryview(self._data)[:self._write_index]
+
+    @property
+    def buffer_size(self) -> int:
+        return self._write_index
+
+    def _reserve(self, size: int) -> int:
+        '''
+        Makes room for size more bytes and returns the write offset.
+        Growing always allocates a new array, so views handed out earlier stay valid.
+        '''
+        offset = self._write_index
+        end = offset + size
+        if end > len(self._data):
+            data = bytearray(max(len(self._data) * 2, end, 64))
+            data[:offset] = memoryview(self._data)[:offset]
+            self._data = data
+        return offset
+
+    def writable(self, size: int) -> memoryview:
+        '''
+        Free space of at least size bytes right after the written data, for writers such as recv_into() or cipher.update_into().
+        Call commit() with the number of bytes actually written to it.
+        '''
+        offset = self._reserve(size)
+        return memoryview(self._data)[offset:]
+
+    def commit(self, size: int):
+        self._write_index += size
+        self.position += size
+
+    def clear(self):
+        '''
+        Empties the buffer and keeps its capacity for reuse.
+        Unlike growth, this invalidates views handed out earlier, later writes go over the same memory.
+        Wrapped bytes and memoryviews are not the buffer's to write, it lets go of them and allocates on the next write instead.
+        '''
+        if not isinstance(self._data, bytearray):
+            self._data = bytearray()
+        self._write_index = 0
+        self.position = 0
 
     def wrap(self, data, auto_flip=False) -> 'ByteBuffer':
+        '''
+        bytes and memoryview are adopted without copying, bytearray and ByteBuffer contents are copied.
+        A wrapped view must outlive the buffer, writes after wrapping never touch the wrapped memory.
+        '''
         if isinstance(data, bytes):
-            self.buffer = bytearray(data)
+            self._data = data
+        elif isinstance(data, memoryview):
+            self._data = data.cast('B') if data.format != 'B' else data
         elif isinstance(data, bytearray):
-            self.buffer = data.copy()
+            self._data = data.copy()
         elif isinstance(data, ByteBuffer):
-            self.buffer = data.buffer.copy()
-            if self.byte_order != data.byte_order:
-                data.buffer.reverse()
-        self.buffer_size = len(self.buffer)
-        self.position = 0 if auto_flip else self.buffer_size - 1
+            self._data = bytearray(data.buffer)
+        self._write_index = len(self._data)
+        self.position = 0 if auto_flip else self._write_index - 1
         return self
 
     def flip(self):
@@ -45,29 +128,87 @@ class ByteBuffer:
         '''
         Write always appends data at the end of the buffer.
         '''
-        if self.byte_order == 'little':
-            self.buffer.reverse()
         if isinstance(data, int):
-            data = bytes([data])
-        self.buffer.extend(data)
-        if self.byte_order == 'little':
-            self.buffer.reverse()
-        self._shift_position(len(data), False)
+            offset = self._reserve(1)
+            self._data[offset] = data
+            self.commit(1)
+        else:
+            size = data.nbytes if isinstance(data, memoryview) else len(data)
+            offset = self._write_index
+            if offset + size > len(self._data):
+                self._reserve(size)
+            self._data[offset:offset + size] = data
+            self._write_index = offset + size
+            self.position += size
         if auto_flip:
             self.flip()
         return self
+
+    def write_struct(self, codec: struct.Struct, *values) -> 'ByteBuffer':
+        '''
+        Packs values with a precompiled struct straight into the buffer.
+        '''
+        offset = self._write_index
+        end = offset + codec.size
+        if end > len(self._data):
+            self._reserve(codec.size)
+        codec.pack_into(self._data, offset, *values)
+        self._write_index = end
+        self.position += codec.size
+        return self
+
+    def write_fields(self, fmt: str, *values) -> 'ByteBuffer':
+        '''
+        Packs several values in one call, for example write_fields('dddff?', x, y, z, yaw, pitch, on_ground).
+        The buffer byte order is used unless fmt starts with one.
+        '''
+        codec = self._codecs.structs.get(fmt) or self._codecs.compile(fmt)
+        offset = self._write_index
+        end = offset + codec.size
+        if end > len(self._data):
+            self._reserve(codec.size)
+        codec.pack_into(self._data, offset, *values)
+        self._write_index = end
+        self.position += codec.size
+        return self
     
     def read(self, size: int) -> bytes:
         """
         Read data is always immutable.
         """
-        if self.byte_order == 'little':
-            self.buffer.reverse()
-        data = self.buffer[self.position:self.position + size].copy()
-        if self.byte_order == 'little':
-            self.buffer.reverse()
-        self._shift_position(size, True)
+        data = bytes(self._data[self.position:min(self.position + size, self._write_index)])
+        self.position += size
         return data
+
+    def read_view(self, size: int) -> memoryview:
+        '''
+        Zero-copy variant of read().
+        The view aliases the buffer, copy it if it has to outlive the buffer or later writes.
+        '''
+        data = memoryview(self._data)[self.position:min(self.position + size, self._write_index)]
+        self.position += size
+        return data
+
+    def read_struct(self, codec: struct.Struct) -> tuple:
+        '''
+        Unpacks values with a precompiled struct straight from the buffer.
+
+        Raises:
+            struct.error: When fewer bytes than the struct needs are left
+        '''
+        position = self.position
+        end = position + codec.size
+        if end > self._write_index:
+            raise struct.error(f'unpack requires a buffer of {codec.size} bytes')
+        self.position = end
+        return codec.unpack_from(self._data, position)
+
+    def read_many(self, fmt: str) -> tuple:
+        '''
+        Unpacks several values in one call, for example x, y, z, yaw, pitch, on_ground = read_many('dddff?').
+        The buffer byte order is used unless fmt starts with one.
+        '''
+        return self.read_struct(self._codecs.structs.get(fmt) or self._codecs.compile(fmt))
     
     def pos(self):
         return self.position
@@ -81,58 +222,50 @@ class BufferedPacket(ByteBuffer):
     '''
 
     def read_bool(self):
-        return self.read(1)[0] != 0
+        return self.read_uint8() != 0
     
     def read_int8(self):
-        return struct.unpack(f'{self._byte_order_notation()}b', self.read(1))[0]
+        return self.read_struct(self._codecs.int8)[0]
     
     def read_uint8(self):
-        return struct.unpack(f'{self._byte_order_notation()}B', self.read(1))[0]
+        position = self.position
+        if position >= self._write_index:
+            raise struct.error('unpack requires a buffer of 1 bytes')
+        self.position = position + 1
+        return self._data[position]
     
     def read_int16(self):
-        return struct.unpack(f'{self._byte_order_notation()}h', self.read(2))[0]
+        return self.read_struct(self._codecs.int16)[0]
     
     def read_uint16(self):
-        return struct.unpack(f'{self._byte_order_notation()}H', self.read(2))[0]
+        return self.read_struct(self._codecs.uint16)[0]
     
     def read_int32(self):
-        return struct.unpack(f'{self._byte_order_notation()}i', self.read(4))[0]
+        return self.read_struct(self._codecs.int32)[0]
     
     def read_int64(self):
-        return struct.unpack(f'{self._byte_order_notation()}q', self.read(8))[0]
+        return self.read_struct(self._codecs.int64)[0]
     
     def read_float(self):
-        return struct.unpack(f'{self._byte_order_notation()}f', self.read(4))[0]
+        return self.read_struct(self._codecs.float)[0]
     
     def read_double(self):
-        return struct.unpack(f'{self._byte_order_notation()}d', self.read(8))[0]
+        return self.read_struct(self._codecs.double)[0]
     
     def read_varint(self):
-        result = 0
-        shift = 0
-        while True:
-            b = self.read_uint8()
-            result |= (b & 0x7F) << shift
-            if not b & 0x80:
-                break
-            shift += 7
-        # convert from unsigned to signed 32-bit value
-        if result & 0x80000000:
-            result -= 0x100000000
-        return result
+        value, self.position = decode_varint(self._data, self.position, self._write_index)
+        return value
     
     def read_varlong(self):
-        result = 0
-        shift = 0
-        while True:
-            b = self.read_uint8()
-            result |= (b & 0x7F) << shift
-            if not b & 0x80:
-                break
-            shift += 7
-        if result & 0x8000000000000000:
-            result -= 0x10000000000000000
-        return result
+        value, self.position = decode_varlong(self._data, self.position, self._write_index)
+        return value
+
+    def read_varints(self, n: int) -> list:
+        '''
+        Reads n VarInts written back to back, such as a palette or a list of entity ids.
+        '''
+        values, self.position = decode_varints(self._data, n, self.position, self._write_index)
+        return values
 
     def read_utf8_string(self, n: int) -> str:
         '''
@@ -150,10 +283,12 @@ class BufferedPacket(ByteBuffer):
         utf8_bytes = self.read(byte_length)
         string = utf8_bytes.decode('utf-8')
 
-        # Validate the number of UTF-16 code units in the decoded string
-        utf16_code_units = sum(1 + (ord(ch) > 0xFFFF) for ch in string)
-        if utf16_code_units > n:
-            raise ValueError(f"Decoded string exceeds maximum of {n} UTF-16 code units.")
+        # Validate the number of UTF-16 code units in the decoded string.
+        # A character never takes more UTF-16 code units than UTF-8 bytes, so counting is only needed past n bytes.
+        if byte_length > n:
+            utf16_code_units = byte_length if len(string) == byte_length else sum(1 + (ord(ch) > 0xFFFF) for ch in string)
+            if utf16_code_units > n:
+                raise ValueError(f"Decoded string exceeds maximum of {n} UTF-16 code units.")
 
         return string
     
@@ -168,9 +303,13 @@ class BufferedPacket(ByteBuffer):
         In Java, encoded array is created by BitSet.toLongArray()
         '''
         length = self.read_varint()
-        data = []
-        for _ in range(length):
-            data.append(self.read_int64())
+        # The length comes from the peer, an uncached struct keeps it from growing the codec cache
+        position = self.position
+        end = position + length * 8
+        if length < 0 or end > self._write_index:
+            raise struct.error(f'Bitset of {length} longs is truncated')
+        data = struct.unpack_from(f'{self._codecs.notation}{length}q', self._data, position)
+        self.position = end
         bitset = 0
         for i, item in enumerate(data):
             bitset |= item << (i * 64)
@@ -202,76 +341,68 @@ class BufferedPacket(ByteBuffer):
     def write_int8(self, value: int):
         if value < -128 or value > 127:
             raise ValueError('Byte value out of range')
-        self.write(struct.pack(f'{self._byte_order_notation()}b', value))
+        self.write_struct(self._codecs.int8, value)
     
     def write_uint8(self, value: int):
         if value < 0 or value > 255:
             raise ValueError('Unsigned byte value out of range')
-        self.write(struct.pack(f'{self._byte_order_notation()}B', value))
+        self.write_struct(self._codecs.uint8, value)
     
     def write_int16(self, value: int):
         if value < -32768 or value > 32767:
             raise ValueError('Short value out of range')
-        self.write(struct.pack(f'{self._byte_order_notation()}h', value))
+        self.write_struct(self._codecs.int16, value)
     
     def write_uint16(self, value: int):
         if value < 0 or value > 65535:
             raise ValueError('Unsigned short value out of range')
-        self.write(struct.pack(f'{self._byte_order_notation()}H', value))
+        self.write_struct(self._codecs.uint16, value)
     
     def write_int32(self, value: int):
         if value < -2147483648 or value > 2147483647:
             raise ValueError('Int value out of range')
-        self.write(struct.pack(f'{self._byte_order_notation()}i', value))
+        self.write_struct(self._codecs.int32, value)
     
     def write_int64(self, value: int):
         if value < -9223372036854775808 or value > 9223372036854775807:
             raise ValueError('Long value out of range')
-        self.write(struct.pack(f'{self._byte_order_notation()}q', value))
+        self.write_struct(self._codecs.int64, value)
     
     def write_float(self, value: float):
-        self.write(struct.pack(f'{self._byte_order_notation()}f', value))
+        self.write_struct(self._codecs.float, value)
     
     def write_double(self, value: float):
-        self.write(struct.pack(f'{self._byte_order_notation()}d', value))
+        self.write_struct(self._codecs.double, value)
     
     def write_varint(self, value: int):
-        if value < -2147483648 or value > 2147483647:
-            raise ValueError('Int value out of range')
-        unsigned = value & 0xFFFFFFFF
-        while True:
-            temp = unsigned & 0x7F
-            unsigned >>= 7
-            if unsigned != 0:
-                temp |= 0x80
-            self.write_uint8(temp)
-            if unsigned == 0:
-                break
+        data = encode_varint(value)
+        offset = self._write_index
+        size = len(data)
+        if offset + size > len(self._data):
+            self._reserve(size)
+        self._data[offset:offset + size] = data
+        self._write_index = offset + size
+        self.position += size
     
     def write_varlong(self, value: int):
-        if value < -9223372036854775808 or value > 9223372036854775807:
-            raise ValueError('Long value out of range')
-        unsigned = value & 0xFFFFFFFFFFFFFFFF
-        while True:
-            temp = unsigned & 0x7F
-            unsigned >>= 7
-            if unsigned != 0:
-                temp |= 0x80
-            self.write_uint8(temp)
-            if unsigned == 0:
-                break
+        self.write(encode_varlong(value))
+
+    def write_varints(self, values):
+        self.write(encode_varints(values))
 
     def write_utf8_string(self, string: str, n: int):
         if n > 32767:
             raise ValueError("Maximum length is 32767")
         
-        utf16_code_units = sum(1 + (ord(ch) > 0xFFFF) for ch in string)
-        if utf16_code_units > n:
-            raise ValueError(f"String exceeds maximum of {n} UTF-16 code units.")
-
         utf8_bytes = string.encode('utf-8')
         byte_length = len(utf8_bytes)
 
+        # A character never takes more UTF-16 code units than UTF-8 bytes, so counting is only needed past n bytes.
+        if byte_length > n:
+            utf16_code_units = byte_length if string.isascii() else sum(1 + (ord(ch) > 0xFFFF) for ch in string)
+            if utf16_code_units > n:
+                raise ValueError(f"String exceeds maximum of {n} UTF-16 code units.")
+
         if byte_length > n * 3:
             raise ValueError(f"Encoded UTF-8 string exceeds {n * 3} bytes.")
 
@@ -0,0 +1,387 @@
+import os
+import heapq
+import itertools
+import math
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from typing import Callable, List
+
+from core.logger import logger
+
+class TimerHandle:
+    '''
+    Timer scheduled with EventLoop.call_at() or EventLoop.call_later().
+    '''
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when: float, callback: Callable, args: tuple):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other: 'TimerHandle'):
+        return self.when < other.when
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class WheelTimer(TimerHandle):
+    '''
+    Timer scheduled on a TimingWheel. Cancelling removes it from its slot right away.
+    '''
+    __slots__ = ('_wheel', '_slot')
+
+    def __init__(self, when: float, callback: Callable, args: tuple, wheel: 'TimingWheel'):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self._wheel = wheel
+        self._slot: dict = None
+
+    def cancel(self):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self._wheel._remove(self)
+
+
+class TimingWheel:
+    '''
+    Holds the timeouts of every connection of an event loop: read deadlines, keep alives, reply and slow client timeouts.
+    Nearly all of them are cancelled or pushed back before they fire, so scheduling and cancelling are constant time here,
+    where a heap pays a logarithm on every push and keeps cancelled timers until they reach its top.
+
+    Levels of slots, each level resolution * slots ** level seconds per slot.
+    Timers go to the lowest level whose span reaches their tick, and move down a level each time the wheel below completes a turn,
+    so every timer is moved at most once per level. Timers are due within resolution seconds after their time, never before.
+    Not thread safe, an event loop only touches its wheel from its own thread.
+
+    Parameters:
+    resolution (float): Seconds per tick, the precision of every timer.
+    slots (int): Slots per level.
+    levels (int): Levels of slots. Timers further out than resolution * slots ** levels seconds wait in the top level.
+    now (float): Current time.monotonic(), the wheel starts ticking from there.
+    '''
+
+    def __init__(self, resolution: float = 0.1, slots: int = 64, levels: int = 4, now: float = 0.0):
+        self.resolution = resolution
+        self._slot_count = slots
+        self._levels: List[List[dict]] = [[{} for _ in range(slots)] for _ in range(levels)]
+        # Next tick to expire, every earlier one is done
+        self._tick = math.floor(now / resolution)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def schedule(self, when: float, callback: Callable, *args) -> WheelTimer:
+        timer = WheelTimer(when, callback, args, self)
+        self._insert(timer)
+        self._count += 1
+        return timer
+
+    def _insert(self, timer: WheelTimer):
+        slots = self._slot_count
+        tick = math.ceil(timer.when / self.resolution)
+        delta = tick - self._tick
+        if delta < slots:
+            # Most timers are due within the first level
+            slot = self._levels[0][max(tick, self._tick) % slots]
+        else:
+            level = 1
+            span = slots * slots
+            while delta >= span and level < len(self._levels) - 1:
+                level += 1
+                span *= slots
+            if delta >= span:
+                # Beyond the top level, parked in its furthest slot until it comes within reach
+                tick = self._tick + span - 1
+            slot = self._levels[level][(tick // (span // slots)) % slots]
+        slot[timer] = None
+        timer._slot = slot
+
+    def _remove(self, timer: WheelTimer):
+        if timer._slot is not None:
+            del timer._slot[timer]
+            timer._slot = None
+            self._count -= 1
+
+    def advance(self, now: float) -> List[WheelTimer]:
+        '''
+        Expires every tick up to now, and returns the timers due in order of their tick.
+        '''
+        target = math.floor(now / self.resolution)
+        if not self._count:
+            self._tick = max(self._tick, target + 1)
+            return []
+        slots = self._slot_count
+        due = []
+        while self._tick <= target and self._count:
+            tick = self._tick
+            if tick % slots == 0:
+                self._cascade(tick)
+            slot = self._levels[0][tick % slots]
+            if slot:
+                self._levels[0][tick % slots] = {}
+                for timer in slot:
+                    timer._slot = None
+                due.extend(slot)
+                self._count -= len(slot)
+            self._tick += 1
+        self._tick = max(self._tick, target + 1)
+        return due
+
+    def _cascade_slots(self, tick: int) -> List[tuple]:
+        '''
+        Level and index of the slot each upper level reaches at tick, from the top.
+        '''
+        slots = self._slot_count
+        levels = 1
+        span = slots
+        while levels < len(self._levels) and tick % span == 0:
+            levels += 1
+            span *= slots
+        return [(level, (tick // slots ** level) % slots) for level in range(levels - 1, 0, -1)]
+
+    def _cascade(self, tick: int):
+        '''
+        Moves the timers of the slot each upper level reached down.
+        '''
+        for level, index in self._cascade_slots(tick):
+            slot = self._levels[level][index]
+            if slot:
+                self._levels[level][index] = {}
+                for timer in slot:
+                    self._insert(timer)
+
+    def next_deadline(self) -> float:
+        '''
+        Time the wheel next has to advance, either for a due timer or to cascade the next level down. None when empty.
+        '''
+        if not self._count:
+            return None
+        slots = self._slot_count
+        level0 = self._levels[0]
+        tick = self._tick
+        # The cascade of a turn boundary runs on the advance reaching it, its timers may be due on that very turn
+        if tick % slots == 0 and any(self._levels[level][index] for level, index in self._cascade_slots(tick)):
+            return tick * self.resolution
+        end = tick - tick % slots + slots
+        while tick < end:
+            if level0[tick % slots]:
+                break
+            tick += 1
+        return tick * self.resolution
+
+
+class EventLoop:
+    '''
+    Selector based event loop.
+    A single thread drives accept, read, decode, handle and write for every socket registered to the loop.
+    Callbacks registered here run on the loop thread and must never block.
+    Other threads hand work over to the loop with call_soon().
+    '''
+    TIMEOUT_RESOLUTION = 0.1
+    '''
+    Seconds per tick of the timing wheel behind call_timeout().
+    '''
+
+    def __init__(self, name: str):
+        self.name = name
+        self._selector = selectors.DefaultSelector()
+        self._ready = deque()
+        self._ready_lock = threading.Lock()
+        self._timers: List[TimerHandle] = []
+        self._wheel = TimingWheel(self.TIMEOUT_RESOLUTION, now=time.monotonic())
+        self._end_of_iteration = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # Self-pipe used to wake select() up from other threads
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ, self._drain_wakeup)
+
+    def register(self, sock: socket.socket, events: int, callback: Callable[[int], None]):
+        '''
+        Callback is called on the loop thread with the ready event mask.
+        Must be called on the loop thread.
+        '''
+        self._selector.register(sock, events, callback)
+
+    def modify(self, sock: socket.socket, events: int, callback: Callable[[int], None]):
+        self._selector.modify(sock, events, callback)
+
+    def unregister(self, sock: socket.socket):
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def call_soon(self, callback: Callable, *args):
+        '''
+        Schedule callback to run on the loop thread. Thread safe.
+        '''
+        with self._ready_lock:
+            self._ready.append((callback, args))
+        self._wakeup()
+
+    def call_at(self, when: float, callback: Callable, *args) -> TimerHandle:
+        '''
+        Schedule callback to run on the loop thread once time.monotonic() reaches when. Thread safe.
+        '''
+        timer = TimerHandle(when, callback, args)
+        with self._ready_lock:
+            heapq.heappush(self._timers, timer)
+            earliest = self._timers[0] is timer
+        if earliest and not self.in_loop_thread():
+            self._wakeup()
+        return timer
+
+    def call_later(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def call_timeout(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        '''
+        Schedule callback to run on the loop thread after delay seconds, up to TIMEOUT_RESOLUTION late.
+        For timeouts kept per connection, which live in the loop's TimingWheel instead of the timer heap.
+        Must be called on the loop thread, as must cancel() on the returned timer.
+        '''
+        return self._wheel.schedule(time.monotonic() + delay, callback, *args)
+
+    def call_at_iteration_end(self, callback: Callable, *args):
+        '''
+        Schedule callback to run once the current iteration has dispatched its i/o events, timers and ready callbacks.
+        Work triggered by several of them, such as flushing a socket, then happens once per iteration.
+        Must be called on the loop thread.
+        '''
+        self._end_of_iteration.append((callback, args))
+
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def start(self):
+        if self._thread:
+            logger.warning(f'{self.name} already started')
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup()
+
+    def join(self):
+        if self._thread:
+            self._thread.join()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_writer.send(b'\x00')
+        except (BlockingIOError, OSError):
+            # Pipe is already full, so the loop is going to wake up anyway
+            pass
+
+    def _drain_wakeup(self, mask: int):
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_ready(self):
+        with self._ready_lock:
+            ready = self._ready
+            self._ready = deque()
+        for callback, args in ready:
+            try:
+                callback(*args)
+            except Exception:
+                logger.exception(f'Error in scheduled callback {callback}')
+
+    def _run_end_of_iteration(self):
+        callbacks, self._end_of_iteration = self._end_of_iteration, []
+        for callback, args in callbacks:
+            try:
+                callback(*args)
+            except Exception:
+                logger.exception(f'Error in end of iteration callback {callback}')
+
+    def _select_timeout(self):
+        with self._ready_lock:
+            while self._timers and self._timers[0].cancelled:
+                heapq.heappop(self._timers)
+            when = self._timers[0].when if self._timers else None
+        wheel = self._wheel.next_deadline()
+        if wheel is not None and (when is None or wheel < when):
+            when = wheel
+        if when is None:
+            return None
+        return max(0.0, when - time.monotonic())
+
+    def _run_timers(self):
+        now = time.monotonic()
+        due = []
+        with self._ready_lock:
+            while self._timers and self._timers[0].when <= now:
+                due.append(heapq.heappop(self._timers))
+        due.extend(self._wheel.advance(now))
+        for timer in due:
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                logger.exception(f'Error in timer callback {timer.callback}')
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            events = self._selector.select(timeout=self._select_timeout())
+            for key, mask in events:
+                try:
+                    key.data(mask)
+                except Exception:
+                    logger.exception(f'Error in i/o callback for {key.fileobj}')
+            self._run_timers()
+            self._run_ready()
+            self._run_end_of_iteration()
+        # Callbacks scheduled right before stop, such as connection teardown
+        self._run_ready()
+        self._run_end_of_iteration()
+        self._selector.close()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+
+
+class EventLoopGroup:
+    '''
+    Fixed set of event loops, one per core by default.
+    Connections are spread over the loops in round robin.
+    '''
+
+    def __init__(self, size: int = None):
+        size = size or os.cpu_count() or 1
+        self.loops: List[EventLoop] = [EventLoop(f'EventLoop-{i}') for i in range(size)]
+        self._round_robin = itertools.cycle(self.loops)
+
+    def next_loop(self) -> EventLoop:
+        return next(self._round_robin)
+
+    def start(self):
+        for loop in self.loops:
+            loop.start()
+
+    def stop(self):
+        for loop in self.loops:
+            loop.stop()
+
+    def join(self):
+        for loop in self.loops:
+            loop.join()
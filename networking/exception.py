@@ -9,4 +9,28 @@ class DataCorruptedError(Exception):
     '''
     Exception raised when the incoming packet buffer is likely corrupted which fails to digest into certain data types.
     '''
-    pass
\ No newline at end of file
+    pass
+
+class AuthenticationError(Exception):
+    '''
+    Exception raised when the session server does not confirm that the player joined, or cannot be reached.
+    '''
+    pass
+
+class ConnectionClosedError(Exception):
+    '''
+    Exception set on futures of packets or replies still pending when their connection closes.
+    '''
+    pass
+
+class ServerBusyError(Exception):
+    '''
+    Exception set on a handler's future when too many packet handlers are already queued.
+    '''
+    pass
+
+class LoginThrottledError(ServerBusyError):
+    '''
+    Exception raised when a player forwarded by the proxy logs in too often from their address.
+    '''
+    pass
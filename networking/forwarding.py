@@ -0,0 +1,58 @@
+'''
+Velocity modern forwarding, for servers behind a proxy that already authenticated the player.
+https://docs.papermc.io/velocity/player-information-forwarding
+
+The server asks for the player with a Login Plugin Request on the player info channel. The proxy answers with the player's
+address, UUID, username and profile properties, signed with HMAC-SHA256 under a secret shared with the server.
+The login then completes without encryption, RSA or a session server round trip.
+'''
+import hashlib
+import hmac
+import uuid
+
+from networking.data_type import BufferedPacket
+from networking.exception import AuthenticationError
+
+CHANNEL = 'velocity:player_info'
+MODERN_DEFAULT = 1
+'''
+Forwarding version requested, address, UUID, username and properties. Later versions only append player key data.
+'''
+SIGNATURE_SIZE = 32
+
+
+class ForwardedPlayer:
+    '''
+    properties (list): (name, value, signature) of each profile property, signature None when unsigned.
+    '''
+
+    def __init__(self, address: str, player_uuid: uuid.UUID, username: str, properties: list):
+        self.address = address
+        self.uuid = player_uuid
+        self.username = username
+        self.properties = properties
+
+
+def read_forwarded_player(secret: bytes, data: bytes) -> ForwardedPlayer:
+    '''
+    Verifies and decodes the data of the proxy's Login Plugin Response.
+
+    Raises:
+        AuthenticationError: When the signature does not match the secret or the version is not supported
+    '''
+    signature, signed = data[:SIGNATURE_SIZE], data[SIGNATURE_SIZE:]
+    if len(signature) < SIGNATURE_SIZE or not hmac.compare_digest(signature, hmac.new(secret, signed, hashlib.sha256).digest()):
+        raise AuthenticationError('Forwarded player info is not signed with the forwarding secret')
+    buffer = BufferedPacket().wrap(signed, auto_flip=True)
+    version = buffer.read_varint()
+    if version < MODERN_DEFAULT:
+        raise AuthenticationError(f'Unsupported forwarding version {version}')
+    address = buffer.read_utf8_string(255)
+    player_uuid = buffer.read_uuid()
+    username = buffer.read_utf8_string(16)
+    properties = []
+    for _ in range(buffer.read_varint()):
+        name = buffer.read_utf8_string(32767)
+        value = buffer.read_utf8_string(32767)
+        properties.append((name, value, buffer.read_utf8_string(32767) if buffer.read_bool() else None))
+    return ForwardedPlayer(address, player_uuid, username, properties)
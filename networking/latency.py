@@ -0,0 +1,36 @@
+'''
+Latency samples of the services a listener waits on, such as the handler pool, the game queue or the session server.
+'''
+import math
+import threading
+from collections import deque
+
+
+class LatencySamples:
+    '''
+    The most recent latencies of a service, thread safe.
+    '''
+    SAMPLES = 1024
+
+    def __init__(self, size: int = SAMPLES):
+        '''
+        Parameters:
+        size (int): Number of recent samples percentiles are computed over.
+        '''
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentiles(self, percentiles=(50, 90, 99)) -> dict:
+        '''
+        Samples at each percentile, empty when nothing was added yet.
+        '''
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {}
+        # Nearest rank
+        return {percentile: samples[max(0, math.ceil(percentile / 100 * len(samples)) - 1)] for percentile in percentiles}
@@ -1,5 +1,7 @@
 
 import hashlib
+import os
+import threading
 
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives import serialization, hashes
@@ -26,6 +28,62 @@ def encode_public_key_pem(public_key: rsa.RSAPublicKey) -> bytes:
     )
     return pem_bytes
 
+class ServerKeyPair:
+    '''
+    Server wide RSA keypair for the login handshake.
+    Like the notchian server, one keypair is generated (or loaded) at startup and shared by every login,
+    along with its DER encoding which goes out in every Encryption Request.
+
+    rotate() swaps in a fresh keypair, logins already sent the old public key keep the snapshot they were given.
+    '''
+    VERIFY_TOKEN_SIZE = 4
+
+    def __init__(self, private_key: rsa.RSAPrivateKey = None, key_size=1024):
+        self._key_size = key_size
+        self._lock = threading.Lock()
+        self._keys = self._make_keys(private_key or gen_rsa_key_pair(key_size)[0])
+
+    @staticmethod
+    def _make_keys(private_key: rsa.RSAPrivateKey) -> tuple:
+        public_key = private_key.public_key()
+        return private_key, public_key, encode_public_key_der(public_key)
+
+    @classmethod
+    def load(cls, path: str) -> 'ServerKeyPair':
+        '''
+        Loads an unencrypted PEM private key, as written by save().
+        '''
+        with open(path, 'rb') as f:
+            private_key = serialization.load_pem_private_key(f.read(), password=None)
+        return cls(private_key, private_key.key_size)
+
+    def save(self, path: str):
+        private_key = self.snapshot()[0]
+        with open(path, 'wb') as f:
+            f.write(private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            ))
+
+    def snapshot(self) -> tuple:
+        '''
+        Returns (private_key, public_key, public_der) of the current keypair, consistent with each other.
+        '''
+        with self._lock:
+            return self._keys
+
+    def rotate(self):
+        keys = self._make_keys(gen_rsa_key_pair(self._key_size)[0])
+        with self._lock:
+            self._keys = keys
+
+    def verify_token(self) -> bytes:
+        '''
+        Fresh random verify token for one login.
+        '''
+        return os.urandom(self.VERIFY_TOKEN_SIZE)
+
 def gen_ciphers(shared_secret):
     encrypt_cipher = Cipher(
         algorithms.AES(shared_secret), modes.CFB8(shared_secret), backend=default_backend()
@@ -3,14 +3,49 @@ import zlib
 from abc import ABC, abstractmethod
 
 from networking.data_type import BufferedPacket
+from networking.varint import encode_varint
 from networking.packet.packet_connection import PacketConnectionState
+from networking.packet import registry, schema
+from networking.packet.dispatch import Route
+from networking.packet.scheduler import Priority
+from networking.protocol import ConnectionState
 
 '''
 All packets including both serverbound and clientbound must have packet_id property.
 All packets including both serverbound and clientbound must have packet_body method.
 Server packets that require response back to client must have handle method.
+handle() may return a single packet, or a tuple of packets sent in order.
+handle() may also return a Future resolving to either, when the response depends on a slow external service.
+Packets made of plain fields may declare them as a fields list instead of writing packet_body() and decode(), see schema.
 '''
 
+def frame_body(packet_id: int, body, compression_threshold=-1, compression_level=zlib.Z_DEFAULT_COMPRESSION) -> list:
+    '''
+    Frames an already serialized packet body as a scatter list of bytes-like pieces.
+    The body is referenced, not copied, and only the small header is built here.
+    This touches no connection state, so it is safe to run off the connection's event loop.
+
+    Without compression: Length, Packet ID, Data.
+    With compression: Packet Length, Data Length, then Packet ID and Data, zlib compressed when they reach the threshold.
+    Data Length is 0 for packets sent uncompressed.
+    '''
+    packet_id = encode_varint(packet_id)
+    size = len(packet_id) + len(body)
+    if compression_threshold < 0:
+        # send as compression disabled
+        return [encode_varint(size) + packet_id, body]
+    if size < compression_threshold:
+        # send as uncompressed
+        return [encode_varint(size + 1) + b'\x00' + packet_id, body]
+    # send as compressed
+    # A fresh context per packet: zlib objects cannot be reset once flushed, and copying a pristine one
+    # moves the whole 256 KiB deflate state, several times what deflateInit costs. See tests/bench_compression.py.
+    compressor = zlib.compressobj(compression_level)
+    compressed = [compressor.compress(packet_id), compressor.compress(body), compressor.flush()]
+    data_length = encode_varint(size)
+    return [encode_varint(len(data_length) + sum(map(len, compressed))) + data_length, *compressed]
+
+
 class Packet(ABC):
     
     @property
@@ -20,6 +55,44 @@ class Packet(ABC):
 
 
 class ServerboundPacket(Packet):
+    '''
+    Subclasses declaring the state they are received in and their id are registered for decoding:
+
+        class SPingRequest(ServerboundPacket, state=ConnectionState.STATUS, packet_id=0x01):
+
+    decode() then reads the fields following the packet id.
+    Declaring fields generates decode(), and __init__() unless the class defines one.
+    '''
+    _state: ConnectionState = None
+    _packet_id: int = None
+    route: Route = Route.LOOP
+    '''
+    Where handle() runs, play state packets default to the game thread.
+    '''
+
+    def __init_subclass__(cls, state: ConnectionState = None, packet_id: int = None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'fields' in cls.__dict__:
+            _compile_schema(cls)
+        if state is None:
+            return
+        cls._state = state
+        cls._packet_id = packet_id
+        if state == ConnectionState.PLAY and 'route' not in cls.__dict__:
+            cls.route = Route.GAME
+        registry.register(state, packet_id, cls)
+
+    @property
+    def packet_id(self) -> int:
+        return self._packet_id
+
+    @classmethod
+    def decode(cls, buffer: BufferedPacket) -> 'ServerboundPacket':
+        '''
+        Reads the packet from the frame, positioned right after the packet id.
+        Packets without fields don't need to override this.
+        '''
+        return cls()
 
     @abstractmethod
     def handle(self, p_state: PacketConnectionState) -> 'ClientboundPacket':
@@ -27,6 +100,33 @@ class ServerboundPacket(Packet):
 
 
 class ClientboundPacket(Packet):
+    '''
+    Subclasses may pass their id as a class keyword instead of overriding packet_id:
+
+        class CKeepAlive(ClientboundPacket, packet_id=0x27):
+            fields = [('keep_alive_id', Long)]
+
+    Declaring fields generates packet_body(), and __init__() unless the class defines one.
+    '''
+    _packet_id: int = None
+    priority: Priority = Priority.WORLD
+    '''
+    How urgently the packet is sent in play state, see scheduler.PacketScheduler.
+    '''
+
+    def __init_subclass__(cls, packet_id: int = None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if packet_id is not None:
+            cls._packet_id = packet_id
+        if 'fields' in cls.__dict__:
+            _compile_schema(cls)
+            if 'packet_body' not in cls.__dict__:
+                cls.packet_body = _schema_packet_body
+                cls.encode_body = _schema_encode_body
+
+    @property
+    def packet_id(self) -> int:
+        return self._packet_id
 
     @abstractmethod
     def packet_body(self, p_state: PacketConnectionState) -> BufferedPacket:
@@ -36,33 +136,66 @@ class ClientboundPacket(Packet):
         '''
         pass
 
+    def frame(self, p_state: PacketConnectionState, compression_threshold=-1) -> list:
+        '''
+        Serializes the packet once and returns its frame as a scatter list of bytes-like pieces, meant to be written back to back.
+        See frame_body() for the layout.
+        '''
+        return frame_body(self.packet_id, self.encode_body(p_state), compression_threshold, p_state.compression_level)
+
+    def encode_body(self, p_state: PacketConnectionState):
+        '''
+        The serialized packet body as a bytes-like object.
+        Schema packets encode straight to bytes without going through a BufferedPacket.
+        '''
+        return self.packet_body(p_state).buffer
+
     def get_bytes(self, p_state: PacketConnectionState, compression_threshold=-1) -> BufferedPacket:
         '''
-        This is the final packet that will be sent to the client.
-        Encrypt as required.
+        This is the final packet that will be sent to the client, as a single buffer.
+        Encryption is applied by the output stream.
         '''
-        packet_body = BufferedPacket(byte_order='big')
-        packet_body.write_varint(self.packet_id)
-        p = self.packet_body(p_state)
-        packet_body.write(p.read(p.buffer_size))
-        packet_body.flip()
-        packet_body_length = packet_body.buffer_size
-        pre_packet = BufferedPacket(byte_order='big')
-        if compression_threshold == -1:
-            # send as compression disabled
-            pre_packet.write(packet_body.read(packet_body_length))
-        elif packet_body_length < compression_threshold:
-            # send as uncompressed
-            pre_packet.write_varint(0x00)
-            pre_packet.write(packet_body.read(packet_body_length))
-        elif packet_body_length >= compression_threshold:
-            # send as compressed
-            compressed_packet = zlib.compress(packet_body.read(packet_body_length))
-            pre_packet.write_varint(packet_body_length)
-            pre_packet.write(compressed_packet)
         packet = BufferedPacket(byte_order='big')
-        packet.write_varint(pre_packet.buffer_size)
-        pre_packet.flip()
-        packet.write(pre_packet.read(pre_packet.buffer_size))
+        for piece in self.frame(p_state, compression_threshold):
+            packet.write(piece)
         packet.flip()
-        return packet
\ No newline at end of file
+        return packet
+
+
+class SharedFrame:
+    '''
+    A clientbound packet serialized once and framed once per compression threshold, for sending the same packet to many connections.
+    The body is encoded without a connection state, so the packet must not depend on the receiving connection.
+    Frames are never modified once built and may be written to any number of output streams, only encryption happens per connection.
+    '''
+    def __init__(self, packet: ClientboundPacket, compression_level=zlib.Z_DEFAULT_COMPRESSION):
+        self.packet_id = packet.packet_id
+        self.priority = packet.priority
+        self.body = bytes(packet.encode_body(None))
+        self.compression_level = compression_level
+        self._frames = {}
+
+    def frame(self, compression_threshold=-1) -> list:
+        '''
+        Connections share the threshold announced at login, so a broadcast usually frames, and compresses, exactly once.
+        '''
+        frame = self._frames.get(compression_threshold)
+        if frame is None:
+            frame = self._frames.setdefault(compression_threshold, frame_body(self.packet_id, self.body, compression_threshold, self.compression_level))
+        return frame
+
+
+def _compile_schema(cls: type):
+    encode, decode, init = schema.compile_fields(cls.__name__, cls.fields)
+    cls._encode_fields = encode
+    if 'decode' not in cls.__dict__:
+        cls.decode = classmethod(decode)
+    if '__init__' not in cls.__dict__:
+        init.__qualname__ = f'{cls.__qualname__}.__init__'
+        cls.__init__ = init
+
+def _schema_encode_body(self: ClientboundPacket, p_state: PacketConnectionState) -> bytes:
+    return self._encode_fields()
+
+def _schema_packet_body(self: ClientboundPacket, p_state: PacketConnectionState) -> BufferedPacket:
+    return BufferedPacket(byte_order='big').wrap(self._encode_fields(), auto_flip=True)
@@ -1,6 +1,8 @@
 
 from networking.packet import ClientboundPacket
 from networking.packet.packet_connection import PacketConnectionState
+from networking.packet.scheduler import Priority
+from networking.packet.schema import Long
 from networking.data_type import BufferedPacket
 
 ###
@@ -23,8 +25,9 @@ class CFinishConfiguration(ClientboundPacket):
     def packet_body(self, p_state: PacketConnectionState) -> BufferedPacket:
         return BufferedPacket()
 
-class CKeepAlive(ClientboundPacket):
-    pass
+class CKeepAlive(ClientboundPacket, packet_id=0x04):
+    priority = Priority.CONTROL
+    fields = [('keep_alive_id', Long)]
 
 class CPing(ClientboundPacket):
     pass
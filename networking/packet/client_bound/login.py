@@ -1,4 +1,5 @@
 
+import json
 import uuid
 
 from cryptography.hazmat.primitives.asymmetric import rsa
@@ -7,13 +8,16 @@ from cryptography.hazmat.primitives import serialization
 from networking.packet import ClientboundPacket
 from networking.packet.packet_connection import PacketConnectionState
 from networking.data_type import BufferedPacket
-from networking.mc_crypto import gen_rsa_key_pair, encode_public_key_der
+from networking.mc_crypto import ServerKeyPair
 
 # Very fancy!!!
 ####
 # Login packets
 ###
 class CDisconnect(ClientboundPacket):
+    '''
+    reason is plain text, sent as a JSON text component.
+    '''
     def __init__(self, reason: str):
         self.reason = reason
 
@@ -23,16 +27,19 @@ class CDisconnect(ClientboundPacket):
     
     def packet_body(self, p_state: PacketConnectionState) -> BufferedPacket:
         body = BufferedPacket()
-        body.write_utf8_string(self.reason)
+        body.write_utf8_string(json.dumps({'text': self.reason}), 32767)
         body.flip()
         return body
 
 class CEncryptionRequest(ClientboundPacket):
-    def __init__(self, online_mode: bool, verify_token=bytes([0x12, 0x34, 0x56, 0x78]), server_id=''):
+    '''
+    The keypair is the server wide one, only the verify token is per connection.
+    '''
+    def __init__(self, online_mode: bool, key_pair: ServerKeyPair, verify_token: bytes = None, server_id=''):
         self.server_id = server_id
         self.online_mode = online_mode
-        self.private_key, self.public_key = gen_rsa_key_pair()
-        self.verify_token = verify_token
+        self.private_key, self.public_key, self.public_der = key_pair.snapshot()
+        self.verify_token = verify_token or key_pair.verify_token()
     
     @property
     def packet_id(self):
@@ -42,13 +49,13 @@ class CEncryptionRequest(ClientboundPacket):
         with p_state.encryption_lock:
             p_state.private_key = self.private_key
             p_state.public_key = self.public_key
+            p_state.public_der = self.public_der
         p_state.server_id = self.server_id
         p_state.verify_token = self.verify_token
-        public_der = encode_public_key_der(p_state.public_key)
         body = BufferedPacket()
         body.write_utf8_string(self.server_id, 20)
-        body.write_varint(len(public_der))
-        body.write(public_der)
+        body.write_varint(len(self.public_der))
+        body.write(self.public_der)
         body.write_varint(len(self.verify_token))
         body.write(self.verify_token)
         body.write_bool(p_state.online_mode) # this was the imposter 
@@ -59,12 +66,14 @@ class CEncryptionRequest(ClientboundPacket):
         return self.private_key
 
 class CLoginSuccess(ClientboundPacket):
-    def __init__(self, uuid: uuid.UUID, username: str, num_properties: int, value: str, signature: str):
+    '''
+    properties are the (name, value, signature) of each profile property, signature None when unsigned.
+    Offline players have none, online ones have their skin as textures.
+    '''
+    def __init__(self, uuid: uuid.UUID, username: str, properties: list = ()):
         self._uuid = uuid
         self._username = username
-        self._num_properties = num_properties
-        self._value = value
-        self._signature = signature
+        self._properties = properties
 
     @property
     def packet_id(self):
@@ -74,17 +83,35 @@ class CLoginSuccess(ClientboundPacket):
         body = BufferedPacket()
         body.write_uuid(self._uuid)
         body.write_utf8_string(self._username, 16)
-        body.write_varint(self._num_properties)
-        body.write_utf8_string('texture', 32767)
-        body.write_utf8_string(self._value, 32767)
-        if self._signature:
-            body.write_bool(True)
-            body.write_utf8_string(self._signature, 32767)
+        body.write_varint(len(self._properties))
+        for name, value, signature in self._properties:
+            body.write_utf8_string(name, 32767)
+            body.write_utf8_string(value, 32767)
+            body.write_bool(signature is not None)
+            if signature is not None:
+                body.write_utf8_string(signature, 32767)
         body.flip()
         return body
 
 class CSetCompression(ClientboundPacket):
-    pass
+    '''
+    Enables compression for every packet after this one, in both directions.
+    This packet itself is still sent uncompressed.
+    A negative threshold disables compression.
+    '''
+    def __init__(self, threshold: int):
+        self._threshold = threshold
+
+    @property
+    def packet_id(self):
+        return 0x03
+    
+    def packet_body(self, p_state: PacketConnectionState) -> BufferedPacket:
+        p_state.compress_threshold = self._threshold
+        body = BufferedPacket()
+        body.write_varint(self._threshold)
+        body.flip()
+        return body
 
 class CLoginPluginRequest(ClientboundPacket):
     '''
@@ -1,5 +1,7 @@
 
 from networking.packet import ClientboundPacket
+from networking.packet.scheduler import Priority
+from networking.packet.schema import Angle, Bool, Long, Short, VarInt
 
 ###
 # Client Bound Play (This is a lot!!!)
@@ -65,10 +67,10 @@ class CChangeDifficulty(ClientboundPacket):
     pass
 
 class CChunkBatchFinished(ClientboundPacket):
-    pass
+    priority = Priority.BULK
 
 class CChunkBatchStart(ClientboundPacket):
-    pass
+    priority = Priority.BULK
 
 class CChunkBiome(ClientboundPacket):
     pass
@@ -116,7 +118,7 @@ class CDeleteMessage(ClientboundPacket):
     pass
 
 class CDisconnect(ClientboundPacket):
-    pass
+    priority = Priority.CONTROL
 
 class CDisguisedChatMessage(ClientboundPacket):
     pass
@@ -132,13 +134,13 @@ class CTeleportEntity(ClientboundPacket):
         That packet has a different function and will lead to confusing results if used in place of this one.
     !!!
     '''
-    pass
+    priority = Priority.MOVEMENT
 
 class CExplosion(ClientboundPacket):
     pass
 
 class CUnloadChunk(ClientboundPacket):
-    pass
+    priority = Priority.BULK
 
 class CGameEvent(ClientboundPacket):
     pass
@@ -152,11 +154,12 @@ class CHurtAnimation(ClientboundPacket):
 class CInitializeWorldBorder(ClientboundPacket):
     pass
 
-class CKeepAlive(ClientboundPacket):
-    pass
+class CKeepAlive(ClientboundPacket, packet_id=0x27):
+    priority = Priority.CONTROL
+    fields = [('keep_alive_id', Long)]
 
 class CChunkDataAndUpdateLight(ClientboundPacket):
-    pass
+    priority = Priority.BULK
 
 class CWorldEvent(ClientboundPacket):
     pass
@@ -165,7 +168,7 @@ class CParticle(ClientboundPacket):
     pass
 
 class CUpdateLight(ClientboundPacket):
-    pass
+    priority = Priority.BULK
 
 class CLogin(ClientboundPacket):
     pass
@@ -176,17 +179,21 @@ class CMapData(ClientboundPacket):
 class CMerchantOffers(ClientboundPacket):
     pass
 
-class CUpdateEntityPosition(ClientboundPacket):
-    pass
+class CUpdateEntityPosition(ClientboundPacket, packet_id=0x2F):
+    priority = Priority.MOVEMENT
+    fields = [('entity_id', VarInt), ('delta_x', Short), ('delta_y', Short), ('delta_z', Short), ('on_ground', Bool)]
 
-class CUpdateEntityPositionRotation(ClientboundPacket):
-    pass
+class CUpdateEntityPositionRotation(ClientboundPacket, packet_id=0x30):
+    priority = Priority.MOVEMENT
+    fields = [('entity_id', VarInt), ('delta_x', Short), ('delta_y', Short), ('delta_z', Short),
+              ('yaw', Angle), ('pitch', Angle), ('on_ground', Bool)]
 
 class CMoveMinecartAlongTrack(ClientboundPacket):
     pass
 
-class CUpdateEntityRotation(ClientboundPacket):
-    pass
+class CUpdateEntityRotation(ClientboundPacket, packet_id=0x32):
+    priority = Priority.MOVEMENT
+    fields = [('entity_id', VarInt), ('yaw', Angle), ('pitch', Angle), ('on_ground', Bool)]
 
 class CMoveVehicle(ClientboundPacket):
     pass
@@ -201,7 +208,7 @@ class COpenSignEditor(ClientboundPacket):
     pass
 
 class CPingRequest(ClientboundPacket):
-    pass
+    priority = Priority.CONTROL
 
 class CPongResponse(ClientboundPacket):
     pass
@@ -234,7 +241,7 @@ class CLookAt(ClientboundPacket):
     pass
 
 class CSynchronizePlayerPosition(ClientboundPacket):
-    pass
+    priority = Priority.CONTROL
 
 class CPlayerRotation(ClientboundPacket):
     pass
@@ -266,8 +273,9 @@ class CAddResourcePack(ClientboundPacket):
 class CRespawn(ClientboundPacket):
     pass
 
-class CSetHeadRotation(ClientboundPacket):
-    pass
+class CSetHeadRotation(ClientboundPacket, packet_id=0x4D):
+    priority = Priority.MOVEMENT
+    fields = [('entity_id', VarInt), ('head_yaw', Angle)]
 
 class CUpdateSectionBlocks(ClientboundPacket):
     pass
@@ -299,8 +307,8 @@ class CSetBorderWarningDistance(ClientboundPacket):
 class CSetCamera(ClientboundPacket):
     pass
 
-class CSetCenterChunk(ClientboundPacket):
-    pass
+class CSetCenterChunk(ClientboundPacket, packet_id=0x58):
+    fields = [('chunk_x', VarInt), ('chunk_z', VarInt)]
 
 class CSetRenderDistance(ClientboundPacket):
     pass
@@ -1,4 +1,5 @@
 
+import base64
 import json
 from typing import List
 
@@ -13,9 +14,8 @@ from pyncraft.player import PlayerMP
 ###
 class CStatusResponse(ClientboundPacket):
     
-    def __init__(self, version: ProtocolVersion, max_players: int, online_players: int, sample_players: List[PlayerMP], description: str, enforce_secure_chat: bool):
+    def __init__(self, version: ProtocolVersion, max_players: int, online_players: int, sample_players: List[PlayerMP], description: str, enforce_secure_chat: bool, favicon: bytes = None):
         # Modern notchain server (MC 1.7+, specifically 13w41a and above):
-        # TODO: Support favicon
         self._response = {
             'version': {
                 'name': version.to_mc_version(),
@@ -28,6 +28,8 @@ class CStatusResponse(ClientboundPacket):
             },
             'description': {'text': description}
         }
+        if favicon:
+            self._response['favicon'] = 'data:image/png;base64,' + base64.b64encode(favicon).decode('ascii')
         # TODO: Support legacy clients (MC 1.6, specifically 13w39b and below)
 
     @property
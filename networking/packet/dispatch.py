@@ -0,0 +1,195 @@
+'''
+Where serverbound packets are handled, so event loops never block on game logic or external services.
+The connection's event loop reads and decodes every packet, then hands it over according to ServerboundPacket.route.
+'''
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from enum import Enum
+
+from core.logger import logger
+from networking.exception import ServerBusyError
+from networking.latency import LatencySamples
+
+
+class Route(Enum):
+    '''
+    ServerboundPacket.route declares where a packet is handled.
+    '''
+    LOOP = 'loop'
+    '''
+    Right away on the connection's event loop. Handshake, status, state changes and keep alive, anything cheap that must not wait.
+    '''
+    WORKER = 'worker'
+    '''
+    On the bounded HandlerPool. Login, authentication and plugin messages, anything that may take a while.
+    The connection stops reading until the handler answers, so its packets are still handled one at a time in order.
+    '''
+    GAME = 'game'
+    '''
+    On the game thread at its next tick, through the GameQueue. The default for play state packets.
+    '''
+
+
+class HandlerPool:
+    '''
+    Runs WORKER handlers on a few threads shared by every connection.
+    At most max_queued handlers wait or run at once, further ones fail right away with ServerBusyError
+    so a login flood is turned away instead of queueing without bound.
+    '''
+
+    def __init__(self, workers: int = 4, max_queued: int = 1024):
+        self.max_queued = max_queued
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='PacketHandler')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._latencies = LatencySamples()
+
+    @property
+    def queue_depth(self) -> int:
+        '''
+        Handlers waiting for a thread or running.
+        '''
+        return self._queued
+
+    def submit(self, incoming_packet, p_state) -> Future:
+        '''
+        Returns a future resolving to the handler's response.
+        A handler returning a future itself, such as one waiting on the session server, is followed through.
+        '''
+        future = Future()
+        with self._lock:
+            if self._queued >= self.max_queued:
+                future.set_exception(ServerBusyError(f'{self._queued} packet handlers queued'))
+                return future
+            self._queued += 1
+        try:
+            self._pool.submit(self._run, incoming_packet, p_state, future, time.monotonic())
+        except RuntimeError:
+            self._finished()
+            future.set_exception(ServerBusyError('Packet handlers are shut down'))
+        return future
+
+    def _run(self, incoming_packet, p_state, future: Future, queued_at: float):
+        try:
+            response = incoming_packet.handle(p_state)
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        finally:
+            # Latency is the time the handler kept the connection waiting, external services report their own
+            self._latencies.add(time.monotonic() - queued_at)
+            self._finished()
+        if not isinstance(response, Future):
+            future.set_result(response)
+            return
+        def _done(done: Future):
+            try:
+                future.set_result(done.result())
+            except BaseException as e:
+                future.set_exception(e)
+        response.add_done_callback(_done)
+
+    def _finished(self):
+        with self._lock:
+            self._queued -= 1
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)) -> dict:
+        '''
+        Seconds from submission until recent handlers returned, at each percentile. Empty when nothing ran yet.
+        '''
+        return self._latencies.percentiles(percentiles)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        logger.debug(f'Packet handlers shut down, latency percentiles: {self.latency_percentiles()}')
+
+
+class GameQueue:
+    '''
+    GAME packets waiting for the game thread, in the order the event loops received them.
+    Event loops put packets, the game thread drains them once per tick, so each connection's packets are handled in order.
+    A connection with more than max_per_connection packets waiting is flooding, put() refuses its packets.
+    '''
+
+    def __init__(self, max_per_connection: int = 256):
+        self.max_per_connection = max_per_connection
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._queued = {}
+        self._latencies = LatencySamples()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def put(self, connection, incoming_packet) -> bool:
+        '''
+        Thread safe. Returns False, queueing nothing, when the connection already has max_per_connection packets waiting.
+        '''
+        with self._lock:
+            queued = self._queued.get(connection, 0)
+            if queued >= self.max_per_connection:
+                return False
+            self._queued[connection] = queued + 1
+            self._queue.append((connection, incoming_packet, time.monotonic()))
+        return True
+
+    def drain(self) -> int:
+        '''
+        Handles every packet queued so far on the calling thread, meant to be the game thread at the start of a tick.
+        Responses are sent with Connection.send(). A handler raising disconnects its connection.
+        Returns the number of packets handled.
+        '''
+        with self._lock:
+            queue, self._queue = self._queue, deque()
+            for connection, _, _ in queue:
+                queued = self._queued.pop(connection) - 1
+                if queued:
+                    self._queued[connection] = queued
+        for connection, incoming_packet, queued_at in queue:
+            if connection.connection_stop_event.is_set():
+                continue
+            try:
+                response = incoming_packet.handle(connection.packet_state)
+                if response:
+                    connection.send(*(response if isinstance(response, tuple) else (response,)))
+            except Exception:
+                logger.exception(f'Error while handling {incoming_packet.__class__.__name__}')
+                connection.interrupt()
+            self._latencies.add(time.monotonic() - queued_at)
+        return len(queue)
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)) -> dict:
+        '''
+        Seconds from being received until recent packets were handled, at each percentile. Empty when nothing ran yet.
+        '''
+        return self._latencies.percentiles(percentiles)
+
+
+class GameTicker(threading.Thread):
+    '''
+    Drains a GameQueue every tick, standing in for the game loop until the server has one.
+    '''
+    TICK = 0.05
+
+    def __init__(self, game_queue: GameQueue):
+        super().__init__(name='GameTicker', daemon=True)
+        self.game_queue = game_queue
+        self._stop_event = threading.Event()
+
+    def run(self):
+        next_tick = time.monotonic()
+        while not self._stop_event.wait(max(0.0, next_tick - time.monotonic())):
+            self.game_queue.drain()
+            # Skip ticks that were missed rather than running them back to back
+            next_tick = max(next_tick + self.TICK, time.monotonic())
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
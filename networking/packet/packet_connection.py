@@ -1,7 +1,9 @@
 import os
 import threading
+import zlib
 
 from networking.protocol import ConnectionState
+from networking.status import ServerStatus
 
 # per connection packet state
 class PacketConnectionState:
@@ -9,15 +11,30 @@ class PacketConnectionState:
 
         # Server level state
         self.online_mode = True
+        # Velocity modern forwarding secret, the proxy in front authenticates players instead of the session server
+        self.forwarding_secret = None
         self.server_id = None
+        self.key_pair = None
+        self.authenticator = None
+        # Throttles forwarded logins per player address, the socket's is the proxy's
+        self.admission = None
+        self.server_status = ServerStatus()
+        # Threshold announced with Set Compression at login, negative keeps compression off
+        self.network_compression_threshold = 256
+        self.compression_level = zlib.Z_DEFAULT_COMPRESSION
 
         # Connection level state
         self.state = ConnectionState.HANDSHAKE
         self.compress_threshold = -1
         self.client_ip = None
         self.username = None
+        self.uuid = None
+        # Address of the player as forwarded by the proxy, client_ip is the proxy's
+        self.forwarded_ip = None
         self.unique_message_id = int.from_bytes(os.urandom(4), byteorder='big', signed=True)
         self.connection_id = None
+        # Round trip of keep alives in milliseconds, smoothed as the Notchian server does for the player list
+        self.latency = 0
 
         ### Application level state ###
 
@@ -39,6 +56,7 @@ class PacketConnectionState:
         self.encrypted = False
         self.public_key = None
         self.private_key = None
+        self.public_der = None
         self.decrypt_cipher = None
         self.encrypt_cipher = None
         self.verify_token = None
\ No newline at end of file
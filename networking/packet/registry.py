@@ -0,0 +1,32 @@
+'''
+Serverbound packet decoders, indexed by connection state and packet id.
+Packet classes register themselves when defined, see ServerboundPacket.
+'''
+from networking.protocol import ConnectionState
+
+MAX_PACKET_ID = 0x80
+'''
+Every serverbound packet id of the supported versions is below this.
+'''
+
+DECODERS = tuple([None] * MAX_PACKET_ID for _ in range(max(state.value for state in ConnectionState) + 1))
+'''
+DECODERS[state.value][packet_id] is the packet class decoding that frame, or None when the packet is not supported.
+'''
+
+def register(state: ConnectionState, packet_id: int, packet_class: type):
+    if not 0 <= packet_id < MAX_PACKET_ID:
+        raise ValueError(f'Packet id {packet_id:#04x} of {packet_class.__name__} is out of range')
+    decoders = DECODERS[state.value]
+    registered = decoders[packet_id]
+    if registered is not None and registered is not packet_class:
+        raise ValueError(f'{packet_class.__name__} and {registered.__name__} are both registered as {state.name} {packet_id:#04x}')
+    decoders[packet_id] = packet_class
+
+def decoder(state: ConnectionState, packet_id: int) -> type:
+    '''
+    Returns the packet class registered for the packet id in the state, or None.
+    '''
+    if 0 <= packet_id < MAX_PACKET_ID:
+        return DECODERS[state.value][packet_id]
+    return None
@@ -0,0 +1,105 @@
+'''
+Outbound packet scheduling by priority class.
+Packets of a connection in play state wait here until its socket has room for them, so urgent packets can overtake bulk data that is still queued.
+'''
+from collections import deque
+from enum import IntEnum
+
+
+class Priority(IntEnum):
+    '''
+    Lower values are more urgent. ClientboundPacket.priority declares the class of each packet.
+    '''
+    CONTROL = 0
+    '''
+    Keep alive, ping, disconnect and position synchronization. Always sent first.
+    '''
+    MOVEMENT = 1
+    '''
+    Entity movement and rotation.
+    '''
+    WORLD = 2
+    '''
+    Block changes, chat, time and everything else not classified.
+    '''
+    BULK = 3
+    '''
+    Chunk data and light, including the chunk batch start and finish around them.
+    '''
+
+
+class PacketScheduler:
+    '''
+    Per-connection queues, one per priority class. Not thread safe, it belongs to the connection's event loop.
+
+    CONTROL is served strictly first. The other classes share the link by deficit round robin over their queued bytes,
+    each getting its quantum per round, so bulk data keeps flowing without delaying movement by more than a quantum or two.
+    An entry is never split, and entries of the same class leave in the order they were pushed.
+    A bundle or a chunk batch pushed as one entry, or as consecutive entries of one class, therefore stays in protocol order.
+    Packets changing the protocol state must not overtake anything, send them with the least urgent priority queued.
+    '''
+    QUANTA = {Priority.MOVEMENT: 16384, Priority.WORLD: 8192, Priority.BULK: 4096}
+    '''
+    Bytes each class may send per round.
+    '''
+
+    def __init__(self, quanta: dict = None):
+        quanta = {**self.QUANTA, **(quanta or {})}
+        self._quanta = [0] + [quanta[priority] for priority in list(Priority)[1:]]
+        self._queues = [deque() for _ in Priority]
+        self._deficits = [0] * len(Priority)
+        self._turn = Priority.MOVEMENT
+        self._granted = False
+        self._entries = 0
+        self.queued_bytes = 0
+
+    def __len__(self) -> int:
+        return self._entries
+
+    def push(self, priority: Priority, size: int, entry):
+        self._queues[priority].append((size, entry))
+        self._entries += 1
+        self.queued_bytes += size
+
+    def pop(self):
+        '''
+        Returns the next entry to send, or None when empty.
+        '''
+        if not self._entries:
+            return None
+        queues = self._queues
+        if queues[Priority.CONTROL]:
+            return self._take(queues[Priority.CONTROL])
+        while True:
+            turn = self._turn
+            queue = queues[turn]
+            if queue:
+                if not self._granted:
+                    self._deficits[turn] += self._quanta[turn]
+                    self._granted = True
+                size = queue[0][0]
+                if size <= self._deficits[turn]:
+                    self._deficits[turn] -= size
+                    return self._take(queue)
+            else:
+                # An idle class does not bank credit
+                self._deficits[turn] = 0
+            self._turn = turn + 1 if turn < Priority.BULK else Priority.MOVEMENT
+            self._granted = False
+
+    def _take(self, queue: deque):
+        size, entry = queue.popleft()
+        self._entries -= 1
+        self.queued_bytes -= size
+        return entry
+
+    def clear(self) -> list:
+        '''
+        Empties every queue and returns the entries that were waiting.
+        '''
+        entries = [entry for queue in self._queues for _, entry in queue]
+        for queue in self._queues:
+            queue.clear()
+        self._entries = 0
+        self.queued_bytes = 0
+        return entries
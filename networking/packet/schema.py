@@ -0,0 +1,196 @@
+'''
+Declarative packet layouts, compiled into straight-line encoders and decoders.
+
+A packet class lists its fields in wire order:
+
+    class CUpdateEntityRotation(ClientboundPacket, packet_id=0x32):
+        fields = [('entity_id', VarInt), ('yaw', Angle), ('pitch', Angle), ('on_ground', Bool)]
+
+When the class is defined, source code for exactly that layout is generated and compiled once.
+Consecutive fixed width fields collapse into a single precompiled struct.Struct, so the example above is one VarInt call and one unpack_from().
+The encoder reads attributes named after the fields, the decoder passes values to the constructor in field order.
+A class without its own __init__ gets one taking the fields in order.
+Names starting with an underscore are reserved for the generated code and its helpers, fields can not use them.
+'''
+import keyword
+import struct
+import uuid
+
+from networking.varint import decode_varint, decode_varlong, encode_varint, encode_varlong
+
+
+class FieldType:
+    '''
+    fmt is the struct format of fixed width types.
+    Variable width types instead name helpers generating (encode) an expression and (decode) a statement.
+    The statement reads from _data at _offset up to _limit, and moves _offset past the value.
+    '''
+    def __init__(self, name: str, fmt: str = None, encoder: str = None, decoder: str = None, **helpers):
+        self.name = name
+        self.fmt = fmt
+        self.encoder = encoder
+        self.decoder = decoder
+        self.helpers = helpers
+
+    def __repr__(self):
+        return self.name
+
+
+def _encode_string(value: str, n: int) -> bytes:
+    data = value.encode('utf-8')
+    size = len(data)
+    # A character never takes more UTF-16 code units than UTF-8 bytes, so counting is only needed past n bytes.
+    if size > n and (size if value.isascii() else sum(1 + (ord(ch) > 0xFFFF) for ch in value)) > n:
+        raise ValueError(f'String exceeds maximum of {n} UTF-16 code units.')
+    if size > n * 3:
+        raise ValueError(f'Encoded UTF-8 string exceeds {n * 3} bytes.')
+    return encode_varint(size) + data
+
+def _decode_string(data, offset: int, limit: int, n: int) -> tuple:
+    size, offset = decode_varint(data, offset, limit)
+    if size < 0 or size > n * 3 + 3:
+        raise ValueError(f'Invalid encoded string size: {size}. Must be at most {n * 3 + 3} bytes.')
+    end = offset + size
+    if end > limit:
+        raise struct.error('String is truncated')
+    value = str(data[offset:end], 'utf-8')
+    if size > n and (size if len(value) == size else sum(1 + (ord(ch) > 0xFFFF) for ch in value)) > n:
+        raise ValueError(f'Decoded string exceeds maximum of {n} UTF-16 code units.')
+    return value, end
+
+def _decode_byte_array(data, offset: int, limit: int) -> tuple:
+    size, offset = decode_varint(data, offset, limit)
+    end = offset + size
+    if size < 0 or end > limit:
+        raise struct.error('Byte array is truncated')
+    return bytes(data[offset:end]), end
+
+def _decode_uuid(data, offset: int, limit: int) -> tuple:
+    end = offset + 16
+    if end > limit:
+        raise struct.error('UUID is truncated')
+    return uuid.UUID(bytes=bytes(data[offset:end])), end
+
+
+Bool = FieldType('Bool', '?')
+Byte = FieldType('Byte', 'b')
+UByte = FieldType('UByte', 'B')
+Short = FieldType('Short', 'h')
+UShort = FieldType('UShort', 'H')
+Int = FieldType('Int', 'i')
+Long = FieldType('Long', 'q')
+Float = FieldType('Float', 'f')
+Double = FieldType('Double', 'd')
+Angle = FieldType('Angle', 'B')
+'''
+Rotation in steps of 1/256 of a full turn.
+'''
+VarInt = FieldType('VarInt', encoder='_encode_varint({value})', decoder='{value}, _offset = _decode_varint(_data, _offset, _limit)',
+                   _encode_varint=encode_varint, _decode_varint=decode_varint)
+VarLong = FieldType('VarLong', encoder='_encode_varlong({value})', decoder='{value}, _offset = _decode_varlong(_data, _offset, _limit)',
+                    _encode_varlong=encode_varlong, _decode_varlong=decode_varlong)
+UUID = FieldType('UUID', encoder='{value}.bytes', decoder='{value}, _offset = _decode_uuid(_data, _offset, _limit)', _decode_uuid=_decode_uuid)
+ByteArray = FieldType('ByteArray', encoder='_encode_varint(_len({value})) + _bytes({value})', decoder='{value}, _offset = _decode_byte_array(_data, _offset, _limit)',
+                      _encode_varint=encode_varint, _decode_byte_array=_decode_byte_array, _len=len, _bytes=bytes)
+'''
+Bytes prefixed by their length as a VarInt.
+'''
+RemainingBytes = FieldType('RemainingBytes', encoder='_bytes({value})', decoder='{value} = _bytes(_data[_offset:_limit]); _offset = _limit',
+                           _bytes=bytes)
+'''
+Everything up to the end of the packet, only valid as the last field.
+'''
+
+def String(n: int = 32767) -> FieldType:
+    '''
+    UTF-8 string of at most n UTF-16 code units, prefixed by its size in bytes as a VarInt.
+    '''
+    if n > 32767:
+        raise ValueError('Maximum n value is 32767.')
+    return FieldType(f'String({n})', encoder=f'_encode_string({{value}}, {n})', decoder=f'{{value}}, _offset = _decode_string(_data, _offset, _limit, {n})',
+                     _encode_string=_encode_string, _decode_string=_decode_string)
+
+
+def _runs(fields: list) -> list:
+    '''
+    Groups consecutive fixed width fields, returns a list of (names, struct) and (name, FieldType) items.
+    '''
+    items = []
+    names, fmt = [], ''
+    for name, field_type in fields:
+        if field_type.fmt:
+            names.append(name)
+            fmt += field_type.fmt
+            continue
+        if names:
+            items.append((names, struct.Struct('>' + fmt)))
+            names, fmt = [], ''
+        items.append((name, field_type))
+    if names:
+        items.append((names, struct.Struct('>' + fmt)))
+    return items
+
+def _validate(owner: str, fields: list):
+    seen = set()
+    for index, (name, field_type) in enumerate(fields):
+        if not name.isidentifier() or keyword.iskeyword(name) or name in seen:
+            raise ValueError(f'Invalid field name {name!r} in {owner}')
+        if name.startswith('_'):
+            raise ValueError(f'Field name {name!r} in {owner} starts with an underscore, reserved for the generated code')
+        if not isinstance(field_type, FieldType):
+            raise TypeError(f'Field {name} of {owner} is not a field type: {field_type!r}')
+        if field_type is RemainingBytes and index != len(fields) - 1:
+            raise ValueError(f'RemainingBytes must be the last field of {owner}')
+        seen.add(name)
+
+def compile_fields(owner: str, fields: list) -> tuple:
+    '''
+    Returns (encode, decode, init) for the layout.
+    encode(obj) -> bytes reads the fields as attributes of obj.
+    decode(cls, buffer) -> instance reads the fields from a ByteBuffer at its read position and calls cls(*values).
+    It reads from a view ending at the written data, so a short packet raises struct.error instead of reading stale bytes.
+    init(self, *values) stores the fields as attributes.
+    '''
+    _validate(owner, fields)
+    namespace = {'_len': len}
+    encode_parts = []
+    decode_lines = []
+    for index, (item, spec) in enumerate(_runs(fields)):
+        if isinstance(spec, struct.Struct):
+            codec = f'_s{index}'
+            namespace[codec] = spec
+            encode_parts.append(f'{codec}.pack({", ".join(f"_self.{name}" for name in item)})')
+            targets = ', '.join(item) + (',' if len(item) == 1 else '')
+            decode_lines.append(f'{targets} = {codec}.unpack_from(_data, _offset)')
+            decode_lines.append(f'_offset += {spec.size}')
+        else:
+            namespace.update(spec.helpers)
+            encode_parts.append(spec.encoder.format(value=f'_self.{item}'))
+            decode_lines.append(spec.decoder.format(value=item))
+    names = [name for name, _ in fields]
+    arguments = ', '.join(names)
+
+    if not encode_parts:
+        encode_body = "b''"
+    elif len(encode_parts) == 1:
+        encode_body = encode_parts[0]
+    else:
+        encode_body = f'b"".join(({", ".join(encode_parts)},))'
+    source = [
+        'def encode(_self):',
+        f'    return {encode_body}',
+        '',
+        'def decode(_cls, _buffer):',
+        '    _data = _buffer.buffer',
+        '    _offset = _buffer.position',
+        '    _limit = _len(_data)',
+        *(f'    {line}' for line in decode_lines),
+        '    _buffer.position = _offset',
+        f'    return _cls({arguments})',
+        '',
+        f'def init(_self{", " if names else ""}{arguments}):',
+        *(f'    _self.{name} = {name}' for name in names),
+        '    pass',
+    ]
+    exec(compile('\n'.join(source), f'<schema {owner}>', 'exec'), namespace)
+    return namespace['encode'], namespace['decode'], namespace['init']
@@ -1,13 +1,16 @@
 
 from core.logger import logger
 from networking.packet import ServerboundPacket
+from networking.packet.dispatch import Route
 from networking.packet.packet_connection import PacketConnectionState
+from networking.packet.schema import Long
 from networking.protocol import ConnectionState
+from networking.data_type import BufferedPacket
 
 ###
 # Server Bound Configuration
 ###
-class SClientInformation(ServerboundPacket):
+class SClientInformation(ServerboundPacket, state=ConnectionState.CONFIGURATION, packet_id=0x00):
     def __init__(self, locale: str, view_distance: int, chat_mode: int, chat_colors: bool, displayed_skin_parts: int, main_hand: int, enable_text_filtering: bool, allow_server_listings: bool):
         self._locale = locale
         self._view_distance = view_distance
@@ -18,9 +21,18 @@ class SClientInformation(ServerboundPacket):
         self._enable_text_filtering = enable_text_filtering
         self._allow_server_listings = allow_server_listings
 
-    @property
-    def packet_id(self):
-        return 0x00
+    @classmethod
+    def decode(cls, buffer: BufferedPacket) -> 'SClientInformation':
+        return cls(
+            locale=buffer.read_utf8_string(16),
+            view_distance=buffer.read_int8(),
+            chat_mode=buffer.read_varint(),
+            chat_colors=buffer.read_bool(),
+            displayed_skin_parts=buffer.read_uint8(),
+            main_hand=buffer.read_varint(),
+            enable_text_filtering=buffer.read_bool(),
+            allow_server_listings=buffer.read_bool()
+        )
     
     def handle(self, p_state: PacketConnectionState) -> None:
         with p_state.client_information_lock:
@@ -47,29 +59,35 @@ class SClientInformation(ServerboundPacket):
 class SCookieResponse(ServerboundPacket):
     pass
 
-class SPluginMessage(ServerboundPacket):
+class SPluginMessage(ServerboundPacket, state=ConnectionState.CONFIGURATION, packet_id=0x02):
+    route = Route.WORKER
+
     def __init__(self, channel: str, data: bytes):
         self._channel = channel
         self._data = data
-    
-    @property
-    def packet_id(self):
-        return 0x02
+
+    @classmethod
+    def decode(cls, buffer: BufferedPacket) -> 'SPluginMessage':
+        channel = buffer.read_utf8_string(32767)
+        data = buffer.read(buffer.length() - buffer.pos())
+        logger.debug(f'Plugin message received: {channel}')
+        return cls(channel, data)
     
     def handle(self, p_state: PacketConnectionState) -> None:
         return None
 
-class SFinishConfigurationAcknowledged(ServerboundPacket):
-    @property
-    def packet_id(self):
-        return 0x03
-    
+class SFinishConfigurationAcknowledged(ServerboundPacket, state=ConnectionState.CONFIGURATION, packet_id=0x03):
+
     def handle(self, p_state: PacketConnectionState) -> None:
         p_state.state = ConnectionState.PLAY
         return None
 
-class SKeepAlive(ServerboundPacket):
-    pass
+class SKeepAlive(ServerboundPacket, state=ConnectionState.CONFIGURATION, packet_id=0x04):
+    route = Route.LOOP
+    fields = [('keep_alive_id', Long)]
+
+    def handle(self, p_state: PacketConnectionState) -> None:
+        return None
 
 class SPongResponse(ServerboundPacket):
     pass
@@ -1,14 +1,15 @@
 
 from networking.packet import ServerboundPacket, ClientboundPacket
 from networking.packet.packet_connection import PacketConnectionState
-from networking.protocol import ConnectionState
+from networking.protocol import ConnectionState, ProtocolVersion
+from networking.data_type import BufferedPacket
 from networking.exception import ProtocolError
 
 
 ###
 # packet arrival
 ###
-class SHandshake(ServerboundPacket):
+class SHandshake(ServerboundPacket, state=ConnectionState.HANDSHAKE, packet_id=0x00):
 
     def __init__(self, protocol_version: int, server_address: str, server_port: int, next_state: int):
         self._protocol_version = protocol_version
@@ -16,9 +17,14 @@ class SHandshake(ServerboundPacket):
         self._server_port = server_port
         self._next_state = next_state
 
-    @property
-    def packet_id(self):
-        return 0x00
+    @classmethod
+    def decode(cls, buffer: BufferedPacket) -> 'SHandshake':
+        return cls(
+            protocol_version=ProtocolVersion.from_protocol_version(buffer.read_varint()), 
+            server_address=buffer.read_utf8_string(256), 
+            server_port=buffer.read_uint16(), 
+            next_state=buffer.read_varint()
+        )
     
     def handle(self, p_state: PacketConnectionState) -> None:
         if self._next_state == 1:
@@ -1,45 +1,81 @@
 
 import uuid
-import requests
+from concurrent.futures import Future
 
 from core.logger import logger
 import networking.packet.client_bound.login as login
 from networking.packet import ServerboundPacket
+from networking.packet.dispatch import Route
 from networking.packet.packet_connection import PacketConnectionState
 from networking.protocol import ConnectionState
-from networking.mc_crypto import decrypt_rsa, gen_ciphers, auth_hash, encode_public_key_der
+from networking.data_type import BufferedPacket
+from networking.mc_crypto import decrypt_rsa, gen_ciphers, auth_hash
+from networking.auth import chain_future, offline_uuid
+from networking.exception import AuthenticationError, LoginThrottledError, ProtocolError
+import networking.forwarding as forwarding
+
+def _login_success(p_state: PacketConnectionState, player_uuid: uuid.UUID, username: str, properties: list):
+    '''
+    Login Success, preceded by Set Compression unless compression is off.
+    '''
+    p_state.uuid = player_uuid
+    p_state.username = username
+    login_success = login.CLoginSuccess(player_uuid, username, properties)
+    if p_state.network_compression_threshold < 0:
+        return login_success
+    # Set Compression must come before Login Success, everything after it is compressed
+    return login.CSetCompression(p_state.network_compression_threshold), login_success
 
 ###
 # Server bound login packets
 ###
-class SLoginStart(ServerboundPacket):
+class SLoginStart(ServerboundPacket, state=ConnectionState.LOGIN, packet_id=0x00):
     '''
     UUID appears to be unused by the notchian server.
     '''
+    route = Route.WORKER
+
     def __init__(self, username: str, uuid: uuid.UUID):
         self._username = username
         self._uuid = uuid
 
-    @property
-    def packet_id(self):
-        return 0x00
+    @classmethod
+    def decode(cls, buffer: BufferedPacket) -> 'SLoginStart':
+        return cls(buffer.read_utf8_string(16), buffer.read_uuid())
     
-    def handle(self, p_state: PacketConnectionState) -> login.CEncryptionRequest:
+    def handle(self, p_state: PacketConnectionState):
+        '''
+        Behind a proxy, asks it for the player it authenticated. In offline mode, logs the player in right away without encryption.
+        Otherwise starts encryption with an Encryption Request.
+        '''
         logger.info(f'Connection from {p_state.client_ip} is logging in as {self._username}', log_thread=False)
         p_state.username = self._username
-        return login.CEncryptionRequest(online_mode=p_state.online_mode)
+        if p_state.forwarding_secret:
+            return login.CLoginPluginRequest(forwarding.CHANNEL, bytes([forwarding.MODERN_DEFAULT]))
+        if not p_state.online_mode:
+            return _login_success(p_state, offline_uuid(self._username), self._username, [])
+        return login.CEncryptionRequest(online_mode=p_state.online_mode, key_pair=p_state.key_pair)
     
 
-class SEncryptionResponse(ServerboundPacket):
+class SEncryptionResponse(ServerboundPacket, state=ConnectionState.LOGIN, packet_id=0x01):
+    route = Route.WORKER
+
     def __init__(self, shared_secret: bytes, verify_token: bytes):
         self.shared_secret = shared_secret
         self.verify_token = verify_token
 
-    @property
-    def packet_id(self):
-        return 0x01
+    @classmethod
+    def decode(cls, buffer: BufferedPacket) -> 'SEncryptionResponse':
+        shared_secret = buffer.read(buffer.read_varint())
+        verify_token = buffer.read(buffer.read_varint())
+        return cls(shared_secret, verify_token)
     
-    def handle(self, p_state: PacketConnectionState) -> login.CLoginSuccess:
+    def handle(self, p_state: PacketConnectionState) -> Future:
+        '''
+        Returns a future resolving to Set Compression and Login Success once the session server confirms the player.
+        '''
+        if not p_state.online_mode or p_state.forwarding_secret:
+            raise ProtocolError('Encryption Response to an offline login, which was never sent an Encryption Request')
         # check RSA encryption is valid
         if p_state.verify_token != decrypt_rsa(bytes(self.verify_token), p_state.private_key):
             raise ValueError('Encrypted token mismatch')
@@ -50,86 +86,92 @@ class SEncryptionResponse(ServerboundPacket):
             p_state.encrypted = True # extremely important
             p_state.encrypt_cipher = encrypt_cipher
             p_state.decrypt_cipher = decrypt_cipher
-        # TODO: Authenticate client if online mode <- done! (almost)
-        if p_state.online_mode:
-            login_hash = auth_hash(
-                server_id=p_state.server_id, 
-                shared_secret=shared_secret, 
-                public_der=encode_public_key_der(p_state.public_key)
-            )
-            auth_endpoint = 'https://sessionserver.mojang.com/session/minecraft/hasJoined'
-            # TODO: Implement this with ip (appears that client IPs within LAN = doesn't work)
-            # TODO: Notchian server is configurable for the IP, which includes only `prevent-proxy-connections` is set to be true.
-            response = requests.get(auth_endpoint, params={'username': p_state.username, 'serverId': login_hash})
-            if response.status_code != 200:
-                raise ValueError(f'Authentication failed: {response.status_code}')
-            auth_response = response.json()
-            authorized_id = uuid.UUID(auth_response['id'])
-            username = auth_response['name']
-            value = auth_response['properties'][0]['value']
-            signature = None
-            if 'signature' in auth_response['properties'][0]:
-                signature = auth_response['properties'][0]['signature']
-        # TODO: Implement offline mode authentication
+        # The session server is asked off the event loop, login completes once it answers
+        login_hash = auth_hash(
+            server_id=p_state.server_id, 
+            shared_secret=shared_secret, 
+            public_der=p_state.public_der
+        )
+        # TODO: Notchian server is configurable for the IP, which includes only `prevent-proxy-connections` is set to be true.
+        profile = p_state.authenticator.has_joined(p_state.username, login_hash)
+        return chain_future(profile, lambda auth_response: self._login_success(p_state, auth_response))
+
+    def _login_success(self, p_state: PacketConnectionState, auth_response: dict) -> tuple:
         # Connections are encrypted at this point,
         # this should be automatically done by the packet output stream.
-        return login.CLoginSuccess(
-            uuid=authorized_id,
-            username=username,
-            num_properties=1,
-            value=value,
-            signature=signature
-        )
+        properties = [(prop['name'], prop['value'], prop.get('signature')) for prop in auth_response.get('properties') or ()]
+        return _login_success(p_state, uuid.UUID(auth_response['id']), auth_response['name'], properties)
 
 
-class SLoginPluginResponse(ServerboundPacket):
+class SLoginPluginResponse(ServerboundPacket, state=ConnectionState.LOGIN, packet_id=0x02):
     '''
     For custom server/client handshake
     Notchian client always responds with successful = False, indicates client hasn't understood the request
     S -> C: LoginPluginRequest
     C -> S: LoginPluginResponse (This)
     '''
+    route = Route.WORKER
+
     def __init__(self, message_id: int, successful: bool, data: bytes):
         self._message_id = message_id
         self._successful = successful
         self._data = data
-    
-    @property
-    def packet_id(self):
-        return 0x02
+
+    @classmethod
+    def decode(cls, buffer: BufferedPacket) -> 'SLoginPluginResponse':
+        message_id = buffer.read_varint()
+        successful = buffer.read_bool()
+        data = buffer.read(buffer.length() - buffer.pos())
+        return cls(message_id=message_id, successful=successful, data=data)
     
     def handle(self, p_state: PacketConnectionState) -> None:
         if p_state.unique_message_id != self._message_id:
             raise ValueError('Message ID mismatch')
+        if p_state.forwarding_secret and p_state.state == ConnectionState.LOGIN and p_state.uuid is None:
+            return self._forwarded_login(p_state)
         if not self._successful:
             logger.warning('Login plugin response at login state (id = 0x02) responded with unsuccessful. Aborting.')
             return None
         # TODO: Implement this for custom handshake, however this is not necessary for the notchian client.
         return None
     
+    def _forwarded_login(self, p_state: PacketConnectionState):
+        '''
+        The proxy's answer to the player info request of SLoginStart.
+        '''
+        if not self._successful:
+            raise AuthenticationError('Not connected through a proxy forwarding the player')
+        player = forwarding.read_forwarded_player(p_state.forwarding_secret, bytes(self._data))
+        p_state.forwarded_ip = player.address
+        if p_state.admission and not p_state.admission.allow_login(player.address):
+            raise LoginThrottledError(f'Throttling logins from {player.address}')
+        logger.info(f'{player.username} logged in through the proxy at {p_state.client_ip} from {player.address}', log_thread=False)
+        return _login_success(p_state, player.uuid, player.username, player.properties)
+
     def get_data(self) -> bytes:
         '''
         Call handle() first before calling this method.
         '''
         return self._data
 
-class SLoginAcknowledged(ServerboundPacket):
-    @property
-    def packet_id(self):
-        return 0x03
-    
+class SLoginAcknowledged(ServerboundPacket, state=ConnectionState.LOGIN, packet_id=0x03):
+
     def handle(self, p_state: PacketConnectionState) -> None:
         p_state.state = ConnectionState.CONFIGURATION
         return None
 
-class SCookieResponse(ServerboundPacket):
+class SCookieResponse(ServerboundPacket, state=ConnectionState.LOGIN, packet_id=0x04):
+    route = Route.WORKER
+
     def __init__(self, cookie_identifier: str, payload: bytes):
         self._cookie_identifier = cookie_identifier
         self._payload = payload
 
-    @property
-    def packet_id(self):
-        return 0x04
+    @classmethod
+    def decode(cls, buffer: BufferedPacket) -> 'SCookieResponse':
+        cookie_identifier = buffer.read_utf8_string(32767)
+        payload = buffer.read(buffer.read_varint()) if buffer.read_bool() else None
+        return cls(cookie_identifier, payload)
     
     def handle(self, p_state: PacketConnectionState) -> None:
         return None
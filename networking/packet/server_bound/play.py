@@ -1,11 +1,19 @@
 
 from networking.packet import ServerboundPacket
+from networking.packet.dispatch import Route
+from networking.packet.packet_connection import PacketConnectionState
+from networking.packet.schema import Double, Float, Long, UByte, VarInt
+from networking.protocol import ConnectionState
 
 ###
 # Server Bound Configuration (This is a lot but not as much as the client bound play :D :D :D)
+# Declared in packet id order of protocol 769 (1.21.4), register a packet with its state and id once it is implemented.
 ###
-class SConfirmTeleportation(ServerboundPacket):
-    pass
+class SConfirmTeleportation(ServerboundPacket, state=ConnectionState.PLAY, packet_id=0x00):
+    fields = [('teleport_id', VarInt)]
+
+    def handle(self, p_state: PacketConnectionState) -> None:
+        return None
 
 class SQueryBlockEntityTag(ServerboundPacket):
     pass
@@ -82,23 +90,43 @@ class SInteract(ServerboundPacket):
 class SJigsawGenerate(ServerboundPacket):
     pass
 
-class SKeepAlive(ServerboundPacket):
-    pass
+class SKeepAlive(ServerboundPacket, state=ConnectionState.PLAY, packet_id=0x1A):
+    # Answers Connection.request() on the event loop, the game thread has nothing to add
+    route = Route.LOOP
+    fields = [('keep_alive_id', Long)]
+
+    def handle(self, p_state: PacketConnectionState) -> None:
+        return None
 
 class SLockDifficulty(ServerboundPacket):
     pass
 
-class SPlayerPosition(ServerboundPacket):
-    pass
+class SPlayerPosition(ServerboundPacket, state=ConnectionState.PLAY, packet_id=0x1C):
+    '''
+    flags: 0x01 on ground, 0x02 pushing against a wall.
+    '''
+    fields = [('x', Double), ('y', Double), ('z', Double), ('flags', UByte)]
 
-class SSetPlayerPositionRotation(ServerboundPacket):
-    pass
+    def handle(self, p_state: PacketConnectionState) -> None:
+        return None
 
-class SSetPlayerRotation(ServerboundPacket):
-    pass
+class SSetPlayerPositionRotation(ServerboundPacket, state=ConnectionState.PLAY, packet_id=0x1D):
+    fields = [('x', Double), ('y', Double), ('z', Double), ('yaw', Float), ('pitch', Float), ('flags', UByte)]
 
-class SSetPlayerMovementFlags(ServerboundPacket):
-    pass
+    def handle(self, p_state: PacketConnectionState) -> None:
+        return None
+
+class SSetPlayerRotation(ServerboundPacket, state=ConnectionState.PLAY, packet_id=0x1E):
+    fields = [('yaw', Float), ('pitch', Float), ('flags', UByte)]
+
+    def handle(self, p_state: PacketConnectionState) -> None:
+        return None
+
+class SSetPlayerMovementFlags(ServerboundPacket, state=ConnectionState.PLAY, packet_id=0x1F):
+    fields = [('flags', UByte)]
+
+    def handle(self, p_state: PacketConnectionState) -> None:
+        return None
 
 class SMoveVehicle(ServerboundPacket):
     pass
@@ -4,25 +4,22 @@ from networking.packet import ServerboundPacket, ClientboundPacket
 from networking.protocol import ProtocolVersion
 from networking.packet.packet_connection import PacketConnectionState
 from networking.protocol import ConnectionState
+from networking.data_type import BufferedPacket
 
-class SStatusRequest(ServerboundPacket):
+class SStatusRequest(ServerboundPacket, state=ConnectionState.STATUS, packet_id=0x00):
 
-    @property
-    def packet_id(self):
-        return 0x00
-
-    # TODO: Retrieve info from server logic
     def handle(self, p_state: PacketConnectionState) -> ClientboundPacket:
-        return chandshake.CStatusResponse(ProtocolVersion.MC_1_21_4, 20, 10, [], 'Hello world!', False)
+        status = p_state.server_status
+        return chandshake.CStatusResponse(ProtocolVersion.MC_1_21_4, status.max_players, status.online_players(), [], status.description, False, status.favicon)
     
-class SPingRequest(ServerboundPacket):
+class SPingRequest(ServerboundPacket, state=ConnectionState.STATUS, packet_id=0x01):
 
     def __init__(self, timestamp: int):
         self._timestamp = timestamp
 
-    @property
-    def packet_id(self):
-        return 0x01
+    @classmethod
+    def decode(cls, buffer: BufferedPacket) -> 'SPingRequest':
+        return cls(buffer.read_int64())
     
     def handle(self, p_state: PacketConnectionState) -> ClientboundPacket:
         p_state.state = ConnectionState.CLOSE
@@ -1,95 +1,211 @@
 
+import itertools
+import os
 import socket
 import threading
 import struct
+import zlib
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Callable
 
 from cryptography.hazmat.primitives.ciphers import CipherContext
 
 import networking.packet as packet
+# Serverbound packet modules register their decoders on import
 from networking.packet.server_bound import handshake as s_handshake
 from networking.packet.server_bound import status as s_status
 from networking.packet.server_bound import login as s_login
 from networking.packet.server_bound import configuration as s_config
+from networking.packet.server_bound import play as s_play
+from networking.packet import registry
 from networking.packet.packet_connection import PacketConnectionState
 
 from networking.data_type import ByteBuffer, BufferedPacket
+from networking.packet import frame_body
+from networking.varint import decode_varint
 from core.logger import logger
-from networking.protocol import ConnectionState, ProtocolVersion
 from networking.exception import ProtocolError, DataCorruptedError
 
+_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+class ReceiveBuffer:
+    '''
+    Preallocated, growable arena for inbound socket data.
+    The socket writes straight into the free tail with recv_into(), and reads hand out memoryview slices without copying.
+    Unread bytes are moved back to the front only when the tail runs out of room, and the arena grows only when compaction is not enough.
+    A view returned by read() or peek() stays valid until the next call to writable().
+    '''
+
+    def __init__(self, capacity: int = 16384):
+        self._data = bytearray(capacity)
+        self._view = memoryview(self._data)
+        self._read_index = 0
+        self._write_index = 0
+
+    def __len__(self):
+        return self._write_index - self._read_index
+
+    def __getitem__(self, index: int) -> int:
+        '''
+        Byte at the given offset from the read index. Nothing is consumed.
+        '''
+        return self._data[self._read_index + index]
+
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def writable(self, min_size: int) -> memoryview:
+        '''
+        Returns the free tail of the arena, at least min_size bytes long.
+        Call commit() with the number of bytes actually written to it.
+        '''
+        if len(self._data) - self._write_index >= min_size:
+            return self._view[self._write_index:]
+        unread = self._write_index - self._read_index
+        if len(self._data) - unread >= min_size:
+            # Compaction, only the unread bytes are moved
+            self._data[:unread] = self._data[self._read_index:self._write_index]
+        else:
+            capacity = len(self._data) * 2
+            while capacity - unread < min_size:
+                capacity *= 2
+            data = bytearray(capacity)
+            data[:unread] = self._view[self._read_index:self._write_index]
+            self._view.release()
+            self._data = data
+            self._view = memoryview(self._data)
+        self._read_index = 0
+        self._write_index = unread
+        return self._view[self._write_index:]
+
+    def commit(self, size: int):
+        self._write_index += size
+
+    def peek(self, size: int) -> memoryview:
+        size = min(size, len(self))
+        return self._view[self._read_index:self._read_index + size]
+
+    def read(self, size: int) -> memoryview:
+        data = self.peek(size)
+        self._read_index += len(data)
+        if self._read_index == self._write_index:
+            # Drained, start over from the front without moving anything
+            self._read_index = 0
+            self._write_index = 0
+        return data
+
+    def peek_varint(self) -> tuple:
+        '''
+        Returns (value, size) of the VarInt at the read index without consuming it.
+
+        Raises:
+            struct.error: When the buffered data ends before the VarInt does
+        '''
+        value, end = decode_varint(self._data, self._read_index, self._write_index)
+        return value, end - self._read_index
+
+    def clear(self):
+        self._read_index = 0
+        self._write_index = 0
+
 class ConnectionInputStream:
+    '''
+    Inbound byte stream of a connection.
+    This is driven by the event loop, fill() is called whenever the socket becomes readable.
+    '''
+    RECV_SIZE = 16384
+
     def __init__(self, socket: socket.socket, p_state: PacketConnectionState, byte_order='big'):
         self._byte_order = byte_order
 
-        self._buffer = ByteBuffer(byte_order=self._byte_order)
+        self._buffer = ReceiveBuffer()
         '''
         Do not touch this
         '''
 
         self._socket = socket
-        self._input_thread_event = threading.Event()
         self._buffer_lock = threading.Lock()
-        self._available = 0
         self._p_state = p_state
 
-        # Start read thread
-        self._socket.settimeout(0.1)
-        self._input_thread = threading.Thread(target=self._read_data, name=f'ConnectionListener-{p_state.connection_id}-InputStream')
-        self._input_thread.start()
-        
-
     def _byte_order_notation(self):
         return '<' if self._byte_order == 'little' else '>'
     
-    def _read_data(self):
+    def fill(self) -> bool:
         '''
-        This is running in a separate thread to read data from the socket
+        Reads data currently available on the socket without blocking.
+        Data is received and decrypted in place, straight into the receive buffer.
+        Returns False when the client has closed the connection.
         '''
-        while not self._input_thread_event.is_set():
+        with self._buffer_lock:
+            # CFB8 decryption in place needs room for one extra block
+            tail = self._buffer.writable(self.RECV_SIZE + 15)
             try:
-                data = self._socket.recv(1024)
-            except socket.timeout:
-                continue
-            if not data:
-                continue
+                size = self._socket.recv_into(tail, self.RECV_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return True
+            if size == 0:
+                return False
             with self._p_state.encryption_lock:
                 if self._p_state.encrypted:
                     cipher: CipherContext = self._p_state.decrypt_cipher
-                    data = cipher.update(data)
-            logger.debug(f'Received {data}')
-            with self._buffer_lock:
-                new_buffer = ByteBuffer(byte_order='big')
-                old_buffer_data = self._buffer.buffer.copy()[self._buffer.position:]
-                new_buffer.wrap(old_buffer_data, auto_flip=False)
-                new_buffer.write(data)
-                new_buffer.flip()
-                self._buffer = new_buffer
-                self._available = self._buffer.buffer_size
+                    cipher.update_into(tail[:size], tail)
+            self._buffer.commit(size)
+        logger.debug(f'Received {size} bytes')
+        return True
     
+    def feed(self, data: bytes):
+        '''
+        Buffers bytes received from the socket before this stream took it over, ahead of anything fill() reads.
+        '''
+        with self._buffer_lock:
+            self._buffer.writable(len(data))[:len(data)] = data
+            self._buffer.commit(len(data))
+
     def available(self):
         with self._buffer_lock:
-            return self._available
+            return len(self._buffer)
         
-    def read(self, size: int):
+    def read(self, size: int) -> memoryview:
+        '''
+        Returned view is only valid until the next fill().
+        '''
         with self._buffer_lock:
-            data = self._buffer.read(size)
-            self._available = self._available - len(data)
-            return data
+            return self._buffer.read(size)
 
     def close(self):
-        self._input_thread_event.set()
-        self._input_thread.join()
+        with self._buffer_lock:
+            self._buffer.clear()
 
 class ConnectionOutputStream:
     '''
     * There is no need to call close() for output stream
+    Outbound bytes are queued as segments and sent with as few sendmsg() calls as the socket allows.
+    Small pieces are copied into one arena per connection, so a burst of packets becomes a single segment.
+    Large pieces that need no encryption are queued as they are, without copying.
+    Unsent tails stay queued for the next flush.
+    '''
+    COMPACT_THRESHOLD = 65536
+    '''
+    Arena size from which a lagging connection starts a fresh arena instead of growing the one still being sent.
+    '''
+    GATHER_THRESHOLD = 2048
     '''
+    Pieces of at least this many bytes are sent from their own memory rather than copied into the arena.
+    '''
+    MAX_SEGMENTS = min(os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') else 1024, 1024)
+
     def __init__(self, socket: socket.socket, byte_order='big'):
         self._byte_order = byte_order
-        self._buffer = ByteBuffer(byte_order=self._byte_order)
+        self._buffer = ByteBuffer(byte_order=self._byte_order, capacity=16384)
+        # Arena bytes before this offset are already queued as a segment
+        self._sealed = 0
+        self._segments = deque()
         self._socket = socket
         self._output_thread_event = threading.Event()
         self._buffer_lock = threading.Lock()
+        self.send_calls = 0
+        self.bytes_sent = 0
 
     def _byte_order_notation(self):
         return '<' if self._byte_order == 'little' else '>'
@@ -97,157 +213,291 @@ class ConnectionOutputStream:
     def write(self, data: bytes):
         with self._buffer_lock:
             self._buffer.write(data)
-    
-    def flush(self):
+
+    @property
+    def queued_bytes(self) -> int:
+        '''
+        Bytes written that the socket has not taken yet.
+        '''
+        with self._buffer_lock:
+            return self._buffer.buffer_size - self._sealed + sum(map(len, self._segments))
+
+    def _write_segment(self, data):
+        '''
+        Queues data without copying it, behind everything written so far. The caller must not modify it afterwards.
+        Caller holds the buffer lock.
+        '''
+        self._seal()
+        self._segments.append(memoryview(data).cast('B'))
+
+    def _seal(self):
+        end = self._buffer.buffer_size
+        if end > self._sealed:
+            self._segments.append(self._buffer.buffer[self._sealed:end])
+            self._sealed = end
+
+    def flush(self) -> bool:
+        '''
+        Sends as much of the queued data as the socket accepts without blocking, gathering segments into one sendmsg() call.
+        Bytes the socket did not take stay queued for the next flush.
+        Returns True when everything has been sent.
+        '''
         with self._buffer_lock:
-            self._buffer.flip()
-            data = self._buffer.read(self._buffer.buffer_size)
-            self._socket.send(data)
-            self._buffer = ByteBuffer(byte_order=self._byte_order)
+            self._seal()
+            segments = self._segments
+            while segments:
+                batch = min(len(segments), self.MAX_SEGMENTS) if _SENDMSG else 1
+                size = sum(map(len, itertools.islice(segments, batch)))
+                try:
+                    if batch == 1:
+                        sent = self._socket.send(segments[0])
+                    else:
+                        sent = self._socket.sendmsg(itertools.islice(segments, batch))
+                except (BlockingIOError, InterruptedError):
+                    sent = 0
+                self.send_calls += 1
+                self.bytes_sent += sent
+                if sent == size:
+                    for _ in range(batch):
+                        segments.popleft()
+                    continue
+                while sent >= len(segments[0]):
+                    sent -= len(segments.popleft())
+                segments[0] = segments[0][sent:]
+                break
+            if not segments:
+                # Nothing references the arena anymore, reuse it from the front
+                self._buffer.clear()
+                self._sealed = 0
+                return True
+            if self._sealed >= self.COMPACT_THRESHOLD:
+                # The client keeps lagging behind, the queued segments keep the old arena alive until they are sent
+                self._buffer = ByteBuffer(byte_order=self._byte_order, capacity=16384)
+                self._sealed = 0
+            return False
 
 class MCPacketInputStream(ConnectionInputStream):
+    MAX_DATA_LENGTH = 8388608
+    '''
+    Largest uncompressed packet a client may announce, same as the notchian server (2^23).
+    '''
+
     def __init__(self, socket: socket.socket, p_state: PacketConnectionState):
         super().__init__(socket, p_state=p_state)
     
     def read_packet(self, p_state: PacketConnectionState) -> packet.ServerboundPacket:
         '''
         All client initiated packet flow is handled here !!!
+        Frames are decoded by the packet class registered for the current state and packet id, see networking.packet.registry.
+        Packets without a registered decoder are skipped.
         TODO: Implement all packet types <- IN PROGRESS
         TODO: Implement better error handling
-        TODO:   
-            The notchian server (but not client) rejects compressed packets smaller than the threshold. 
-            Uncompressed packets exceeding the threshold, however, are accepted.
+        Like the notchian server, compressed packets smaller than the threshold are rejected,
+        while uncompressed packets exceeding the threshold are accepted.
 
         Raises:
             ProtocolError: When an incoming packet is invalid in some way
             DataCorruptedError: When the incoming packet is corrupted at lower level
+
+        Returns None when no complete packet is buffered yet, or the packet is not supported.
+        Read deadlines are enforced by the connection, see Connection.READ_TIMEOUTS.
         '''
-        # TODO: Implement timeout
-        while self.available() == 0:
-            pass
-        length = self.read_varint()
-        if length > self.available():
-            logger.warning(f'Packet length {length} exceeds available data {self.available()}')
-            self.read(length)
+        if not self.frame_available():
             return None
+        length = self.read_varint()
         content = self.read(length)
+        if p_state.compress_threshold >= 0:
+            content = self._decompress(content, p_state.compress_threshold)
 
-        # packets at this point maybe compressed <- FIXED: Compressed packets are handled in the packet class
         # never call self.read() beyond this point
         secured_packet = BufferedPacket(byte_order='big')
         secured_packet.wrap(content, auto_flip=True)
-        
-        ### State.Handshake ###
-        if p_state.state == ConnectionState.HANDSHAKE:
-            if secured_packet.read_varint() != 0x00:
-                raise ProtocolError('Invalid packet id')
+        try:
+            packet_id = secured_packet.read_varint()
+        except struct.error:
+            raise DataCorruptedError('Packet is missing its packet id')
+        decoders = registry.DECODERS[p_state.state.value]
+        decoder = decoders[packet_id] if 0 <= packet_id < registry.MAX_PACKET_ID else None
+        if decoder is None:
+            # The whole frame is consumed already, so an unsupported packet costs nothing more
+            logger.debug(f'Skipped unsupported packet {packet_id:#04x} in {p_state.state.name} state')
+            return None
+        try:
+            return decoder.decode(secured_packet)
+        except (struct.error, ValueError, IndexError) as e:
+            raise DataCorruptedError(f'Error while reading {decoder.__name__}: {e}')
+    
+    def _decompress(self, content: memoryview, threshold: int):
+        '''
+        Unwraps a frame sent after Set Compression into Packet ID and Data.
+        '''
+        try:
+            data_length, offset = decode_varint(content)
+        except struct.error:
+            raise DataCorruptedError('Compressed packet is missing its data length')
+        if data_length == 0:
+            return content[offset:]
+        if data_length < threshold:
+            raise ProtocolError(f'Badly compressed packet - size of {data_length} is below server threshold of {threshold}')
+        if data_length > self.MAX_DATA_LENGTH:
+            raise ProtocolError(f'Badly compressed packet - size of {data_length} is larger than protocol maximum of {self.MAX_DATA_LENGTH}')
+        # Cannot be reset once at eof, and a fresh one is cheaper than copying a pristine one. See tests/bench_compression.py.
+        decompressor = zlib.decompressobj()
+        try:
+            # Never inflate past the announced size, whatever the stream claims
+            data = decompressor.decompress(content[offset:], data_length)
+        except zlib.error as e:
+            raise DataCorruptedError(f'Error while decompressing packet: {e}')
+        if len(data) != data_length or not decompressor.eof:
+            raise DataCorruptedError(f'Decompressed packet does not match its data length of {data_length}')
+        return data
+
+    def frame_available(self) -> bool:
+        '''
+        Whether a complete length prefixed frame is buffered.
+        Nothing is consumed from the stream.
+        '''
+        with self._buffer_lock:
             try:
-                handshaking_packet = s_handshake.SHandshake(
-                    protocol_version=ProtocolVersion.from_protocol_version(secured_packet.read_varint()), 
-                    server_address=secured_packet.read_utf8_string(256), 
-                    server_port=secured_packet.read_uint16(), 
-                    next_state=secured_packet.read_varint()
-                )
-            except Exception as e:
-                raise DataCorruptedError(f'Error while reading handshake packet: {e}')
-            return handshaking_packet
-
-        ### Status ###
-        elif p_state.state == ConnectionState.STATUS:
-            id = secured_packet.read_varint()
-            if id == 0x00: # Status Request
-                return s_status.SStatusRequest()
-            elif id == 0x01: # Status Ping
-                payload = secured_packet.read_int64()
-                return s_status.SPingRequest(payload)
-            else:
-                raise Exception('Invalid packet id')
-        
-        ### Login ###
-        elif p_state.state == ConnectionState.LOGIN:
-            id = secured_packet.read_varint()
-            if id == 0x00: # Login Start
-                return s_login.SLoginStart(
-                    secured_packet.read_utf8_string(16), 
-                    secured_packet.read_uuid()
-                )
-            elif id == 0x01: # Encryption Response
-                shared_secret_length = secured_packet.read_varint()
-                shared_secret = secured_packet.read(shared_secret_length)
-                verify_token_length = secured_packet.read_varint()
-                verify_token = secured_packet.read(verify_token_length)
-                return s_login.SEncryptionResponse(shared_secret, verify_token)
-            elif id == 0x02: # Login Plugin Response
-                message_id = secured_packet.read_varint()
-                successful = secured_packet.read_bool()
-                payload = secured_packet.read(secured_packet.length() - secured_packet.pos())
-                return s_login.SLoginPluginResponse(
-                    message_id=message_id,
-                    successful=successful,
-                    data=payload
-                )
-            elif id == 0x03: # Login acknowledged
-                return s_login.SLoginAcknowledged()
-            else:
-                raise Exception('Invalid packet id')
-        
-        ### State.Configuration ###
-        elif p_state.state == ConnectionState.CONFIGURATION:
-            id = secured_packet.read_varint()
-            if id == 0x00: # Client Information
-                return s_config.SClientInformation(
-                    locale=secured_packet.read_utf8_string(16),
-                    view_distance=secured_packet.read_int8(),
-                    chat_mode=secured_packet.read_varint(),
-                    chat_colors=secured_packet.read_bool(),
-                    displayed_skin_parts=secured_packet.read_uint8(),
-                    main_hand=secured_packet.read_varint(),
-                    enable_text_filtering=secured_packet.read_bool(),
-                    allow_server_listings=secured_packet.read_bool()
-                )
-            elif id == 0x02: # Plugin Message
-                channel = secured_packet.read_utf8_string(32767)
-                data = secured_packet.read(secured_packet.length() - secured_packet.pos())
-                logger.debug(f'Plugin message received: {channel}')
-                return s_config.SPluginMessage(channel, data)
-            elif id == 0x03: # Finish Configuration Acknowledged
-                # Client state switches to PLAY state
-                return s_config.SFinishConfigurationAcknowledged()
-            else:
-                raise Exception(f'Not implemented: {id}')
-        
-        ### State.Play ###
-        elif p_state.state == ConnectionState.PLAY:
-            pass
+                length, size = self._buffer.peek_varint()
+            except struct.error:
+                # Frame length is a VarInt of at most 3 bytes
+                if len(self._buffer) >= 3:
+                    raise ProtocolError('Frame length is too big')
+                return False
+            if size > 3:
+                raise ProtocolError('Frame length is too big')
+            return len(self._buffer) - size >= length
 
-        ### Unknown State ###
-        else:
-            raise Exception('Invalid state')
-    
     def read_varint(self):
-        result = 0
-        shift = 0
-        while True:
-            b = struct.unpack(f'{self._byte_order_notation()}B', self.read(1))[0]
-            result |= (b & 127) << shift
-            shift += 7
-            if not b & 128:
-                break
-        return result
+        with self._buffer_lock:
+            value, size = self._buffer.peek_varint()
+            self._buffer.read(size)
+        return value
         
 class MCPacketOutputStream(ConnectionOutputStream):
+    OFFLOAD_THRESHOLD = 16384
+    '''
+    Compressed packets with a body of at least this many bytes are framed on the frame pool instead of the event loop.
+    '''
 
-    def __init__(self, socket: socket.socket, p_state: PacketConnectionState):
+    def __init__(self, socket: socket.socket, p_state: PacketConnectionState, frame_pool: Executor = None, on_frame_ready: Callable = None):
+        '''
+        Parameters:
+        frame_pool (Executor): Shared workers compressing large packets. Without one, every packet is framed inline.
+        on_frame_ready (Callable): Called from a worker thread once offloaded frames have reached the arena and can be flushed.
+        '''
         super().__init__(socket)
         self._p_state = p_state
-        self._buffer = BufferedPacket(byte_order='big')
+        self._frame_pool = frame_pool
+        self._on_frame_ready = on_frame_ready
+        self._pending = deque()
+        # Body bytes of frames still on the frame pool
+        self._offloaded_bytes = 0
+        # Raised by the first frame that failed on the frame pool. Nothing reaches the arena after it, the connection has to close.
+        self.error: Exception = None
+
+    @property
+    def queued_bytes(self) -> int:
+        '''
+        Bytes the socket has not taken yet, counting packets still being compressed at their uncompressed size.
+        '''
+        with self._buffer_lock:
+            return self._buffer.buffer_size - self._sealed + sum(map(len, self._segments)) + self._offloaded_bytes
+
+    @property
+    def pending(self) -> bool:
+        '''
+        Whether packets are still being framed and have not reached the arena yet.
+        '''
+        with self._buffer_lock:
+            return bool(self._pending)
 
     def write_packet(self, packet: packet.ClientboundPacket):
-        buffered_packet = packet.get_bytes(p_state=self._p_state)
-        packet_length = buffered_packet.buffer_size
-        packet_content = buffered_packet.read(packet_length)
-        with self._p_state.encryption_lock:
-            if self._p_state.encrypted:
+        '''
+        Frames the packet straight into the output arena.
+        Each piece of the frame is copied exactly once, and encrypted on the way in when encryption is enabled.
+        Packets are compressed once the connection has sent Set Compression.
+
+        The body is always serialized here, since encode_body() may update the connection state.
+        '''
+        # Read before encoding, Set Compression itself still goes out uncompressed
+        threshold = self._p_state.compress_threshold
+        self.write_body(packet.packet_id, packet.encode_body(self._p_state), threshold)
+
+    def write_body(self, packet_id: int, body, compression_threshold: int = None):
+        '''
+        Frames a packet body serialized earlier, such as one held back by the packet scheduler.
+        Large compressed packets are deflated on the frame pool, the GIL is released while zlib runs so several connections compress in parallel.
+        Frames reach the arena strictly in write order regardless, as CFB8 encryption is stateful.
+        '''
+        threshold = self._p_state.compress_threshold if compression_threshold is None else compression_threshold
+        if self._frame_pool and threshold >= 0 and len(body) >= self.OFFLOAD_THRESHOLD:
+            frame = self._frame_pool.submit(frame_body, packet_id, body, threshold, self._p_state.compression_level)
+            # Set before the frame is queued, a _drain for an earlier frame may reach it right away
+            frame.body_size = len(body)
+            with self._buffer_lock:
+                self._pending.append(frame)
+                self._offloaded_bytes += len(body)
+            frame.add_done_callback(self._on_frame_done)
+            return
+        frame = frame_body(packet_id, body, threshold, self._p_state.compression_level)
+        with self._buffer_lock:
+            self._pending.append(frame)
+        self._drain()
+
+    def write_frame(self, frame: list):
+        '''
+        Queues a packet framed elsewhere, such as a SharedFrame of a broadcast, behind the packets already written.
+        The pieces are only read, encryption copies them into the arena.
+        '''
+        with self._buffer_lock:
+            self._pending.append(frame)
+        self._drain()
+
+    def _on_frame_done(self, future: Future):
+        self._drain()
+        if self._on_frame_ready and not future.cancelled():
+            self._on_frame_ready()
+
+    def _drain(self):
+        '''
+        Moves every frame at the head of the queue that is ready into the arena, stopping at the first one still being compressed.
+        Encryption state is read here, it only changes at login before compression is enabled, so no offloaded frame straddles it.
+        A frame that failed drops itself and everything queued behind it, and sets error.
+        '''
+        with self._buffer_lock, self._p_state.encryption_lock:
+            if self.error:
+                self._pending.clear()
+                return
+            while self._pending:
+                frame = self._pending[0]
+                if isinstance(frame, Future):
+                    if frame.cancelled():
+                        # The frame pool is shutting down with the connection
+                        self._pending.clear()
+                        return
+                    if not frame.done():
+                        return
+                    self._offloaded_bytes -= frame.body_size
+                    if frame.exception():
+                        # Skipping it would leave a gap in the stream, later frames must not go out either
+                        self.error = frame.exception()
+                        self._pending.clear()
+                        self._offloaded_bytes = 0
+                        return
+                    frame = frame.result()
+                self._pending.popleft()
+                if not self._p_state.encrypted:
+                    for piece in frame:
+                        if len(piece) >= self.GATHER_THRESHOLD:
+                            self._write_segment(piece)
+                        else:
+                            self._buffer.write(piece)
+                    continue
                 cipher: CipherContext = self._p_state.encrypt_cipher
-                packet_content = cipher.update(packet_content)
-        self.write(packet_content)
\ No newline at end of file
+                for piece in frame:
+                    size = len(piece)
+                    # update_into() needs room for one extra block
+                    cipher.update_into(piece, self._buffer.writable(size + 15))
+                    self._buffer.commit(size)
@@ -0,0 +1,281 @@
+'''
+What the multiplayer server list shows about the server, and the fast path answering its pings.
+
+Server lists ping every server they show, over and over, on fresh connections.
+StatusResponder answers those right where they are accepted, from a response serialized once and cached,
+and hands every other connection, those logging in, over to a full Connection.
+'''
+import base64
+import json
+import selectors
+import socket
+import struct
+import time
+from pathlib import Path
+from typing import Callable
+
+from core.logger import logger
+from networking.exception import DataCorruptedError
+from networking.protocol import ProtocolVersion
+from networking.varint import decode_varint, encode_varint
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def read_favicon(path) -> bytes:
+    '''
+    Returns the PNG image at path, None when there is no such file. The client expects 64x64 pixels.
+
+    Raises:
+        ValueError: When the file is not a PNG image
+    '''
+    path = Path(path)
+    if not path.is_file():
+        return None
+    favicon = path.read_bytes()
+    if not favicon.startswith(PNG_SIGNATURE):
+        raise ValueError(f'{path} is not a PNG image')
+    return favicon
+
+
+class ServerStatus:
+    '''
+    Shared by every connection of a listener, read by the Status Request handler.
+    online_players counts logged in players, which a cluster worker points at the count of the whole cluster.
+
+    The framed Status Response is serialized once and reused for every ping, see response_frame().
+    '''
+    TTL = 1.0
+    '''
+    Seconds a cached response is served before online_players is asked again.
+    '''
+
+    def __init__(self, max_players: int = 20, description: str = 'Hello world!', online_players: Callable[[], int] = None, favicon: bytes = None):
+        self.max_players = max_players
+        self.description = description
+        self.online_players = online_players or (lambda: 0)
+        self.favicon = favicon
+        # (expiry, fields the frame was built from, frame), replaced as a whole so loops on other threads never see half of it
+        self._cache = (0.0, None, None)
+
+    def response(self, online_players: int = None) -> dict:
+        '''
+        The JSON object of the Status Response.
+        '''
+        version = ProtocolVersion.MC_1_21_4
+        response = {
+            'version': {'name': version.to_mc_version(), 'protocol': version.value},
+            'players': {'max': self.max_players, 'online': self.online_players() if online_players is None else online_players, 'sample': []},
+            'description': {'text': self.description},
+        }
+        if self.favicon:
+            response['favicon'] = 'data:image/png;base64,' + base64.b64encode(self.favicon).decode('ascii')
+        return response
+
+    def response_frame(self) -> bytes:
+        '''
+        The Status Response as framed on the wire, status state is neither compressed nor encrypted.
+        Within TTL seconds of the last check the cached frame is returned as is.
+        Past it the player count is read again, and the frame is only serialized again when something it shows changed.
+        '''
+        expiry, key, frame = self._cache
+        now = time.monotonic()
+        if now < expiry:
+            return frame
+        online = self.online_players()
+        fields = (self.max_players, online, self.description, self.favicon)
+        if fields != key:
+            data = json.dumps(self.response(online)).encode('utf-8')
+            body = b'\x00' + encode_varint(len(data)) + data
+            frame = encode_varint(len(body)) + body
+        self._cache = (now + self.TTL, fields, frame)
+        return frame
+
+
+class StatusResponder:
+    '''
+    Serves the handshake, status request and ping of a freshly accepted socket on an event loop, without a Connection.
+    Its whole state is the bytes received and not yet sent, so a flood of server list pings costs little more than the sockets.
+
+    A handshake for anything but status, or anything it does not understand such as a legacy ping,
+    is handed over as is to handover(sock, address, loop, received, next_state), which sets up a full Connection.
+    next_state is 0 when there was no handshake to read. on_close() is called when the responder closed the socket itself instead.
+    '''
+    __slots__ = ('status', 'sock', 'address', 'loop', 'handover', 'on_close', 'read_timeouts', '_received', '_unsent', '_status_state', '_timer', '_closing', 'closed', '__weakref__')
+
+    MAX_HANDSHAKE = 1024
+    '''
+    A handshake is a few hundred bytes at most, anything longer goes to the full Connection to be rejected there.
+    '''
+
+    def __init__(self, status: ServerStatus, sock: socket.socket, address, loop, handover: Callable, read_timeouts: tuple = (10.0, 15.0), on_close: Callable = None):
+        '''
+        Parameters:
+        read_timeouts (tuple): Seconds to complete the handshake, then the ping, before the socket is closed.
+        '''
+        self.status = status
+        self.sock = sock
+        self.address = address
+        self.loop = loop
+        self.handover = handover
+        self.on_close = on_close
+        self.read_timeouts = read_timeouts
+        self._received = b''
+        self._unsent = b''
+        self._status_state = False
+        self._timer = None
+        self._closing = False
+        self.closed = False
+
+    def start(self):
+        '''
+        Thread safe.
+        '''
+        self.loop.call_soon(self._on_attach)
+
+    def _on_attach(self):
+        self.sock.setblocking(False)
+        self.loop.register(self.sock, selectors.EVENT_READ, self._on_event)
+        self._timer = self.loop.call_timeout(self.read_timeouts[0], self._on_timeout)
+
+    def _on_timeout(self):
+        self._timer = None
+        logger.debug(f'Read timed out in {"STATUS" if self._status_state else "HANDSHAKE"} state')
+        self.close()
+
+    def _on_event(self, mask: int):
+        try:
+            if mask & selectors.EVENT_READ:
+                self._on_readable()
+            if mask & selectors.EVENT_WRITE and not self.closed:
+                self._send(b'')
+        except OSError as e:
+            logger.debug(f'Connection lost: {e}')
+            self.close()
+
+    def _on_readable(self):
+        try:
+            data = self.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            # Spurious readiness, nothing to read after all
+            return
+        if not data:
+            self.close()
+            return
+        if self._closing:
+            return
+        self._received += data
+        if not self._status_state:
+            next_state = self._handshake()
+            if next_state is None:
+                return
+            if next_state != 1:
+                self._hand_over(next_state)
+                return
+            self._status_state = True
+            self._timer.cancel()
+            self._timer = self.loop.call_timeout(self.read_timeouts[1], self._on_timeout)
+        self._status()
+
+    def _handshake(self) -> int:
+        '''
+        Returns the next state of the handshake once it is complete, None while it is not.
+        Returns 0, to have it handed over, when this is no handshake it can read. Only a status handshake is consumed.
+        '''
+        received = self._received
+        try:
+            length, offset = decode_varint(received)
+        except struct.error:
+            return None
+        except DataCorruptedError:
+            return 0
+        end = offset + length
+        if length > self.MAX_HANDSHAKE:
+            return 0
+        if len(received) < end:
+            return None
+        try:
+            # Packet id, protocol version, server address, server port, next state
+            packet_id, position = decode_varint(received, offset, end)
+            _, position = decode_varint(received, position, end)
+            address_length, position = decode_varint(received, position, end)
+            next_state, position = decode_varint(received, position + max(address_length, 0) + 2, end)
+        except (struct.error, DataCorruptedError):
+            return 0
+        if packet_id != 0x00 or position != end:
+            return 0
+        if next_state == 1:
+            self._received = received[end:]
+        return next_state
+
+    def _status(self):
+        '''
+        Answers the status request and ping buffered, closing once the pong is sent.
+        '''
+        received = self._received
+        response = []
+        while received:
+            try:
+                length, offset = decode_varint(received)
+            except struct.error:
+                break
+            except DataCorruptedError:
+                self.close()
+                return
+            if len(received) - offset < length:
+                break
+            frame, received = received[offset:offset + length], received[offset + length:]
+            if frame == b'\x00':
+                response.append(self.status.response_frame())
+            elif len(frame) == 9 and frame[0] == 0x01:
+                response.append(b'\x09' + frame)
+                self._closing = True
+                break
+            else:
+                logger.debug('Invalid packet received in STATUS state')
+                self.close()
+                return
+        self._received = received
+        if response:
+            self._send(b''.join(response))
+
+    def _send(self, data: bytes):
+        writing = bool(self._unsent)
+        self._unsent += data
+        try:
+            sent = self.sock.send(self._unsent) if self._unsent else 0
+        except (BlockingIOError, InterruptedError):
+            # Send buffer full, the rest goes once the socket is writable
+            sent = 0
+        self._unsent = self._unsent[sent:]
+        if self._unsent:
+            if not writing:
+                self.loop.modify(self.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, self._on_event)
+            return
+        if self._closing:
+            self.close()
+        elif writing:
+            self.loop.modify(self.sock, selectors.EVENT_READ, self._on_event)
+
+    def _hand_over(self, next_state: int):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self.loop.unregister(self.sock)
+        self.closed = True
+        self.handover(self.sock, self.address, self.loop, self._received, next_state)
+
+    def close(self):
+        '''
+        Must be called on the loop thread, or once the loop stopped.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self.loop.unregister(self.sock)
+        self.sock.close()
+        if self.on_close:
+            self.on_close()
@@ -0,0 +1,132 @@
+'''
+VarInt and VarLong codec.
+https://minecraft.wiki/w/Java_Edition_protocol/Data_types#VarInt_and_VarLong
+
+Decoders read straight from any bytes-like object at an offset and return (value, new_offset).
+Encoders return the encoded bytes, or write them into a caller supplied buffer and return the new offset.
+'''
+import struct
+
+from networking.exception import DataCorruptedError
+
+VARINT_MAX_SIZE = 5
+VARLONG_MAX_SIZE = 10
+
+_TABLE_LIMIT = 1 << 14
+
+def _encode_unsigned(unsigned: int) -> bytes:
+    out = bytearray()
+    while True:
+        temp = unsigned & 0x7F
+        unsigned >>= 7
+        if unsigned:
+            out.append(temp | 0x80)
+        else:
+            out.append(temp)
+            return bytes(out)
+
+_TABLE = [_encode_unsigned(value) for value in range(_TABLE_LIMIT)]
+'''
+Encoded form of every value below 2^14, which covers packet ids, lengths of most packets, palette indices and entity ids of a young world.
+'''
+
+def varint_size(value: int) -> int:
+    unsigned = value & 0xFFFFFFFF
+    if unsigned < _TABLE_LIMIT:
+        return 1 if unsigned < 0x80 else 2
+    return (unsigned.bit_length() + 6) // 7
+
+def encode_varint(value: int) -> bytes:
+    if 0 <= value < _TABLE_LIMIT:
+        return _TABLE[value]
+    if value < -2147483648 or value > 2147483647:
+        raise ValueError('Int value out of range')
+    return _encode_unsigned(value & 0xFFFFFFFF)
+
+def encode_varlong(value: int) -> bytes:
+    if 0 <= value < _TABLE_LIMIT:
+        return _TABLE[value]
+    if value < -9223372036854775808 or value > 9223372036854775807:
+        raise ValueError('Long value out of range')
+    return _encode_unsigned(value & 0xFFFFFFFFFFFFFFFF)
+
+def write_varint(buffer: bytearray, offset: int, value: int) -> int:
+    '''
+    Writes the VarInt into buffer at offset and returns the offset right after it.
+    The buffer must have room for VARINT_MAX_SIZE bytes, it is never resized.
+    '''
+    data = encode_varint(value)
+    end = offset + len(data)
+    buffer[offset:end] = data
+    return end
+
+def encode_varints(values) -> bytes:
+    '''
+    Encodes a sequence of VarInts back to back, such as a palette or a list of entity ids.
+    '''
+    table = _TABLE
+    limit = _TABLE_LIMIT
+    return b''.join([table[value] if 0 <= value < limit else encode_varint(value) for value in values])
+
+def _decode(buffer, offset: int, limit: int, max_shift: int) -> tuple:
+    if offset >= limit:
+        raise struct.error('VarInt is truncated')
+    b = buffer[offset]
+    if b < 0x80:
+        return b, offset + 1
+    result = b & 0x7F
+    shift = 7
+    position = offset + 1
+    while True:
+        if position >= limit:
+            raise struct.error('VarInt is truncated')
+        b = buffer[position]
+        position += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, position
+        shift += 7
+        if shift >= max_shift:
+            raise DataCorruptedError('VarInt is too big')
+
+def decode_varint(buffer, offset: int = 0, limit: int = None) -> tuple:
+    '''
+    Decodes the VarInt at offset and returns (value, new_offset).
+    Nothing at or past limit is read, limit defaults to the end of the buffer.
+
+    Raises:
+        struct.error: When the buffer ends before the VarInt does
+        DataCorruptedError: When the VarInt is longer than 5 bytes
+    '''
+    result, position = _decode(buffer, offset, len(buffer) if limit is None else limit, 7 * VARINT_MAX_SIZE)
+    result &= 0xFFFFFFFF
+    if result & 0x80000000:
+        result -= 0x100000000
+    return result, position
+
+def decode_varlong(buffer, offset: int = 0, limit: int = None) -> tuple:
+    '''
+    Same as decode_varint() for VarLongs of at most 10 bytes.
+    '''
+    result, position = _decode(buffer, offset, len(buffer) if limit is None else limit, 7 * VARLONG_MAX_SIZE)
+    result &= 0xFFFFFFFFFFFFFFFF
+    if result & 0x8000000000000000:
+        result -= 0x10000000000000000
+    return result, position
+
+def decode_varints(buffer, n: int, offset: int = 0, limit: int = None) -> tuple:
+    '''
+    Decodes n VarInts written back to back and returns (values, new_offset).
+    '''
+    if limit is None:
+        limit = len(buffer)
+    values = []
+    append = values.append
+    for _ in range(n):
+        if offset < limit and buffer[offset] < 0x80:
+            append(buffer[offset])
+            offset += 1
+        else:
+            value, offset = decode_varint(buffer, offset, limit)
+            append(value)
+    return values, offset
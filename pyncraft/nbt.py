@@ -32,7 +32,7 @@ def write_nbt(tag: 'NBTBase', compressed: bool=True) -> bytes:
         with GzipFile(fileobj=buffer, mode='wb') as gz:
             gz.write(data)
         return buffer.getvalue()
-    return tag.to_payload().buffer
+    return bytes(tag.to_payload().buffer)
 
 _tag_registry = {}
 
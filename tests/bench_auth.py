@@ -0,0 +1,62 @@
+'''
+Session server authentication throughput against the local fake session server.
+Compares a fresh requests.get() per login, as the login handler did before, with the pooled SessionAuthenticator.
+Both sides get the same number of concurrent logins.
+
+$ python tests/bench_auth.py --logins 400 --concurrency 8 --delay 0.01
+'''
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from fake_session_server import FakeSessionServer
+from networking.auth import SessionAuthenticator
+
+
+def legacy(endpoint: str, logins: int, concurrency: int) -> float:
+    def login(i: int):
+        response = requests.get(endpoint, params={'username': f'Player{i}', 'serverId': 'abc'})
+        assert response.status_code == 200
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(login, range(logins)))
+    return time.perf_counter() - start
+
+def pooled(endpoint: str, logins: int, concurrency: int) -> tuple:
+    authenticator = SessionAuthenticator(endpoint, max_concurrency=concurrency)
+    start = time.perf_counter()
+    futures = [authenticator.has_joined(f'Player{i}', 'abc') for i in range(logins)]
+    wait(futures)
+    elapsed = time.perf_counter() - start
+    assert all(future.result()['name'] for future in futures)
+    percentiles = authenticator.latency_percentiles()
+    authenticator.close()
+    return elapsed, percentiles
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--delay', type=float, default=0.01, help='simulated session server latency in seconds')
+    args = parser.parse_args()
+
+    server = FakeSessionServer(delay=args.delay).start()
+    try:
+        legacy_time = legacy(server.endpoint, args.logins, args.concurrency)
+        pooled_time, percentiles = pooled(server.endpoint, args.logins, args.concurrency)
+    finally:
+        server.stop()
+    print(f'{"client":<12} {"logins/s":>9}')
+    print(f'{"per login":<12} {args.logins / legacy_time:>9.0f}')
+    print(f'{"pooled":<12} {args.logins / pooled_time:>9.0f}')
+    print('pooled latency ' + ' '.join(f'p{p}={seconds * 1000:.1f}ms' for p, seconds in percentiles.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+'''
+Chunk streaming to a mix of healthy and stalled players, with and without backpressure.
+Naive queues every chunk as soon as it is generated, paced waits on Connection.when_writable() between chunks.
+Reports the peak outbound queue of a stalled player and the chunk rate healthy players get.
+Stalled players are never disconnected here, to show the queue bound rather than eviction.
+
+$ python tests/bench_backpressure.py --players 20 --stalled 5 --chunks 200
+'''
+import argparse
+import selectors
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.connection import Connection, ConnectionListener
+from networking.exception import ConnectionClosedError
+from networking.packet import ClientboundPacket
+from networking.packet.schema import RemainingBytes
+from networking.protocol import ConnectionState
+from bench_compression import chunk_payload
+
+
+class CChunkData(ClientboundPacket, packet_id=0x28):
+    fields = [('data', RemainingBytes)]
+
+
+def drain(clients: list, stop: threading.Event):
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        selector.register(client, selectors.EVENT_READ)
+    while not stop.is_set():
+        for key, _ in selector.select(0.1):
+            key.fileobj.recv(1 << 20)
+    selector.close()
+
+def stream(connection: Connection, chunk: ClientboundPacket, count: int, paced: bool):
+    try:
+        for _ in range(count):
+            if paced:
+                connection.when_writable().result()
+            connection.send(chunk)
+    except ConnectionClosedError:
+        # Stalled players are still waiting when the listener stops
+        pass
+
+def run(players: int, stalled: int, chunks: int, paced: bool) -> tuple:
+    listener = ConnectionListener(compression_threshold=-1, max_queued_bytes=1 << 40, slow_client_timeout=3600)
+    listener.start_server('127.0.0.1', 0)
+    try:
+        connections, healthy = [], []
+        for i in range(players):
+            server, client = socket.socketpair()
+            connection = Connection(server, ('127.0.0.1', 0), listener)
+            connection.packet_state.state = ConnectionState.PLAY
+            listener.connections.add(connection)
+            connection.start(listener.loop_group.next_loop())
+            connections.append((connection, client))
+            if i >= stalled:
+                client.setblocking(False)
+                healthy.append(client)
+        stop = threading.Event()
+        reader = threading.Thread(target=drain, args=(healthy, stop))
+        reader.start()
+
+        chunk = CChunkData(chunk_payload())
+        peak = [0]
+        def sample():
+            while not stop.is_set():
+                peak[0] = max(peak[0], max(connection.queued_bytes for connection, _ in connections[:stalled]))
+                time.sleep(0.005)
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+
+        start = time.perf_counter()
+        streamers = [threading.Thread(target=stream, args=(connection, chunk, chunks, paced)) for connection, _ in connections[stalled:]]
+        for streamer in streamers:
+            streamer.start()
+        # Stalled players get the same stream, paced streams to them pause at the high water mark
+        stalled_streams = [threading.Thread(target=stream, args=(connection, chunk, chunks, paced), daemon=True) for connection, _ in connections[:stalled]]
+        for streamer in stalled_streams:
+            streamer.start()
+        for streamer in streamers:
+            streamer.join()
+        while any(connection.queued_bytes for connection, _ in connections[stalled:]):
+            time.sleep(0.005)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        reader.join()
+        sampler.join()
+        for _, client in connections:
+            client.close()
+        return peak[0], (players - stalled) * chunks / elapsed
+    finally:
+        listener.stop_server()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=20)
+    parser.add_argument('--stalled', type=int, default=5)
+    parser.add_argument('--chunks', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f'{"streamer":<10} {"stalled peak MiB":>16} {"healthy chunks/s":>16}')
+    for name, paced in (('naive', False), ('paced', True)):
+        peak, rate = run(args.players, args.stalled, args.chunks, paced)
+        print(f'{name:<10} {peak / (1 << 20):>16.1f} {rate:>16.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+'''
+Fan-out of one packet to many players, per-connection sends against ConnectionListener.broadcast().
+Per connection serializes, compresses and wakes the loop up once for every recipient, as Connection.send() does for each player.
+Broadcast frames the packet once and hands each loop its share of recipients in one callback, leaving only encryption per player.
+Every recipient is logged in with compression and encryption enabled, time runs until the last byte reaches its client.
+
+$ python tests/bench_broadcast.py --recipients 200 --rounds 50
+'''
+import argparse
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.connection import Connection, ConnectionListener
+from networking.mc_crypto import gen_ciphers
+from networking.packet import ClientboundPacket, SharedFrame
+from networking.packet.client_bound.play import CUpdateEntityPositionRotation
+from networking.packet.schema import RemainingBytes
+from networking.protocol import ConnectionState
+from bench_compression import chunk_payload
+
+
+class CChunkData(ClientboundPacket, packet_id=0x28):
+    fields = [('data', RemainingBytes)]
+
+
+def connect(listener: ConnectionListener, count: int) -> list:
+    clients = []
+    for _ in range(count):
+        server, client = socket.socketpair()
+        connection = Connection(server, ('127.0.0.1', 0), listener)
+        p_state = connection.packet_state
+        p_state.state = ConnectionState.PLAY
+        p_state.compress_threshold = listener.compression_threshold
+        p_state.encrypt_cipher, _ = gen_ciphers(os.urandom(16))
+        p_state.encrypted = True
+        listener.connections.add(connection)
+        connection.start(listener.loop_group.next_loop())
+        client.setblocking(False)
+        clients.append(client)
+    return clients
+
+def drain(clients: list, expected: int):
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        selector.register(client, selectors.EVENT_READ)
+    received = 0
+    while received < expected:
+        for key, _ in selector.select(5.0):
+            received += len(key.fileobj.recv(1 << 20))
+    selector.close()
+
+def _unicast(connection: Connection, packet: ClientboundPacket):
+    connection.output_stream.write_packet(packet)
+    connection._flush()
+
+def per_connection(listener: ConnectionListener, packet: ClientboundPacket):
+    for connection in listener.connections:
+        connection.loop.call_soon(_unicast, connection, packet)
+
+def run(listener: ConnectionListener, clients: list, packet: ClientboundPacket, rounds: int, send) -> float:
+    frame_size = sum(map(len, SharedFrame(packet).frame(listener.compression_threshold)))
+    reader = threading.Thread(target=drain, args=(clients, frame_size * len(clients) * rounds))
+    start = time.perf_counter()
+    reader.start()
+    for _ in range(rounds):
+        send(listener, packet)
+    reader.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipients', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--event-loops', type=int, default=None)
+    args = parser.parse_args()
+
+    listener = ConnectionListener(args.event_loops)
+    listener.start_server('127.0.0.1', 0)
+    try:
+        clients = connect(listener, args.recipients)
+        packets = (('movement', CUpdateEntityPositionRotation(1, 100, -20, 4, 64, 0, True)), ('chunk', CChunkData(chunk_payload())))
+        print(f'{"packet":<10} {"sender":<16} {"broadcasts/s":>12} {"packets/s":>10}')
+        for name, packet in packets:
+            rounds = args.rounds if name == 'chunk' else args.rounds * 10
+            for sender, send in (('per connection', per_connection), ('broadcast', ConnectionListener.broadcast)):
+                elapsed = run(listener, clients, packet, rounds, send)
+                print(f'{name:<10} {sender:<16} {rounds / elapsed:>12.0f} {rounds * len(clients) / elapsed:>10.0f}')
+        for client in clients:
+            client.close()
+    finally:
+        listener.stop_server()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+'''
+Encode/decode throughput of ByteBuffer for a chunk-sized payload, against the bytearray-reversing buffer it replaced.
+The payload mimics chunk data: a heightmap long array, a block of raw section bytes and per-section primitives.
+Also compares decoding movement packets (x, y, z, yaw, pitch, flags) field by field against a single read_many().
+
+$ python tests/bench_bytebuffer.py --size 2097152
+'''
+import argparse
+import struct
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.data_type import ByteBuffer, BufferedPacket
+
+
+class LegacyByteBuffer:
+    '''
+    Reproduction of ByteBuffer before the offset-based rewrite.
+    '''
+
+    def __init__(self, byte_order='big'):
+        self.buffer = bytearray()
+        self.position = 0
+        self.buffer_size = 0
+        self.byte_order = byte_order
+
+    def flip(self):
+        self.position = 0
+
+    def write(self, data):
+        if self.byte_order == 'little':
+            self.buffer.reverse()
+        if isinstance(data, int):
+            data = bytes([data])
+        self.buffer.extend(data)
+        if self.byte_order == 'little':
+            self.buffer.reverse()
+        self.position += len(data)
+        self.buffer_size += len(data)
+        return self
+
+    def read(self, size):
+        if self.byte_order == 'little':
+            self.buffer.reverse()
+        data = self.buffer[self.position:self.position + size].copy()
+        if self.byte_order == 'little':
+            self.buffer.reverse()
+        self.position += size
+        return data
+
+    def write_fields(self, fmt, *values):
+        return self.write(struct.pack(fmt, *values))
+
+    def read_many(self, fmt):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))
+
+
+def _layout(size: int):
+    longs = size // 2 // 8
+    raw = size - longs * 8
+    return longs, raw
+
+def encode(buffer, size: int, order: str):
+    longs, raw = _layout(size)
+    section = bytes(range(256)) * 16
+    for i in range(longs):
+        buffer.write_fields(f'{order}q', i)
+    for offset in range(0, raw, len(section)):
+        buffer.write(section[:raw - offset])
+        buffer.write_fields(f'{order}h', offset & 0x7FFF)
+    return buffer
+
+def decode(buffer, size: int, order: str):
+    longs, raw = _layout(size)
+    buffer.flip()
+    for _ in range(longs):
+        buffer.read_many(f'{order}q')
+    for offset in range(0, raw, 4096):
+        buffer.read(min(4096, raw - offset))
+        buffer.read_many(f'{order}h')
+
+def run(factory, size: int, order: str, repeat: int) -> tuple:
+    encode_time = decode_time = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        buffer = encode(factory(), size, order)
+        encode_time = min(encode_time, time.perf_counter() - start)
+        start = time.perf_counter()
+        decode(buffer, size, order)
+        decode_time = min(decode_time, time.perf_counter() - start)
+    return size / encode_time, size / decode_time
+
+def movement(packets: int, order: str) -> tuple:
+    payload = struct.pack(f'{order}dddffB', 1.5, 64.0, -3.25, 90.0, 12.5, 1) * packets
+    legacy = LegacyByteBuffer()
+    legacy.write(payload)
+    legacy.flip()
+    start = time.perf_counter()
+    for _ in range(packets):
+        struct.unpack(f'{order}d', legacy.read(8))
+        struct.unpack(f'{order}d', legacy.read(8))
+        struct.unpack(f'{order}d', legacy.read(8))
+        struct.unpack(f'{order}f', legacy.read(4))
+        struct.unpack(f'{order}f', legacy.read(4))
+        struct.unpack(f'{order}B', legacy.read(1))
+    legacy_time = time.perf_counter() - start
+
+    current = BufferedPacket().wrap(payload, auto_flip=True)
+    start = time.perf_counter()
+    for _ in range(packets):
+        current.read_many('dddffB')
+    current_time = time.perf_counter() - start
+    return packets / legacy_time, packets / current_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=2 * 1024 * 1024)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--byte-order', choices=['big', 'little'], default='big', help='legacy little endian is quadratic, keep --size small')
+    args = parser.parse_args()
+
+    order = '<' if args.byte_order == 'little' else '>'
+    print(f'{"buffer":<10} {"encode MB/s":>12} {"decode MB/s":>12}')
+    for name, factory in (('legacy', lambda: LegacyByteBuffer(args.byte_order)), ('current', lambda: ByteBuffer(args.byte_order))):
+        encode_rate, decode_rate = run(factory, args.size, order, args.repeat)
+        print(f'{name:<10} {encode_rate / 1e6:>12.1f} {decode_rate / 1e6:>12.1f}')
+
+    legacy_rate, current_rate = movement(100000, order)
+    print(f'\n{"movement":<10} {"packets/s":>12}')
+    print(f'{"legacy":<10} {legacy_rate:>12.0f}')
+    print(f'{"read_many":<10} {current_rate:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
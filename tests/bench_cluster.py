@@ -0,0 +1,79 @@
+'''
+Status ping throughput of one server process against a cluster of worker processes sharing the port.
+Client processes run full status pings (handshake, status request, ping) back to back on fresh connections, as server lists do.
+Throughput scales with workers only as far as there are cores for them, and for the clients, to run on.
+
+$ python tests/bench_cluster.py --workers 4 --clients 8 --seconds 5
+'''
+import argparse
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import frame, handshake, recv_frame
+from networking.cluster import Cluster
+
+
+def ping(port: int, seconds: float, results):
+    status_request = handshake(port, 1) + frame(b'\x00')
+    pings = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        with socket.create_connection(('127.0.0.1', port)) as client:
+            received = bytearray()
+            client.sendall(status_request)
+            recv_frame(client, received)
+            client.sendall(frame(b'\x01', struct.pack('>q', pings)))
+            recv_frame(client, received)
+        pings += 1
+    results.put(pings)
+
+def run(workers: int, clients: int, seconds: float) -> float:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    cluster = Cluster(workers, address='127.0.0.1', port=port)
+    cluster.start()
+    try:
+        # Wait for every worker to listen
+        deadline = time.monotonic() + 30.0
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port)).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        time.sleep(1.0)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=ping, args=(port, seconds, results)) for _ in range(clients)]
+        for process in processes:
+            process.start()
+        total = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        return total / seconds
+    finally:
+        cluster.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f'{"workers":>7} {"pings/s":>9}')
+    for workers in sorted({1, args.workers}):
+        print(f'{workers:>7} {run(workers, args.clients, args.seconds):>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+'''
+Bandwidth against CPU for packet compression at each zlib level.
+Payloads mimic the two heaviest login/play packets: chunk data (packed block states, heightmaps, light)
+and registry data (NBT compounds for every biome-like entry).
+Frame time is ClientboundPacket.frame() as the output stream runs it, inflate time is the server side decode of the same frame.
+The zlib context table compares a fresh context per packet, as frame_body() and the input stream use, with copying a pristine one,
+against compressing a packet just above the threshold.
+
+$ python tests/bench_compression.py --threshold 256 --repeat 50
+'''
+import argparse
+import random
+import sys
+import time
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.data_type import BufferedPacket
+from networking.packet import ClientboundPacket
+from networking.packet.packet_connection import PacketConnectionState
+from networking.varint import decode_varint
+from pyncraft.nbt import TagCompound, TagFloat, TagString, TagByte, TagInt, write_nbt
+
+
+class RawPacket(ClientboundPacket):
+    def __init__(self, body: bytes):
+        self._body = body
+
+    @property
+    def packet_id(self):
+        return 0x27
+
+    def packet_body(self, p_state: PacketConnectionState) -> BufferedPacket:
+        return BufferedPacket().wrap(self._body, auto_flip=True)
+
+
+def chunk_payload(seed: int = 0) -> bytes:
+    '''
+    24 sections of a surface chunk: a small palette with 4 bits per block, mostly stone and air, plus light arrays.
+    '''
+    rng = random.Random(seed)
+    body = BufferedPacket()
+    body.write_fields('>ii', 3, -7)
+    body.write_varint(37 * 8)
+    body.write_fields('>37q', *[rng.getrandbits(63) for _ in range(37)])
+    for section in range(24):
+        body.write_fields('>h', 4096 if section < 12 else 0)
+        body.write_uint8(4)
+        body.write_varint(5)
+        for block in (0, 1, 3, 9, 10):
+            body.write_varint(block)
+        # Long runs of the same block compress, ore and caves do not
+        nibbles = [1 if section < 12 and rng.random() < 0.9 else rng.randrange(5) if section < 12 else 0 for _ in range(4096)]
+        packed = [sum(nibbles[i + j] << (4 * j) for j in range(16)) & 0x7FFFFFFFFFFFFFFF for i in range(0, 4096, 16)]
+        body.write_varint(len(packed))
+        body.write_fields(f'>{len(packed)}q', *packed)
+        body.write_uint8(0)
+        body.write_varint(section % 8)
+    for _ in range(26):
+        body.write_varint(2048)
+        body.write(bytes([0xFF]) * 1024 + bytes(rng.randrange(16) * 17 for _ in range(1024)))
+    return bytes(body.buffer)
+
+def registry_payload(entries: int = 64, seed: int = 0) -> bytes:
+    '''
+    Registry Data style body: identifier, then one NBT compound per entry.
+    '''
+    rng = random.Random(seed)
+    body = BufferedPacket()
+    body.write_utf8_string('minecraft:worldgen/biome', 32767)
+    body.write_varint(entries)
+    for i in range(entries):
+        body.write_utf8_string(f'minecraft:biome_{i}', 32767)
+        body.write_bool(True)
+        effects = TagCompound('effects', [
+            TagInt('sky_color', rng.randrange(1 << 24)),
+            TagInt('water_fog_color', rng.randrange(1 << 24)),
+            TagInt('fog_color', 12638463),
+            TagInt('water_color', rng.randrange(1 << 24)),
+            TagCompound('mood_sound', [
+                TagInt('tick_delay', 6000),
+                TagString('sound', 'minecraft:ambient.cave'),
+                TagInt('block_search_extent', 8),
+            ]),
+        ])
+        entry = TagCompound('', [
+            TagByte('has_precipitation', 1),
+            TagFloat('temperature', rng.random()),
+            TagFloat('downfall', rng.random()),
+            effects,
+        ])
+        body.write(write_nbt(entry, compressed=False))
+    return bytes(body.buffer)
+
+def inflate(frame: bytes) -> int:
+    length, offset = decode_varint(frame)
+    data_length, offset = decode_varint(frame, offset)
+    if data_length == 0:
+        return length
+    return len(zlib.decompressobj().decompress(memoryview(frame)[offset:], data_length))
+
+def measure(packet: ClientboundPacket, threshold: int, level: int, repeat: int) -> tuple:
+    p_state = PacketConnectionState()
+    p_state.compression_level = level
+    frame_time = inflate_time = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frame = packet.frame(p_state, threshold)
+        frame_time = min(frame_time, time.perf_counter() - start)
+    frame = b''.join(bytes(piece) for piece in frame)
+    if threshold >= 0:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            inflate(frame)
+            inflate_time = min(inflate_time, time.perf_counter() - start)
+    else:
+        inflate_time = 0.0
+    return len(frame), frame_time, inflate_time
+
+
+def context_costs(threshold: int, level: int, repeat: int = 20000) -> list:
+    '''
+    Microseconds per packet for each way of getting a zlib context, then for compressing a packet of threshold bytes.
+    '''
+    body = random.Random(0).randbytes(threshold // 4) + bytes(threshold - threshold // 4)
+    pristine_compressor = zlib.compressobj(level)
+    pristine_decompressor = zlib.decompressobj()
+    compressed = zlib.compress(body, level)
+    def per_packet(function) -> float:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        return (time.perf_counter() - start) / repeat * 1e6
+    def deflate():
+        compressor = zlib.compressobj(level)
+        compressor.compress(body)
+        compressor.flush()
+    return [
+        ('deflate', per_packet(lambda: zlib.compressobj(level)), per_packet(pristine_compressor.copy), per_packet(deflate)),
+        ('inflate', per_packet(zlib.decompressobj), per_packet(pristine_decompressor.copy), per_packet(lambda: zlib.decompressobj().decompress(compressed, threshold))),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threshold', type=int, default=256)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--registry-entries', type=int, default=64)
+    args = parser.parse_args()
+
+    payloads = (
+        ('chunk', RawPacket(chunk_payload())),
+        ('registry', RawPacket(registry_payload(args.registry_entries))),
+    )
+    print(f'{"payload":<10} {"level":>5} {"bytes":>9} {"ratio":>6} {"frame us":>9} {"inflate us":>11}')
+    for name, packet in payloads:
+        raw, _, _ = measure(packet, -1, 0, 1)
+        print(f'{name:<10} {"off":>5} {raw:>9} {1.0:>6.2f} {measure(packet, -1, 0, args.repeat)[1] * 1e6:>9.1f} {"-":>11}')
+        for level in (1, 3, 6, 9):
+            size, frame_time, inflate_time = measure(packet, args.threshold, level, args.repeat)
+            print(f'{name:<10} {level:>5} {size:>9} {raw / size:>6.2f} {frame_time * 1e6:>9.1f} {inflate_time * 1e6:>11.1f}')
+
+    print()
+    print(f'{"context":<10} {"fresh us":>9} {"copy us":>8} {f"{args.threshold} B packet us":>16}')
+    for name, fresh, copy, packet_time in context_costs(args.threshold, zlib.Z_DEFAULT_COMPRESSION):
+        print(f'{name:<10} {fresh:>9.2f} {copy:>8.2f} {packet_time:>16.2f}')
+
+
+if __name__ == '__main__':
+    main()
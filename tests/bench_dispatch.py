@@ -0,0 +1,92 @@
+'''
+Keep alive round trips of playing connections while logging in connections send packets with slow handlers.
+Each Login Plugin Response handler blocks for --handler-ms, as one querying a database or an external service would.
+Inline runs the handler on the event loop as every handler did before dispatching, worker runs it on the HandlerPool.
+All connections share one event loop, as they do on a single core.
+
+$ python tests/bench_dispatch.py --players 20 --logins 50 --handler-ms 5
+'''
+import argparse
+import socket
+import statistics
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import packet_frame
+from networking.connection import Connection, ConnectionListener
+from networking.packet.client_bound.play import CKeepAlive
+from networking.packet.dispatch import Route
+from networking.packet.server_bound.login import SLoginPluginResponse
+from networking.packet.server_bound.play import SKeepAlive
+from networking.protocol import ConnectionState
+from networking.varint import encode_varint
+
+
+def connect(listener: ConnectionListener, state: ConnectionState) -> tuple:
+    server, client = socket.socketpair()
+    client.settimeout(10.0)
+    connection = Connection(server, ('127.0.0.1', 0), listener)
+    connection.packet_state.state = state
+    listener.connections.add(connection)
+    connection.start(listener.loop_group.next_loop())
+    return connection, client
+
+def play(connection: Connection, client: socket.socket, rounds: int, latencies: list):
+    '''
+    The client answers each keep alive as soon as it arrives.
+    '''
+    for keep_alive_id in range(rounds):
+        start = time.perf_counter()
+        reply = connection.request(CKeepAlive(keep_alive_id), SKeepAlive, match=lambda packet, i=keep_alive_id: packet.keep_alive_id == i)
+        client.recv(64)
+        client.sendall(packet_frame(0x1A, struct.pack('>q', keep_alive_id)))
+        reply.result()
+        latencies.append(time.perf_counter() - start)
+
+def log_in(client: socket.socket, messages: int):
+    client.sendall(b''.join(packet_frame(0x02, encode_varint(i), b'\x00') for i in range(messages)))
+
+def run(players: int, logins: int, handler_seconds: float, route: Route) -> list:
+    handle, previous_route = SLoginPluginResponse.handle, SLoginPluginResponse.route
+    SLoginPluginResponse.handle = lambda self, p_state: time.sleep(handler_seconds)
+    SLoginPluginResponse.route = route
+    listener = ConnectionListener(1, handler_workers=8)
+    listener.start_server('127.0.0.1', 0)
+    try:
+        latencies = []
+        playing = [connect(listener, ConnectionState.PLAY) for _ in range(players)]
+        logging_in = [connect(listener, ConnectionState.LOGIN) for _ in range(logins)]
+        threads = [threading.Thread(target=play, args=(connection, client, 20, latencies)) for connection, client in playing]
+        threads += [threading.Thread(target=log_in, args=(client, 4)) for _, client in logging_in]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for _, client in playing + logging_in:
+            client.close()
+        return sorted(latencies)
+    finally:
+        listener.stop_server()
+        SLoginPluginResponse.handle, SLoginPluginResponse.route = handle, previous_route
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=20)
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--handler-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f'{"handlers":<8} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    for name, route in (('inline', Route.LOOP), ('worker', Route.WORKER)):
+        latencies = run(args.players, args.logins, args.handler_ms / 1000, route)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f'{name:<8} {statistics.median(latencies) * 1000:>8.1f} {p99 * 1000:>8.1f} {latencies[-1] * 1000:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+'''
+Idle CPU and packet latency of the event loop networking core against the thread-per-connection model it replaced.
+The server runs in a child process so client side work is not accounted as server CPU.
+
+$ python tests/bench_event_loop.py --connections 1000
+'''
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from core.logger import logger
+from networking.admission import AdmissionController
+from networking.connection import ConnectionListener
+from networking.data_type import BufferedPacket
+from networking.packet.packet_connection import PacketConnectionState
+from networking.packet.server_bound.status import SStatusRequest
+from networking.protocol import ConnectionState
+
+
+def _varint(value: int) -> bytes:
+    buffer = BufferedPacket()
+    buffer.write_varint(value)
+    buffer.flip()
+    return bytes(buffer.read(buffer.buffer_size))
+
+def _frame(body: bytes) -> bytes:
+    return _varint(len(body)) + body
+
+def _handshake(port: int) -> bytes:
+    body = BufferedPacket()
+    body.write_varint(0x00)
+    body.write_varint(769)
+    body.write_utf8_string('localhost', 255)
+    body.write_uint16(port)
+    body.write_varint(1)
+    body.flip()
+    return _frame(bytes(body.read(body.buffer_size)))
+
+STATUS_REQUEST = _frame(b'\x00')
+
+
+class ThreadedServer:
+    '''
+    Reproduction of the networking model before the event loop:
+    per client, one thread polling recv(1024) with a 0.1 s timeout and one thread spinning on available().
+    '''
+
+    def __init__(self):
+        self.server = None
+        self._stop_event = threading.Event()
+
+    def start_server(self, address, port):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((address, port))
+        self.server.listen(socket.SOMAXCONN)
+        self.server.settimeout(1.0)
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self):
+        while not self._stop_event.is_set():
+            try:
+                client, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            state = {'buffer': bytearray(), 'lock': threading.Lock()}
+            threading.Thread(target=self._read_data, args=(client, state), daemon=True).start()
+            threading.Thread(target=self._handle_connection, args=(client, state), daemon=True).start()
+
+    def _read_data(self, client: socket.socket, state: dict):
+        client.settimeout(0.1)
+        while not self._stop_event.is_set():
+            try:
+                data = client.recv(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if not data:
+                continue
+            with state['lock']:
+                state['buffer'] = state['buffer'].copy() + data
+
+    def _available(self, state: dict) -> int:
+        with state['lock']:
+            return len(state['buffer'])
+
+    def _handle_connection(self, client: socket.socket, state: dict):
+        p_state = PacketConnectionState()
+        while not self._stop_event.is_set():
+            if self._available(state) == 0:
+                continue
+            with state['lock']:
+                frame = BufferedPacket()
+                frame.wrap(state['buffer'], auto_flip=True)
+                length = frame.read_varint()
+                if frame.buffer_size - frame.pos() < length:
+                    continue
+                state['buffer'] = state['buffer'][frame.pos() + length:]
+            if p_state.state == ConnectionState.HANDSHAKE:
+                p_state.state = ConnectionState.STATUS
+                continue
+            response = SStatusRequest().handle(p_state).get_bytes(p_state)
+            client.send(response.read(response.buffer_size))
+
+
+def _serve(model: str, event_loops: int, pipe):
+    logger.logger.setLevel(logging.WARNING)
+    if model == 'event-loop':
+        # Every connection stays in status state for the whole run
+        server = ConnectionListener(event_loops, admission=AdmissionController(max_pending=1 << 20))
+    else:
+        server = ThreadedServer()
+    server.start_server('127.0.0.1', 0)
+    pipe.send(server.server.getsockname()[1])
+    while True:
+        command = pipe.recv()
+        if command == 'cpu':
+            pipe.send(time.process_time())
+        elif command == 'stop':
+            break
+    os._exit(0)
+
+
+def _drive(port: int, connections: int, idle_seconds: float, duration: float, rate: float, pipe) -> dict:
+    sockets = []
+    for _ in range(connections):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(_handshake(port))
+        sock.setblocking(False)
+        sockets.append(sock)
+    time.sleep(1.0)
+
+    # Idle phase, everyone is connected and silent
+    pipe.send('cpu')
+    cpu_start = pipe.recv()
+    time.sleep(idle_seconds)
+    pipe.send('cpu')
+    idle_cpu = (pipe.recv() - cpu_start) / idle_seconds
+
+    # Load phase, every connection sends status requests at the given rate
+    selector = selectors.DefaultSelector()
+    pending = {}
+    for sock in sockets:
+        pending[sock] = (bytearray(), deque())
+        selector.register(sock, selectors.EVENT_READ)
+    latencies = []
+    interval = 1.0 / (rate * connections)
+    next_send = time.perf_counter()
+    deadline = next_send + duration
+    index = 0
+    while True:
+        now = time.perf_counter()
+        if now >= deadline and not any(sent for _, sent in pending.values()):
+            break
+        if now > deadline + 10.0:
+            break
+        while now < deadline and next_send <= now:
+            sock = sockets[index % connections]
+            index += 1
+            pending[sock][1].append(time.perf_counter())
+            sock.send(STATUS_REQUEST)
+            next_send += interval
+        for key, _ in selector.select(timeout=max(0.0, min(next_send - time.perf_counter(), 0.01))):
+            buffer, sent = pending[key.fileobj]
+            try:
+                buffer += key.fileobj.recv(65536)
+            except BlockingIOError:
+                continue
+            while buffer:
+                frame = BufferedPacket()
+                frame.wrap(bytes(buffer[:3]), auto_flip=True)
+                try:
+                    length = frame.read_varint()
+                except struct.error:
+                    break
+                if len(buffer) < frame.pos() + length:
+                    break
+                del buffer[:frame.pos() + length]
+                latencies.append(time.perf_counter() - sent.popleft())
+
+    for sock in sockets:
+        sock.close()
+    latencies.sort()
+    return {
+        'idle_cpu': idle_cpu,
+        'responses': len(latencies),
+        'requests': index,
+        'p50': latencies[len(latencies) // 2] if latencies else float('nan'),
+        'p99': latencies[int(len(latencies) * 0.99)] if latencies else float('nan'),
+    }
+
+
+def run(model: str, args) -> dict:
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(model, args.event_loops, child))
+    process.start()
+    port = parent.recv()
+    try:
+        return _drive(port, args.connections, args.idle_seconds, args.duration, args.rate, parent)
+    finally:
+        parent.send('stop')
+        process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--idle-seconds', type=float, default=5.0)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--rate', type=float, default=1.0, help='status requests per connection per second')
+    parser.add_argument('--event-loops', type=int, default=None)
+    parser.add_argument('--model', choices=['event-loop', 'threaded', 'both'], default='both')
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    models = ['event-loop', 'threaded'] if args.model == 'both' else [args.model]
+    print(f'{"model":<12} {"idle cpu":>9} {"p50 ms":>9} {"p99 ms":>9} {"responses":>12}')
+    for model in models:
+        result = run(model, args)
+        print(f'{model:<12} {result["idle_cpu"] * 100:>8.1f}% {result["p50"] * 1000:>9.2f} {result["p99"] * 1000:>9.2f} {result["responses"]:>6}/{result["requests"]:<6}')
+
+
+if __name__ == '__main__':
+    main()
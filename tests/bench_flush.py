@@ -0,0 +1,120 @@
+'''
+Socket writes per game tick, flushing after every packet against one gathered flush per loop iteration.
+Flushing after every packet, and copying every frame into the arena, is how connections wrote before output was coalesced.
+Each tick queues a few separate sends per player, broadcasts entity movement and sends a 12 KB slice of chunk data,
+roughly what a tick of a busy server writes to every connection.
+The slice stays below MCPacketOutputStream.OFFLOAD_THRESHOLD, whole chunks would queue behind the frame pool and mostly measure compression.
+Syscalls count every send()/sendmsg() attempt of the output streams.
+
+$ python tests/bench_flush.py --players 50 --ticks 40
+'''
+import argparse
+import selectors
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.connection import Connection, ConnectionListener
+from networking.packet import ClientboundPacket, SharedFrame
+from networking.packet.client_bound.play import CKeepAlive, CSetHeadRotation, CUpdateEntityPositionRotation
+from networking.packet.schema import RemainingBytes
+from networking.protocol import ConnectionState
+from networking.socket_io import ConnectionOutputStream, MCPacketOutputStream
+from bench_compression import chunk_payload
+
+TICK = 0.05
+
+
+class CChunkData(ClientboundPacket, packet_id=0x28):
+    fields = [('data', RemainingBytes)]
+
+
+def drain(clients: list, received: list, stop: threading.Event):
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        selector.register(client, selectors.EVENT_READ)
+    while not stop.is_set():
+        for key, _ in selector.select(0.1):
+            received[0] += len(key.fileobj.recv(1 << 20))
+    selector.close()
+
+def _flushing(write):
+    def write_and_flush(self, *args):
+        write(self, *args)
+        self.flush()
+    return write_and_flush
+
+def run(players: int, ticks: int, coalesce: bool) -> tuple:
+    listener = ConnectionListener()
+    listener.start_server('127.0.0.1', 0)
+    write_packet, write_frame = MCPacketOutputStream.write_packet, MCPacketOutputStream.write_frame
+    gather_threshold = ConnectionOutputStream.GATHER_THRESHOLD
+    if not coalesce:
+        MCPacketOutputStream.write_packet = _flushing(write_packet)
+        MCPacketOutputStream.write_frame = _flushing(write_frame)
+        ConnectionOutputStream.GATHER_THRESHOLD = float('inf')
+    try:
+        clients = []
+        for _ in range(players):
+            server, client = socket.socketpair()
+            connection = Connection(server, ('127.0.0.1', 0), listener)
+            connection.packet_state.state = ConnectionState.PLAY
+            connection.packet_state.compress_threshold = listener.compression_threshold
+            listener.connections.add(connection)
+            connection.start(listener.loop_group.next_loop())
+            client.setblocking(False)
+            clients.append(client)
+        received = [0]
+        stop = threading.Event()
+        reader = threading.Thread(target=drain, args=(clients, received, stop))
+        reader.start()
+
+        chunk = CChunkData(chunk_payload()[:12288])
+        movements = [CUpdateEntityPositionRotation(i, 100, -20, 4, 64, 0, True) for i in range(5)]
+        unicasts = [CKeepAlive(1), CSetHeadRotation(1, 64), CKeepAlive(2)]
+        threshold = listener.compression_threshold
+        expected = sum(len(piece) for packet in (chunk, *movements, *unicasts) for piece in SharedFrame(packet).frame(threshold))
+        expected *= players * ticks
+
+        start = time.perf_counter()
+        for tick in range(ticks):
+            for packet in unicasts:
+                for connection in listener.connections:
+                    connection.send(packet)
+            for packet in movements:
+                listener.broadcast(packet)
+            for connection in listener.connections:
+                connection.send(chunk)
+            time.sleep(max(0.0, start + (tick + 1) * TICK - time.perf_counter()))
+        while received[0] < expected:
+            time.sleep(0.01)
+        stop.set()
+        reader.join()
+        calls = sum(connection.output_stream.send_calls for connection in listener.connections)
+        sent = sum(connection.output_stream.bytes_sent for connection in listener.connections)
+        for client in clients:
+            client.close()
+        return calls, sent
+    finally:
+        MCPacketOutputStream.write_packet, MCPacketOutputStream.write_frame = write_packet, write_frame
+        ConnectionOutputStream.GATHER_THRESHOLD = gather_threshold
+        listener.stop_server()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=50)
+    parser.add_argument('--ticks', type=int, default=40)
+    args = parser.parse_args()
+
+    print(f'{"flush":<14} {"syscalls/tick":>13} {"bytes/syscall":>13}')
+    for name, coalesce in (('per packet', False), ('gathered', True)):
+        calls, sent = run(args.players, args.ticks, coalesce)
+        print(f'{name:<14} {calls / args.ticks:>13.0f} {sent / calls:>13.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+Outbound framing throughput with compression and encryption on, inline on the event loop against the frame pool.
+Each connection queues a burst of chunk packets, as when a player joins or crosses into new terrain.
+Timing stops once every frame is compressed and encrypted into its connection's arena, sockets are never flushed.
+
+$ python tests/bench_frame_pool.py --connections 8 --chunks 32 --workers 4
+'''
+import argparse
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.mc_crypto import gen_ciphers
+from networking.packet.packet_connection import PacketConnectionState
+from networking.socket_io import MCPacketOutputStream
+from bench_compression import RawPacket, chunk_payload
+
+
+def _streams(connections: int, pool) -> list:
+    streams = []
+    for _ in range(connections):
+        server, client = socket.socketpair()
+        p_state = PacketConnectionState()
+        p_state.encrypt_cipher, _ = gen_ciphers(os.urandom(16))
+        p_state.encrypted = True
+        p_state.compress_threshold = 256
+        streams.append((MCPacketOutputStream(server, p_state, pool), server, client))
+    return streams
+
+def run(connections: int, packets: list, workers: int) -> float:
+    pool = ThreadPoolExecutor(workers) if workers else None
+    streams = _streams(connections, pool)
+    start = time.perf_counter()
+    # Round robin like an event loop serving every connection in turn
+    for packet in packets:
+        for stream, _, _ in streams:
+            stream.write_packet(packet)
+    while any(stream.pending for stream, _, _ in streams):
+        time.sleep(0.0005)
+    elapsed = time.perf_counter() - start
+    if pool:
+        pool.shutdown()
+    for _, server, client in streams:
+        server.close()
+        client.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--chunks', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    packets = [RawPacket(chunk_payload(seed)) for seed in range(args.chunks)]
+    total = args.connections * args.chunks
+    print(f'{"framing":<12} {"seconds":>8} {"chunks/s":>9}')
+    for name, workers in (('inline', 0), (f'pool x{args.workers}', args.workers)):
+        elapsed = run(args.connections, packets, workers)
+        print(f'{name:<12} {elapsed:>8.3f} {total / elapsed:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
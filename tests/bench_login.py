@@ -0,0 +1,68 @@
+'''
+Server side RSA cost of a login, generating a keypair per login as before against the server wide ServerKeyPair.
+Each login builds the Encryption Request, then decrypts the verify token and shared secret of the Encryption Response.
+The client side RSA encryption is done up front and not timed.
+
+$ python tests/bench_login.py --logins 200
+'''
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from cryptography.hazmat.primitives.serialization import load_der_public_key
+from networking.mc_crypto import ServerKeyPair, decrypt_rsa, encode_public_key_der, encrypt_rsa, gen_rsa_key_pair
+from networking.packet.client_bound.login import CEncryptionRequest
+from networking.packet.packet_connection import PacketConnectionState
+
+
+def legacy_login(secret: bytes) -> bytes:
+    '''
+    Reproduction of the login before ServerKeyPair: a fresh keypair and two DER encodings per login.
+    The client encrypts with the fresh key, so that is part of the login here.
+    '''
+    private_key, public_key = gen_rsa_key_pair()
+    public_der = encode_public_key_der(public_key)
+    client_key = load_der_public_key(public_der)
+    encrypted_token = encrypt_rsa(bytes([0x12, 0x34, 0x56, 0x78]), client_key)
+    encrypted_secret = encrypt_rsa(secret, client_key)
+    decrypt_rsa(encrypted_token, private_key)
+    encode_public_key_der(public_key)
+    return decrypt_rsa(encrypted_secret, private_key)
+
+def current_login(key_pair: ServerKeyPair, client_key, secret: bytes) -> bytes:
+    p_state = PacketConnectionState()
+    CEncryptionRequest(True, key_pair).packet_body(p_state)
+    encrypted_token = encrypt_rsa(p_state.verify_token, client_key)
+    encrypted_secret = encrypt_rsa(secret, client_key)
+    decrypt_rsa(encrypted_token, p_state.private_key)
+    return decrypt_rsa(encrypted_secret, p_state.private_key)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=200)
+    args = parser.parse_args()
+    secret = os.urandom(16)
+
+    start = time.perf_counter()
+    for _ in range(args.logins):
+        assert legacy_login(secret) == secret
+    legacy_time = time.perf_counter() - start
+
+    key_pair = ServerKeyPair()
+    client_key = load_der_public_key(key_pair.snapshot()[2])
+    start = time.perf_counter()
+    for _ in range(args.logins):
+        assert current_login(key_pair, client_key, secret) == secret
+    current_time = time.perf_counter() - start
+
+    print(f'{"keypair":<12} {"logins/s":>9}')
+    print(f'{"per login":<12} {args.logins / legacy_time:>9.0f}')
+    print(f'{"server wide":<12} {args.logins / current_time:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
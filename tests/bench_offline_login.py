@@ -0,0 +1,101 @@
+'''
+Login latency of a backend server, from the handshake to Login Success, one login at a time.
+Online logins go through encryption and the local fake session server, answering after --delay seconds like the real one would.
+Offline logins derive the UUID from the name, forwarded logins take the player a proxy signed with modern forwarding.
+The client side RSA and HMAC work is done up front where possible, and is not what is compared.
+
+$ python tests/bench_offline_login.py --logins 200 --delay 0.05
+'''
+import argparse
+import hashlib
+import hmac
+import logging
+import os
+import socket
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from cryptography.hazmat.primitives.serialization import load_der_public_key
+from core.logger import logger
+from fake_session_server import FakeSessionServer
+from helpers import frame, recv_frame, string
+from networking.admission import AdmissionController
+from networking.auth import SessionAuthenticator
+from networking.connection import ConnectionListener
+from networking.data_type import BufferedPacket
+from networking.mc_crypto import encrypt_rsa, gen_ciphers
+from networking.varint import encode_varint
+
+SECRET = os.urandom(32)
+
+
+def _player_info(username: str) -> bytes:
+    data = encode_varint(1) + string('203.0.113.7') + uuid.uuid4().bytes + string(username) + encode_varint(0)
+    return hmac.new(SECRET, data, hashlib.sha256).digest() + data
+
+
+def login(address: tuple, mode: str, username: str, public_key) -> float:
+    player_info = _player_info(username) if mode == 'forwarded' else None
+    shared_secret = os.urandom(16)
+    encrypted_secret = encrypt_rsa(shared_secret, public_key) if mode == 'online' else None
+    with socket.create_connection(address) as client:
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client.settimeout(10.0)
+        received = bytearray()
+        decrypt = None
+        start = time.perf_counter()
+        client.sendall(frame(b'\x00', encode_varint(769), string('localhost'), address[1].to_bytes(2, 'big'), b'\x02')
+                       + frame(b'\x00', string(username), uuid.uuid4().bytes))
+        if mode == 'online':
+            request = BufferedPacket().wrap(recv_frame(client, received), auto_flip=True)
+            request.read_varint()
+            request.read(request.read_varint())
+            request.read(request.read_varint())
+            encrypted_token = encrypt_rsa(bytes(request.read(request.read_varint())), public_key)
+            client.sendall(frame(b'\x01', encode_varint(len(encrypted_secret)), encrypted_secret, encode_varint(len(encrypted_token)), encrypted_token))
+            _, decrypt = gen_ciphers(shared_secret)
+        elif mode == 'forwarded':
+            request = BufferedPacket().wrap(recv_frame(client, received), auto_flip=True)
+            request.read_varint()
+            client.sendall(frame(b'\x02', encode_varint(request.read_varint()), b'\x01', player_info))
+        # Set Compression, then Login Success
+        recv_frame(client, received, decrypt)
+        recv_frame(client, received, decrypt)
+        return time.perf_counter() - start
+
+
+def run(mode: str, logins: int, endpoint: str) -> list:
+    listener = ConnectionListener(1, authenticator=SessionAuthenticator(endpoint), admission=AdmissionController(ip_burst=logins, login_burst=logins),
+                                  online_mode=mode == 'online', forwarding_secret=SECRET if mode == 'forwarded' else None)
+    listener.start_server('127.0.0.1', 0)
+    try:
+        public_key = load_der_public_key(listener.key_pair.snapshot()[2])
+        address = listener.server.getsockname()
+        return [login(address, mode, f'Player{i}', public_key) for i in range(logins)]
+    finally:
+        listener.stop_server()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds the fake session server takes to answer')
+    args = parser.parse_args()
+    logger.logger.setLevel(logging.WARNING)
+    session_server = FakeSessionServer(delay=args.delay).start()
+    try:
+        print(f'{"login":<10} {"p50 ms":>8} {"p99 ms":>8}')
+        for mode in ('online', 'offline', 'forwarded'):
+            latencies = sorted(run(mode, args.logins, session_server.endpoint))
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f'{mode:<10} {statistics.median(latencies) * 1e3:>8.2f} {p99 * 1e3:>8.2f}')
+    finally:
+        session_server.stop()
+
+
+if __name__ == '__main__':
+    main()
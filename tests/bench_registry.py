@@ -0,0 +1,84 @@
+'''
+Connection bookkeeping at thousands of sessions, the locked list the listener kept before against ConnectionRegistry.
+Lookup finds a player by username, as /msg and kick do, which was a scan of the list.
+Churn disconnects every player in random order, list.remove() against dictionary deletes.
+
+$ python tests/bench_registry.py --sessions 5000
+'''
+import argparse
+import random
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.connection_registry import ConnectionRegistry
+from networking.packet.packet_connection import PacketConnectionState
+
+
+class FakeConnection:
+    def __init__(self, i: int):
+        self.packet_state = PacketConnectionState()
+        self.packet_state.client_ip = f'10.0.{i // 256 % 256}.{i % 256}'
+        self.packet_state.username = f'player{i}'
+        self.packet_state.uuid = uuid.uuid3(uuid.NAMESPACE_OID, self.packet_state.username)
+
+
+def list_lookup(connections: list, lock: threading.Lock, username: str):
+    with lock:
+        for connection in connections:
+            if connection.packet_state.username.lower() == username:
+                return connection
+
+def run_list(players: list, names: list) -> tuple:
+    connections, lock = [], threading.Lock()
+    for connection in players:
+        with lock:
+            connections.append(connection)
+    start = time.perf_counter()
+    for name in names:
+        list_lookup(connections, lock, name)
+    lookup = time.perf_counter() - start
+    leaving = random.sample(players, len(players))
+    start = time.perf_counter()
+    for connection in leaving:
+        with lock:
+            if connection in connections:
+                connections.remove(connection)
+    return lookup, time.perf_counter() - start
+
+def run_registry(players: list, names: list) -> tuple:
+    registry = ConnectionRegistry()
+    for connection in players:
+        registry.add(connection)
+        registry.identify(connection)
+    start = time.perf_counter()
+    for name in names:
+        registry.by_username(name)
+    lookup = time.perf_counter() - start
+    leaving = random.sample(players, len(players))
+    start = time.perf_counter()
+    for connection in leaving:
+        registry.remove(connection)
+    return lookup, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=5000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    players = [FakeConnection(i) for i in range(args.sessions)]
+    names = [f'player{random.randrange(args.sessions)}' for _ in range(args.lookups)]
+    print(f'{"bookkeeping":<12} {"lookup us":>10} {"disconnect us":>14}')
+    for name, run in (('locked list', run_list), ('registry', run_registry)):
+        lookup, churn = run(players, names)
+        print(f'{name:<12} {lookup / args.lookups * 1e6:>10.2f} {churn / args.sessions * 1e6:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
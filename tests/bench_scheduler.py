@@ -0,0 +1,120 @@
+'''
+Keep alive latency while chunks stream to players on a limited link, first in first out against the packet scheduler.
+Each player reads at --bandwidth KiB/s, and gets all its chunks queued up front as a joining player would.
+A keep alive is sent every 50 ms meanwhile, latency runs from send() to the client reading it.
+FIFO writes every packet straight into the output arena, as connections did before the scheduler.
+
+$ python tests/bench_scheduler.py --players 10 --chunks 100 --bandwidth 2048
+'''
+import argparse
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.connection import Connection, ConnectionListener
+from networking.packet import ClientboundPacket
+from networking.packet.client_bound.play import CKeepAlive
+from networking.packet.scheduler import Priority
+from networking.packet.schema import RemainingBytes
+from networking.protocol import ConnectionState
+from networking.varint import decode_varint
+from bench_compression import chunk_payload
+
+KEEP_ALIVE_INTERVAL = 0.05
+
+
+class CChunkData(ClientboundPacket, packet_id=0x28):
+    priority = Priority.BULK
+    fields = [('data', RemainingBytes)]
+
+
+def read(client: socket.socket, bandwidth: int, chunks: int, sent: dict, latencies: list):
+    '''
+    Reads at bandwidth bytes per second until every chunk arrived, recording keep alive latencies.
+    '''
+    received = bytearray()
+    start = time.perf_counter()
+    total = 0
+    while chunks:
+        data = client.recv(16384)
+        if not data:
+            return
+        total += len(data)
+        received += data
+        while received:
+            try:
+                length, offset = decode_varint(received)
+            except Exception:
+                break
+            if len(received) - offset < length:
+                break
+            if received[offset] == 0x27:
+                keep_alive_id = int.from_bytes(received[offset + 1:offset + length], 'big', signed=True)
+                latencies.append(time.perf_counter() - sent[keep_alive_id])
+            else:
+                chunks -= 1
+            del received[:offset + length]
+        time.sleep(max(0.0, start + total / bandwidth - time.perf_counter()))
+
+def run(players: int, chunks: int, bandwidth: int, scheduled: bool) -> list:
+    listener = ConnectionListener(compression_threshold=-1, high_water_mark=64 << 20, max_queued_bytes=256 << 20)
+    listener.start_server('127.0.0.1', 0)
+    scheduling = Connection._scheduling
+    if not scheduled:
+        Connection._scheduling = lambda self: False
+    try:
+        connections, readers = [], []
+        sent, latencies = {}, []
+        for _ in range(players):
+            server, client = socket.socketpair()
+            for sock in (server, client):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 65536)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
+            connection = Connection(server, ('127.0.0.1', 0), listener)
+            connection.packet_state.state = ConnectionState.PLAY
+            listener.connections.add(connection)
+            connection.start(listener.loop_group.next_loop())
+            connections.append(connection)
+            readers.append(threading.Thread(target=read, args=(client, bandwidth, chunks, sent, latencies)))
+        for reader in readers:
+            reader.start()
+
+        chunk = CChunkData(chunk_payload())
+        for connection in connections:
+            for _ in range(chunks):
+                connection.send(chunk)
+        keep_alive_id = 0
+        while any(reader.is_alive() for reader in readers):
+            sent[keep_alive_id] = time.perf_counter()
+            for connection in connections:
+                connection.send(CKeepAlive(keep_alive_id))
+            keep_alive_id += 1
+            time.sleep(KEEP_ALIVE_INTERVAL)
+        for reader in readers:
+            reader.join()
+        return latencies
+    finally:
+        Connection._scheduling = scheduling
+        listener.stop_server()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=10)
+    parser.add_argument('--chunks', type=int, default=100)
+    parser.add_argument('--bandwidth', type=int, default=2048, help='KiB/s each player reads')
+    args = parser.parse_args()
+
+    print(f'{"outbound":<10} {"keep alives":>11} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    for name, scheduled in (('fifo', False), ('scheduled', True)):
+        latencies = sorted(run(args.players, args.chunks, args.bandwidth << 10, scheduled))
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f'{name:<10} {len(latencies):>11} {statistics.median(latencies) * 1000:>8.1f} {p99 * 1000:>8.1f} {latencies[-1] * 1000:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''
+Entity movement packets, the most frequent packets of a busy server, hand-written against schema compiled.
+Hand-written is the per-field BufferedPacket style the packets used before schemas, compiled is CUpdateEntityPositionRotation.
+Encode is the body alone, frame adds the header as the output stream does, decode reads the body back.
+
+$ python tests/bench_schema.py --packets 200000
+'''
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.data_type import BufferedPacket
+from networking.packet import ClientboundPacket
+from networking.packet.client_bound.play import CUpdateEntityPositionRotation
+from networking.packet.packet_connection import PacketConnectionState
+
+
+class HandWrittenPositionRotation(ClientboundPacket):
+    def __init__(self, entity_id: int, delta_x: int, delta_y: int, delta_z: int, yaw: int, pitch: int, on_ground: bool):
+        self.entity_id = entity_id
+        self.delta_x = delta_x
+        self.delta_y = delta_y
+        self.delta_z = delta_z
+        self.yaw = yaw
+        self.pitch = pitch
+        self.on_ground = on_ground
+
+    @property
+    def packet_id(self):
+        return 0x30
+
+    def packet_body(self, p_state: PacketConnectionState) -> BufferedPacket:
+        packet = BufferedPacket(byte_order='big')
+        packet.write_varint(self.entity_id)
+        packet.write_int16(self.delta_x)
+        packet.write_int16(self.delta_y)
+        packet.write_int16(self.delta_z)
+        packet.write_uint8(self.yaw)
+        packet.write_uint8(self.pitch)
+        packet.write_bool(self.on_ground)
+        packet.flip()
+        return packet
+
+    @classmethod
+    def decode(cls, buffer: BufferedPacket) -> 'HandWrittenPositionRotation':
+        return cls(buffer.read_varint(), buffer.read_int16(), buffer.read_int16(), buffer.read_int16(),
+                   buffer.read_uint8(), buffer.read_uint8(), buffer.read_bool())
+
+
+def movements(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [(rng.randrange(1, 5000), rng.randrange(-4096, 4096), rng.randrange(-512, 512), rng.randrange(-4096, 4096),
+             rng.randrange(256), rng.randrange(256), rng.random() < 0.8) for _ in range(count)]
+
+def timed(fn, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packets', type=int, default=200000)
+    args = parser.parse_args()
+
+    values = movements(args.packets)
+    p_state = PacketConnectionState()
+    print(f'{"packet":<14} {"encode/s":>10} {"frame/s":>10} {"decode/s":>10}')
+    for name, packet_class in (('hand-written', HandWrittenPositionRotation), ('compiled', CUpdateEntityPositionRotation)):
+        packets = [packet_class(*value) for value in values]
+        bodies = [bytes(packet.encode_body(p_state)) for packet in packets]
+        assert bodies == [bytes(HandWrittenPositionRotation(*value).encode_body(p_state)) for value in values[:1000]] + bodies[1000:]
+        encode = timed(lambda packet: packet.encode_body(p_state), packets)
+        frame = timed(lambda packet: packet.frame(p_state), packets)
+        decode = timed(lambda body: packet_class.decode(BufferedPacket().wrap(body, auto_flip=True)), bodies)
+        n = args.packets
+        print(f'{name:<14} {n / encode:>10.0f} {n / frame:>10.0f} {n / decode:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''
+Server initiated sends from a game logic thread through Connection.send().
+Each tick queues a burst of packets for every player, the time the game thread spends queueing is what a tick pays.
+The old send_packet() blocked the game thread for a client round trip on every call instead.
+
+$ python tests/bench_send_queue.py --players 20 --packets 200 --ticks 20
+'''
+import argparse
+import selectors
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import wait
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.connection import Connection, ConnectionListener
+from networking.packet.client_bound.play import CUpdateEntityPositionRotation
+from networking.protocol import ConnectionState
+
+
+def drain(clients: list, expected: int):
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        selector.register(client, selectors.EVENT_READ)
+    received = 0
+    while received < expected:
+        for key, _ in selector.select(5.0):
+            received += len(key.fileobj.recv(1 << 20))
+    selector.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=20)
+    parser.add_argument('--packets', type=int, default=200, help='packets per player per tick')
+    parser.add_argument('--ticks', type=int, default=20)
+    args = parser.parse_args()
+
+    listener = ConnectionListener()
+    listener.start_server('127.0.0.1', 0)
+    try:
+        clients = []
+        for _ in range(args.players):
+            server, client = socket.socketpair()
+            connection = Connection(server, ('127.0.0.1', 0), listener)
+            connection.packet_state.state = ConnectionState.PLAY
+            listener.connections.add(connection)
+            connection.start(listener.loop_group.next_loop())
+            client.setblocking(False)
+            clients.append(client)
+
+        packet = CUpdateEntityPositionRotation(1, 100, -20, 4, 64, 0, True)
+        frame_size = sum(map(len, packet.frame(connection.packet_state)))
+        total = args.players * args.packets * args.ticks
+        reader = threading.Thread(target=drain, args=(clients, frame_size * total))
+        reader.start()
+        start = time.perf_counter()
+        queueing = 0.0
+        futures = []
+        for _ in range(args.ticks):
+            tick = time.perf_counter()
+            for connection in listener.connections:
+                for _ in range(args.packets):
+                    futures.append(connection.send(packet))
+            queueing += time.perf_counter() - tick
+        wait(futures)
+        reader.join()
+        elapsed = time.perf_counter() - start
+        print(f'queued {total} packets, {queueing / args.ticks * 1000:.1f}ms of game thread per tick')
+        print(f'delivered {total / elapsed:.0f} packets/s')
+        for client in clients:
+            client.close()
+    finally:
+        listener.stop_server()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''
+Status pings per second, answered by a full Connection per socket against the StatusResponder fast path.
+Client threads run full status pings (handshake, status request, ping) back to back on fresh connections, as server lists do.
+The response carries a favicon, which the Connection path serializes and base64 encodes again on every ping.
+
+$ python tests/bench_status.py --clients 4 --seconds 5
+'''
+import argparse
+import socket
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import frame, handshake, recv_frame
+from networking.connection import ConnectionListener
+from networking.status import PNG_SIGNATURE
+
+# A typical 64x64 icon weighs a few kilobytes
+FAVICON = PNG_SIGNATURE + bytes(range(256)) * 16
+
+
+def ping(port: int, deadline: float, counts: list):
+    status_request = handshake(port, 1) + frame(b'\x00')
+    pings = 0
+    while time.perf_counter() < deadline:
+        with socket.create_connection(('127.0.0.1', port)) as client:
+            received = bytearray()
+            client.sendall(status_request)
+            recv_frame(client, received)
+            client.sendall(frame(b'\x01', struct.pack('>q', pings)))
+            recv_frame(client, received)
+        pings += 1
+    counts.append(pings)
+
+def run(fast_status: bool, clients: int, seconds: float) -> float:
+    listener = ConnectionListener(1, fast_status=fast_status, favicon=FAVICON)
+    listener.start_server('127.0.0.1', 0)
+    try:
+        port = listener.server.getsockname()[1]
+        counts = []
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=ping, args=(port, deadline, counts)) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(counts) / seconds
+    finally:
+        listener.stop_server()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f'{"responder":<10} {"pings/s":>10}')
+    for name, fast_status in (('connection', False), ('fast path', True)):
+        print(f'{name:<10} {run(fast_status, args.clients, args.seconds):>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
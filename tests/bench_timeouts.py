@@ -0,0 +1,88 @@
+'''
+Per connection timeouts at thousands of connections, the event loop's timer heap against its TimingWheel.
+Every connection keeps a read deadline and a keep alive timer.
+Churn schedules and cancels a reply timeout per request, as Connection.request() does. Held counts the timers kept afterwards.
+Ticking runs a minute of simulated time in 100 ms steps, sending keep alives as they come due.
+
+$ python tests/bench_timeouts.py --connections 5000 --churn 200000
+'''
+import argparse
+import heapq
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.event_loop import TimerHandle, TimingWheel
+
+KEEP_ALIVE_INTERVAL = 15.0
+READ_TIMEOUT = 30.0
+REPLY_TIMEOUT = 30.0
+
+
+class HeapTimers:
+    '''
+    The timer heap of EventLoop, cancelled timers stay until they reach the top.
+    '''
+
+    def __init__(self):
+        self._timers = []
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def schedule(self, when: float, callback, *args) -> TimerHandle:
+        timer = TimerHandle(when, callback, args)
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def advance(self, now: float) -> list:
+        due = []
+        while self._timers and self._timers[0].when <= now:
+            timer = heapq.heappop(self._timers)
+            if not timer.cancelled:
+                due.append(timer)
+        return due
+
+
+def run(timers, connections: int, churn: int) -> tuple:
+    now = 0.0
+    start = time.perf_counter()
+    for connection in range(connections):
+        timers.schedule(now + random.uniform(0, READ_TIMEOUT), 'read', connection)
+        timers.schedule(now + random.uniform(0, KEEP_ALIVE_INTERVAL), 'keep alive', connection)
+    schedule = (time.perf_counter() - start) / (2 * connections)
+
+    start = time.perf_counter()
+    for _ in range(churn):
+        timers.schedule(now + REPLY_TIMEOUT, 'reply', None).cancel()
+    churned = (time.perf_counter() - start) / churn
+    held = len(timers)
+
+    ticks = 600
+    start = time.perf_counter()
+    for _ in range(ticks):
+        now += 0.1
+        for timer in timers.advance(now):
+            if timer.callback != 'reply':
+                timers.schedule(now + KEEP_ALIVE_INTERVAL, timer.callback, *timer.args)
+    tick = (time.perf_counter() - start) / ticks
+    return schedule, churned, tick, held
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--churn', type=int, default=200000)
+    args = parser.parse_args()
+
+    print(f'{"timers":<8} {"schedule us":>12} {"churn us":>9} {"tick us":>9} {"held":>8}')
+    for name, timers in (('heap', HeapTimers()), ('wheel', TimingWheel(0.1))):
+        random.seed(0)
+        schedule, churn, tick, held = run(timers, args.connections, args.churn)
+        print(f'{name:<8} {schedule * 1e6:>12.2f} {churn * 1e6:>9.2f} {tick * 1e6:>9.1f} {held:>8}')
+
+
+if __name__ == '__main__':
+    main()
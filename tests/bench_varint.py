@@ -0,0 +1,108 @@
+'''
+VarInt encode/decode throughput of networking.varint against the byte-at-a-time loops it replaced.
+Values are drawn like a chunk palette plus entity ids: mostly one and two byte VarInts with a tail of larger ones.
+
+$ python tests/bench_varint.py --count 200000
+'''
+import argparse
+import random
+import struct
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.data_type import BufferedPacket
+from networking.varint import decode_varints, encode_varints
+from bench_bytebuffer import LegacyByteBuffer
+
+
+def legacy_write_varint(buffer: LegacyByteBuffer, value: int):
+    '''
+    Reproduction of BufferedPacket.write_varint before the varint module, one range checked write_uint8 per byte.
+    '''
+    if value < -2147483648 or value > 2147483647:
+        raise ValueError('Int value out of range')
+    unsigned = value & 0xFFFFFFFF
+    while True:
+        temp = unsigned & 0x7F
+        unsigned >>= 7
+        if unsigned != 0:
+            temp |= 0x80
+        if temp < 0 or temp > 255:
+            raise ValueError('Unsigned byte value out of range')
+        buffer.write(struct.pack('>B', temp))
+        if unsigned == 0:
+            break
+
+def legacy_read_varint(buffer: LegacyByteBuffer) -> int:
+    '''
+    Reproduction of BufferedPacket.read_varint before the varint module, one read_uint8 per byte.
+    '''
+    result = 0
+    shift = 0
+    while True:
+        b = struct.unpack('>B', buffer.read(1))[0]
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            break
+        shift += 7
+    if result & 0x80000000:
+        result -= 0x100000000
+    return result
+
+
+def _values(count: int) -> list:
+    rng = random.Random(0)
+    return [rng.randrange(256) if rng.random() < 0.8 else rng.randrange(1 << 21) for _ in range(count)]
+
+def _timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=200000)
+    args = parser.parse_args()
+    values = _values(args.count)
+
+    def legacy_encode():
+        buffer = LegacyByteBuffer()
+        for value in values:
+            legacy_write_varint(buffer, value)
+        return buffer
+    legacy = legacy_encode()
+    encoded = bytes(legacy.buffer)
+
+    def legacy_decode():
+        legacy.flip()
+        for _ in range(len(values)):
+            legacy_read_varint(legacy)
+
+    def packet_encode():
+        buffer = BufferedPacket()
+        for value in values:
+            buffer.write_varint(value)
+
+    packet = BufferedPacket().wrap(encoded, auto_flip=True)
+    def packet_decode():
+        packet.flip()
+        for _ in range(len(values)):
+            packet.read_varint()
+
+    assert encode_varints(values) == encoded
+    assert decode_varints(encoded, len(values))[0] == values
+
+    rows = (
+        ('legacy', _timed(legacy_encode), _timed(legacy_decode)),
+        ('per value', _timed(packet_encode), _timed(packet_decode)),
+        ('batch', _timed(lambda: encode_varints(values)), _timed(lambda: decode_varints(encoded, len(values)))),
+    )
+    print(f'{"varint":<10} {"encode M/s":>11} {"decode M/s":>11}')
+    for name, encode_time, decode_time in rows:
+        print(f'{name:<10} {len(values) / encode_time / 1e6:>11.2f} {len(values) / decode_time / 1e6:>11.2f}')
+
+
+if __name__ == '__main__':
+    main()
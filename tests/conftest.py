@@ -0,0 +1,34 @@
+import socket
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.connection import ConnectionListener
+
+
+@pytest.fixture
+def listener_options() -> dict:
+    '''
+    Keyword arguments of the listener fixture's ConnectionListener. Modules needing other settings override this.
+    '''
+    return {}
+
+@pytest.fixture
+def listener(request, listener_options):
+    '''
+    ConnectionListener with a single event loop on a free local port.
+    Tests add keyword arguments of their own with indirect parametrization.
+    '''
+    listener = ConnectionListener(**{'event_loops': 1, **listener_options, **getattr(request, 'param', {})})
+    listener.start_server('127.0.0.1', 0)
+    yield listener
+    listener.stop_server()
+
+@pytest.fixture
+def pair():
+    server, client = socket.socketpair()
+    yield server, client
+    server.close()
+    client.close()
@@ -0,0 +1,97 @@
+'''
+Local stand-in for the session server's hasJoined endpoint, for tests and load runs.
+Every player is confirmed unless listed in rejected, after an optional delay.
+The first len(fail_statuses) requests are answered with those statuses instead, to exercise retries.
+
+$ python tests/fake_session_server.py --port 8765 --delay 0.05
+'''
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PATH = '/session/minecraft/hasJoined'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes, keep-alive would stall on delayed ACKs otherwise
+    disable_nagle_algorithm = True
+    server: 'FakeSessionServer'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            status = server.fail_statuses.pop(0) if server.fail_statuses else None
+        try:
+            time.sleep(server.delay)
+            url = urlparse(self.path)
+            username = parse_qs(url.query).get('username', [''])[0]
+            if url.path != PATH:
+                status = 404
+            elif status is None and username in server.rejected:
+                status = 204
+            if status is not None:
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = json.dumps({
+                'id': uuid.uuid3(uuid.NAMESPACE_OID, username).hex,
+                'name': username,
+                'properties': [{'name': 'textures', 'value': 'e30=', 'signature': 'c2ln'}],
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSessionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), delay: float = 0.0):
+        super().__init__(address, _Handler)
+        self.delay = delay
+        self.rejected = set()
+        self.fail_statuses = []
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{PATH}'
+
+    def start(self) -> 'FakeSessionServer':
+        threading.Thread(target=self.serve_forever, name='FakeSessionServer', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeSessionServer(('127.0.0.1', args.port), args.delay)
+    print(f'Serving {server.endpoint}')
+    server.serve_forever()
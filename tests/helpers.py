@@ -0,0 +1,74 @@
+'''
+Client side helpers shared by the tests talking to a ConnectionListener over real sockets.
+'''
+import socket
+import struct
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.connection import Connection, ConnectionListener
+from networking.protocol import ConnectionState
+from networking.varint import decode_varint, encode_varint
+
+
+def frame(*parts: bytes) -> bytes:
+    '''
+    Length prefixed frame of the parts, uncompressed.
+    '''
+    data = b''.join(parts)
+    return encode_varint(len(data)) + data
+
+def packet_frame(packet_id: int, *parts: bytes) -> bytes:
+    return frame(encode_varint(packet_id), *parts)
+
+def string(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return encode_varint(len(data)) + data
+
+def handshake(port: int, next_state: int, protocol: int = 769) -> bytes:
+    return frame(b'\x00', encode_varint(protocol), string('localhost'), port.to_bytes(2, 'big'), encode_varint(next_state))
+
+def recv_frame(client: socket.socket, received: bytearray, decrypt=None) -> bytes:
+    '''
+    Body of the next frame, without its length. received holds the bytes read past it, decrypted by decrypt when given.
+    '''
+    while True:
+        try:
+            length, offset = decode_varint(received)
+            if len(received) - offset >= length:
+                data = bytes(received[offset:offset + length])
+                del received[:offset + length]
+                return data
+        except struct.error:
+            pass
+        chunk = client.recv(65536)
+        if not chunk:
+            raise ConnectionError('closed')
+        received += decrypt.update(chunk) if decrypt else chunk
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def connect(listener: ConnectionListener, state: ConnectionState = ConnectionState.PLAY, buffer_size: int = None) -> tuple:
+    '''
+    Starts a Connection of the listener in the given state over a socket pair, returning it with the client end.
+    buffer_size shrinks both socket buffers, so the connection backs up sooner.
+    '''
+    server, client = socket.socketpair()
+    if buffer_size:
+        for sock in (server, client):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+    client.settimeout(5.0)
+    connection = Connection(server, ('127.0.0.1', 0), listener)
+    connection.packet_state.state = state
+    listener.connections.add(connection)
+    connection.start(listener.loop_group.next_loop())
+    return connection, client
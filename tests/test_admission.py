@@ -0,0 +1,129 @@
+import json
+import pickle
+import socket
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import frame, handshake, wait_for
+from networking.admission import AdmissionController, TokenBucket
+from networking.protocol import ConnectionState
+from networking.varint import decode_varint
+
+
+def _recv_all(client: socket.socket) -> bytes:
+    received = b''
+    while True:
+        data = client.recv(65536)
+        if not data:
+            return received
+        received += data
+
+def _disconnect_reason(data: bytes) -> str:
+    length, offset = decode_varint(data)
+    assert data[offset] == 0x00
+    size, start = decode_varint(data, offset + 1)
+    return json.loads(data[start:start + size])['text']
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2.0, burst=2, now=0.0)
+    assert bucket.take(0.0) and bucket.take(0.0)
+    assert not bucket.take(0.0)
+    assert bucket.wait(0.0) == pytest.approx(0.5)
+    assert bucket.take(0.5)
+    assert not bucket.full(0.5) and bucket.full(1.5)
+
+def test_pending_slots():
+    admission = AdmissionController(max_pending=2)
+    assert admission.accept() and admission.accept()
+    assert not admission.accept()
+    admission.release()
+    assert admission.accept()
+    assert admission.pending == 2 and admission.rejected['pending'] == 1
+
+def test_logins_are_throttled_per_ip():
+    admission = AdmissionController(ip_rate=0.001, ip_burst=2)
+    assert admission.allow_login('10.0.0.1') and admission.allow_login('10.0.0.1')
+    assert not admission.allow_login('10.0.0.1')
+    assert admission.allow_login('10.0.0.2')
+    assert admission.rejected['throttled'] == 1
+
+def test_shared_ips_can_be_exempted():
+    admission = AdmissionController(ip_burst=1, exempt_ips=['10.0.0.1'])
+    assert all(admission.allow_login('10.0.0.1') for _ in range(10))
+    assert admission.allow_login('10.0.0.2') and not admission.allow_login('10.0.0.2')
+    admission.ip_rate = None
+    assert admission.allow_login('10.0.0.2')
+
+def test_pickles_as_its_configuration():
+    admission = AdmissionController(max_pending=2, login_rate=5.0, exempt_ips=['10.0.0.1'])
+    assert admission.accept()
+    copy = pickle.loads(pickle.dumps(admission))
+    assert (copy.max_pending, copy.exempt_ips, copy._logins.rate) == (2, frozenset(['10.0.0.1']), 5.0)
+    assert copy.pending == 0
+
+def test_idle_ips_are_pruned(monkeypatch):
+    monkeypatch.setattr(AdmissionController, 'PRUNE_AT', 4)
+    admission = AdmissionController(ip_rate=1000.0, ip_burst=1)
+    for i in range(100):
+        assert admission.allow_login(f'10.0.0.{i}')
+        time.sleep(0.002)
+    assert len(admission._ips) < 100
+
+def test_login_queue_admits_at_the_login_rate():
+    admission = AdmissionController(login_rate=20.0, login_burst=1, max_login_queue=3)
+    assert all(admission.queue_login(i) for i in range(3))
+    assert not admission.queue_login(3)
+    assert [entry for _, entry in admission.admit()] == [0]
+    assert admission.admit() == []
+    assert 0 < admission.next_admission() <= 0.05
+    time.sleep(0.06)
+    assert [entry for _, entry in admission.admit()] == [1]
+    assert admission.drain() == [2] and admission.next_admission() is None
+
+@pytest.mark.parametrize('listener', [{'admission': AdmissionController(ip_burst=1)}], indirect=True)
+def test_throttled_login_gets_a_disconnect(listener):
+    port = listener.server.getsockname()[1]
+    with socket.create_connection(('127.0.0.1', port), timeout=5.0) as first:
+        first.sendall(handshake(port, 2))
+        assert wait_for(lambda: len(listener.connections) == 1)
+        with socket.create_connection(('127.0.0.1', port), timeout=5.0) as second:
+            second.sendall(handshake(port, 2))
+            assert _disconnect_reason(_recv_all(second)).startswith('Connection throttled!')
+        # Server list pings are not throttled
+        with socket.create_connection(('127.0.0.1', port), timeout=5.0) as ping:
+            ping.sendall(handshake(port, 1) + frame(b'\x00'))
+            assert ping.recv(65536)
+    assert wait_for(lambda: listener.admission.pending == 0)
+
+@pytest.mark.parametrize('listener', [{'admission': AdmissionController(login_rate=5.0, login_burst=1)}], indirect=True)
+def test_logins_wait_for_their_turn(listener):
+    port = listener.server.getsockname()[1]
+    clients = [socket.create_connection(('127.0.0.1', port), timeout=5.0) for _ in range(3)]
+    try:
+        start = time.monotonic()
+        for client in clients:
+            client.sendall(handshake(port, 2))
+        assert wait_for(lambda: len(listener.connections) == 3)
+        # Two of them waited one login interval each
+        assert time.monotonic() - start >= 0.3
+        assert all(connection.packet_state.state == ConnectionState.LOGIN for connection in listener.connections)
+        assert listener.admission.pending == 3
+    finally:
+        for client in clients:
+            client.close()
+    assert wait_for(lambda: listener.admission.pending == 0)
+
+@pytest.mark.parametrize('listener', [{'admission': AdmissionController(max_pending=1)}], indirect=True)
+def test_pending_limit_closes_new_sockets(listener):
+    port = listener.server.getsockname()[1]
+    with socket.create_connection(('127.0.0.1', port), timeout=5.0) as first:
+        assert wait_for(lambda: listener.admission.pending == 1)
+        with socket.create_connection(('127.0.0.1', port), timeout=5.0) as second:
+            assert second.recv(64) == b''
+        first.sendall(handshake(port, 1) + frame(b'\x00'))
+        assert first.recv(65536)
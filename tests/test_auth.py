@@ -0,0 +1,120 @@
+import os
+import pytest
+import socket
+import sys
+import time
+import uuid
+from concurrent.futures import wait
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from cryptography.hazmat.primitives.serialization import load_der_public_key
+from fake_session_server import FakeSessionServer
+from helpers import frame, handshake, recv_frame, string
+from networking.auth import SessionAuthenticator
+from networking.data_type import BufferedPacket
+from networking.exception import AuthenticationError
+from networking.mc_crypto import encrypt_rsa, gen_ciphers
+from networking.varint import encode_varint
+
+
+@pytest.fixture
+def session_server():
+    server = FakeSessionServer().start()
+    yield server
+    server.stop()
+
+def test_confirmed_player(session_server):
+    authenticator = SessionAuthenticator(session_server.endpoint)
+    try:
+        profile = authenticator.has_joined('Steve', 'abc').result(5.0)
+        assert profile['name'] == 'Steve'
+        assert uuid.UUID(profile['id'])
+        assert set(authenticator.latency_percentiles()) == {50, 90, 99}
+    finally:
+        authenticator.close()
+
+def test_rejected_player(session_server):
+    session_server.rejected.add('Alex')
+    authenticator = SessionAuthenticator(session_server.endpoint)
+    try:
+        with pytest.raises(AuthenticationError):
+            authenticator.has_joined('Alex', 'abc').result(5.0)
+    finally:
+        authenticator.close()
+
+def test_server_errors_are_retried(session_server):
+    session_server.fail_statuses = [503, 502]
+    authenticator = SessionAuthenticator(session_server.endpoint, retries=2)
+    try:
+        assert authenticator.has_joined('Steve', 'abc').result(5.0)['name'] == 'Steve'
+        assert session_server.requests == 3
+    finally:
+        authenticator.close()
+
+def test_timeout(session_server):
+    session_server.delay = 1.0
+    authenticator = SessionAuthenticator(session_server.endpoint, timeout=0.1, retries=0)
+    try:
+        start = time.monotonic()
+        with pytest.raises(AuthenticationError):
+            authenticator.has_joined('Steve', 'abc').result(5.0)
+        assert time.monotonic() - start < 0.9
+    finally:
+        authenticator.close()
+
+def test_bounded_concurrency(session_server):
+    session_server.delay = 0.1
+    authenticator = SessionAuthenticator(session_server.endpoint, max_concurrency=2)
+    try:
+        futures = [authenticator.has_joined(f'Player{i}', 'abc') for i in range(6)]
+        wait(futures, 5.0)
+        assert all(future.result()['name'] for future in futures)
+        assert session_server.max_in_flight <= 2
+    finally:
+        authenticator.close()
+
+
+@pytest.fixture
+def listener_options(session_server) -> dict:
+    return {'authenticator': SessionAuthenticator(session_server.endpoint)}
+
+def test_online_login_completes_asynchronously(session_server, listener):
+    session_server.delay = 0.2
+    client = socket.create_connection(listener.server.getsockname())
+    try:
+        client.settimeout(5.0)
+        port = listener.server.getsockname()[1]
+        client.sendall(handshake(port, 2))
+        client.sendall(frame(b'\x00', string('Steve'), uuid.uuid4().bytes))
+
+        received = bytearray()
+        request = BufferedPacket().wrap(recv_frame(client, received), auto_flip=True)
+        assert request.read_varint() == 0x01
+        request.read(request.read_varint())  # empty server id
+        public_der = request.read(request.read_varint())
+        verify_token = request.read(request.read_varint())
+        public_key = load_der_public_key(bytes(public_der))
+        shared_secret = os.urandom(16)
+        encrypted_secret = encrypt_rsa(shared_secret, public_key)
+        encrypted_token = encrypt_rsa(bytes(verify_token), public_key)
+        client.sendall(frame(b'\x01', encode_varint(len(encrypted_secret)), encrypted_secret, encode_varint(len(encrypted_token)), encrypted_token))
+        _, decrypt = gen_ciphers(shared_secret)
+
+        # A second login is served by the same loop while the first one waits on the session server
+        other = socket.create_connection(listener.server.getsockname())
+        other.settimeout(1.0)
+        other.sendall(handshake(port, 2))
+        other.sendall(frame(b'\x00', string('Alex'), uuid.uuid4().bytes))
+        assert recv_frame(other, bytearray())[0] == 0x01
+        other.close()
+
+        set_compression = recv_frame(client, received, decrypt)
+        assert set_compression == b'\x03' + encode_varint(listener.compression_threshold)
+        login_success = recv_frame(client, received, decrypt)
+        assert login_success[:2] == b'\x00\x02'
+        assert uuid.UUID(bytes=login_success[2:18]) == uuid.uuid3(uuid.NAMESPACE_OID, 'Steve')
+        steve = listener.connections.by_uuid(uuid.uuid3(uuid.NAMESPACE_OID, 'Steve'))
+        assert steve is not None and listener.connections.by_username('steve') is steve
+    finally:
+        client.close()
@@ -0,0 +1,50 @@
+import os
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import connect, wait_for
+from networking.packet import ClientboundPacket
+from networking.packet.client_bound.play import CKeepAlive
+from networking.packet.schema import RemainingBytes
+
+
+class CChunk(ClientboundPacket, packet_id=0x28):
+    fields = [('data', RemainingBytes)]
+
+@pytest.fixture
+def listener_options() -> dict:
+    return {'high_water_mark': 256 << 10, 'low_water_mark': 64 << 10, 'max_queued_bytes': 4 << 20, 'slow_client_timeout': 0.5}
+
+def test_water_marks(listener):
+    connection, client = connect(listener, buffer_size=16384)
+    for _ in range(20):
+        connection.send(CChunk(os.urandom(32768)))
+    assert wait_for(lambda: not connection.writable)
+    assert connection.queued_bytes > listener.high_water_mark
+    assert connection.send(CKeepAlive(1), droppable=True).cancelled()
+    assert listener.broadcast(CKeepAlive(2), droppable=True) == 0
+    resumed = connection.when_writable()
+    assert not resumed.done()
+
+    received = 0
+    while not resumed.done():
+        received += len(client.recv(1 << 16))
+    assert resumed.result() is None
+    assert connection.writable and connection.queued_bytes <= listener.low_water_mark
+    assert listener.broadcast(CKeepAlive(3), droppable=True) == 1
+    assert not connection.connection_stop_event.is_set()
+
+def test_stalled_client_is_disconnected(listener):
+    connection, client = connect(listener, buffer_size=16384)
+    for _ in range(20):
+        connection.send(CChunk(os.urandom(32768)))
+    assert wait_for(lambda: not connection.writable)
+    assert not connection.connection_closed_event.is_set()
+    assert connection.connection_closed_event.wait(2.0)
+
+def test_queue_limit_disconnects_right_away(listener):
+    connection, client = connect(listener, buffer_size=16384)
+    connection.send(*(CChunk(os.urandom(65536)) for _ in range(80)))
+    assert connection.connection_closed_event.wait(0.4)
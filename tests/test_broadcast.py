@@ -0,0 +1,99 @@
+import os
+import pytest
+import socket
+import sys
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import recv_frame
+from networking.connection import Connection, ConnectionListener
+from networking.mc_crypto import gen_ciphers
+from networking.packet import ClientboundPacket, SharedFrame
+from networking.packet.client_bound.play import CKeepAlive
+from networking.packet.schema import RemainingBytes
+from networking.protocol import ConnectionState
+from networking.varint import decode_varint
+
+
+class CChunk(ClientboundPacket, packet_id=0x28):
+    fields = [('data', RemainingBytes)]
+
+class _Client:
+    def __init__(self, listener: ConnectionListener, state=ConnectionState.PLAY, threshold=-1, encrypted=False):
+        server, self.sock = socket.socketpair()
+        self.sock.settimeout(5.0)
+        self.connection = Connection(server, ('127.0.0.1', 0), listener)
+        p_state = self.connection.packet_state
+        p_state.state = state
+        p_state.compress_threshold = threshold
+        self.decrypt = None
+        if encrypted:
+            shared_secret = os.urandom(16)
+            p_state.encrypt_cipher, _ = gen_ciphers(shared_secret)
+            _, self.decrypt = gen_ciphers(shared_secret)
+            p_state.encrypted = True
+        self.received = bytearray()
+        listener.connections.add(self.connection)
+        self.connection.start(listener.loop_group.next_loop())
+
+    def recv_frame(self) -> bytes:
+        return recv_frame(self.sock, self.received, self.decrypt)
+
+    def recv_packet(self) -> bytes:
+        '''
+        Packet id and data, inflated when compressed.
+        '''
+        frame = self.recv_frame()
+        if self.connection.packet_state.compress_threshold < 0:
+            return frame
+        data_length, offset = decode_varint(frame)
+        return frame[offset:] if data_length == 0 else zlib.decompress(frame[offset:])
+
+@pytest.fixture
+def listener_options() -> dict:
+    return {'event_loops': 2}
+
+def test_broadcast_reaches_every_player(listener):
+    plain = _Client(listener)
+    compressed = _Client(listener, threshold=16)
+    encrypted = _Client(listener, threshold=16, encrypted=True)
+    configuring = _Client(listener, state=ConnectionState.CONFIGURATION)
+
+    assert listener.broadcast(CKeepAlive(42)) == 3
+    large = CChunk(os.urandom(64) * 100)
+    assert listener.broadcast(large) == 3
+    expected_large = b'\x28' + large.data
+    for client in (plain, compressed, encrypted):
+        assert client.recv_packet() == b'\x27' + (42).to_bytes(8, 'big')
+        assert client.recv_packet() == expected_large
+    configuring.sock.settimeout(0.2)
+    with pytest.raises(socket.timeout):
+        configuring.sock.recv(1)
+
+def test_predicate_and_recipients(listener):
+    clients = [_Client(listener) for _ in range(4)]
+    chosen = {clients[1].connection, clients[2].connection}
+    assert listener.broadcast(CKeepAlive(1), predicate=lambda connection: connection in chosen) == 2
+    assert listener.broadcast(CKeepAlive(2), recipients=[clients[3].connection]) == 1
+    assert clients[1].recv_packet() == clients[2].recv_packet() == b'\x27' + (1).to_bytes(8, 'big')
+    assert clients[3].recv_packet() == b'\x27' + (2).to_bytes(8, 'big')
+    clients[0].sock.settimeout(0.2)
+    with pytest.raises(socket.timeout):
+        clients[0].sock.recv(1)
+
+def test_broadcast_keeps_its_place_among_sends(listener):
+    client = _Client(listener, state=ConnectionState.CONFIGURATION)
+    expected = []
+    for i in range(0, 300, 3):
+        client.connection.send(CKeepAlive(i))
+        listener.broadcast(CKeepAlive(i + 1), state=None)
+        client.connection.send(CKeepAlive(i + 2))
+        expected += [i, i + 1, i + 2]
+    assert [int.from_bytes(client.recv_packet()[1:], 'big') for _ in expected] == expected
+
+def test_shared_frame_compresses_once():
+    shared = SharedFrame(CChunk(b'x' * 4096))
+    assert shared.frame(256) is shared.frame(256)
+    assert shared.frame(-1) is not shared.frame(256)
+    assert b''.join(shared.frame(-1))[2:] == b'\x28' + shared.body
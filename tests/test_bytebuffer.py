@@ -1,9 +1,10 @@
 import pytest
+import struct
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-from networking.data_type import BufferedPacket
+from networking.data_type import ByteBuffer, BufferedPacket
 
 @pytest.mark.parametrize('value', [0, 1, 127, 128, 255, 300, -1, -300, 2147483647, -2147483648])
 def test_varint_roundtrip(value):
@@ -11,3 +12,95 @@ def test_varint_roundtrip(value):
     buf.write_varint(value)
     buf.flip()
     assert buf.read_varint() == value
+
+@pytest.mark.parametrize('byte_order', ['big', 'little'])
+def test_primitive_roundtrip(byte_order):
+    buf = BufferedPacket(byte_order=byte_order)
+    buf.write_int32(-5)
+    buf.write(b'raw')
+    buf.write_double(1.5)
+    buf.flip()
+    assert buf.read_int32() == -5
+    assert buf.read(3) == b'raw'
+    assert buf.read_double() == 1.5
+
+def test_little_endian_packs_little():
+    buf = BufferedPacket(byte_order='little')
+    buf.write_uint16(0x0102)
+    assert bytes(buf.buffer) == b'\x02\x01'
+
+def test_growth_keeps_views_valid():
+    buf = ByteBuffer(capacity=4)
+    buf.write(b'abcd')
+    view = buf.buffer
+    buf.write(b'efgh' * 100)
+    assert bytes(view) == b'abcd'
+    assert buf.buffer_size == 404
+    buf.flip()
+    assert bytes(buf.read_view(4)) == b'abcd'
+    assert buf.pos() == 4
+
+def test_wrap_view_is_not_written_through():
+    source = bytearray(b'\x00\x05')
+    buf = BufferedPacket().wrap(memoryview(source), auto_flip=True)
+    buf.write(b'\x06')
+    buf.flip()
+    assert source == bytearray(b'\x00\x05')
+    assert buf.read_uint16() == 5
+    assert buf.read_uint8() == 6
+
+@pytest.mark.parametrize('data', [b'hello', memoryview(bytearray(b'hello'))])
+def test_wrapped_memory_is_not_written_after_clear(data):
+    buf = BufferedPacket().wrap(data, auto_flip=True)
+    buf.clear()
+    buf.write(b'XY')
+    buf.write_uint8(0x21)
+    assert bytes(data) == b'hello'
+    assert bytes(buf.buffer) == b'XY!'
+
+def test_bitset_lengths_are_not_cached():
+    cached = len(BufferedPacket()._codecs.structs)
+    for length in range(40):
+        bitset = (1 << (64 * length - 2)) | 1 if length else 0
+        buf = BufferedPacket()
+        buf.write_bitset(bitset)
+        buf.flip()
+        assert buf.read_bitset() == bitset
+    assert len(BufferedPacket()._codecs.structs) == cached
+    buf = BufferedPacket()
+    buf.write_varint(2**20)
+    buf.write_int64(1)
+    buf.flip()
+    with pytest.raises(struct.error):
+        buf.read_bitset()
+
+def test_short_read_raises():
+    buf = BufferedPacket().wrap(b'\x01', auto_flip=True)
+    with pytest.raises(struct.error):
+        buf.read_int32()
+
+@pytest.mark.parametrize('byte_order', ['big', 'little'])
+def test_fields_roundtrip(byte_order):
+    buf = BufferedPacket(byte_order=byte_order)
+    buf.write_fields('dddffB', 1.5, 64.0, -3.25, 90.0, 12.5, 1)
+    buf.write_fields('>i', 7)
+    buf.flip()
+    assert buf.read_many('dddffB') == (1.5, 64.0, -3.25, 90.0, 12.5, 1)
+    assert buf.read_many('>i') == (7,)
+
+@pytest.mark.parametrize('string', ['Steve', 'ö' * 16, '😀' * 8])
+def test_utf8_string_roundtrip(string):
+    buf = BufferedPacket()
+    buf.write_utf8_string(string, 16)
+    buf.flip()
+    assert buf.read_utf8_string(16) == string
+
+@pytest.mark.parametrize('string', ['a' * 17, '😀' * 9])
+def test_utf8_string_too_long(string):
+    with pytest.raises(ValueError):
+        BufferedPacket().write_utf8_string(string, 16)
+    buf = BufferedPacket()
+    buf.write_utf8_string(string, 32767)
+    buf.flip()
+    with pytest.raises(ValueError):
+        buf.read_utf8_string(16)
@@ -0,0 +1,116 @@
+import json
+import pytest
+import socket
+import sys
+import threading
+import time
+from multiprocessing import Pipe
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import frame, handshake, recv_frame, wait_for
+from networking.cluster import REUSE_PORT, Cluster, ClusterChannel, ClusterHub
+from networking.connection_registry import ConnectionRegistry
+from networking.packet.packet_connection import PacketConnectionState
+from networking.status import ServerStatus
+from networking.varint import decode_varint
+
+
+def _status(port: int) -> dict:
+    with socket.create_connection(('127.0.0.1', port), timeout=5.0) as client:
+        client.sendall(handshake(port, 1) + frame(b'\x00'))
+        body = recv_frame(client, bytearray())
+    assert body[0] == 0x00
+    size, start = decode_varint(body[1:])
+    return json.loads(body[1 + start:1 + start + size])
+
+
+class _FakeListener:
+    def __init__(self):
+        self.connections = ConnectionRegistry()
+        self.status = ServerStatus()
+        self.cluster = None
+
+
+class _FakeConnection:
+    def __init__(self, username: str):
+        self.packet_state = PacketConnectionState()
+        self.packet_state.username = username
+        self.packet_state.uuid = username
+        self.interrupted = threading.Event()
+
+    def interrupt(self):
+        self.interrupted.set()
+
+
+def test_hub_sums_players_and_forwards_topics():
+    (hub_0, worker_0), (hub_1, worker_1) = Pipe(), Pipe()
+    hub = ClusterHub([hub_0, hub_1])
+    thread = threading.Thread(target=hub.run)
+    thread.start()
+    try:
+        worker_0.send(('players', 2))
+        assert worker_0.recv() == worker_1.recv() == ('players', 2)
+        worker_1.send(('players', 3))
+        assert worker_0.recv() == worker_1.recv() == ('players', 5)
+        worker_0.send(('chat', 'hello'))
+        assert worker_1.recv() == ('chat', 'hello')
+        assert not worker_0.poll(0.1)
+        # Players of a worker that exits are gone
+        worker_0.close()
+        assert worker_1.recv() == ('players', 3)
+        hub.stop()
+        assert worker_1.recv() == ('stop',)
+    finally:
+        worker_1.close()
+        thread.join(5.0)
+    assert not thread.is_alive()
+
+def test_channel_reports_players_and_handles_topics():
+    hub_end, worker_end = Pipe()
+    listener = _FakeListener()
+    steve = _FakeConnection('Steve')
+    listener.connections.add(steve)
+    listener.connections.identify(steve)
+    channel = ClusterChannel(worker_end, listener)
+    assert listener.cluster is channel
+    chats = []
+    channel.subscribe('chat', chats.append)
+    thread = threading.Thread(target=channel.run)
+    thread.start()
+    try:
+        assert hub_end.recv() == ('players', 1)
+        hub_end.send(('players', 7))
+        assert wait_for(lambda: listener.status.online_players() == 7)
+        hub_end.send(('kick', 'steve'))
+        assert steve.interrupted.wait(2.0)
+        channel.publish('chat', 'hi')
+        assert chats == ['hi'] and hub_end.recv() == ('chat', 'hi')
+        hub_end.send(('stop',))
+        thread.join(5.0)
+        assert not thread.is_alive()
+    finally:
+        hub_end.close()
+
+@pytest.mark.skipif(not REUSE_PORT, reason='SO_REUSEPORT not supported')
+def test_workers_share_the_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    cluster = Cluster(2, address='127.0.0.1', port=port, event_loops=1)
+    cluster.start()
+    try:
+        deadline = time.monotonic() + 30.0
+        while True:
+            try:
+                status = _status(port)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        assert status['players'] == {'max': 20, 'online': 0, 'sample': []}
+        for _ in range(10):
+            assert _status(port)['version']['protocol'] == 769
+    finally:
+        cluster.stop()
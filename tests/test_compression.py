@@ -0,0 +1,139 @@
+import os
+import pytest
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import connect, frame
+from networking.mc_crypto import gen_ciphers
+from networking import socket_io
+from networking.exception import DataCorruptedError, ProtocolError
+from networking.packet.client_bound.login import CLoginPluginRequest, CSetCompression
+from networking.packet.packet_connection import PacketConnectionState
+from networking.packet.server_bound.status import SPingRequest
+from networking.protocol import ConnectionState
+from networking.socket_io import MCPacketInputStream, MCPacketOutputStream
+from networking.varint import encode_varint
+
+
+def _read(server, client, data: bytes, threshold: int):
+    p_state = PacketConnectionState()
+    p_state.state = ConnectionState.STATUS
+    p_state.compress_threshold = threshold
+    stream = MCPacketInputStream(server, p_state)
+    client.sendall(data)
+    stream.fill()
+    return stream.read_packet(p_state)
+
+def _ping(payload: int) -> bytes:
+    return b'\x01' + payload.to_bytes(8, 'big')
+
+def _compressed_frame(data: bytes, data_length: int = None) -> bytes:
+    return frame(encode_varint(len(data) if data_length is None else data_length), zlib.compress(data))
+
+def test_set_compression_switches_outbound_frames(pair):
+    server, client = pair
+    p_state = PacketConnectionState()
+    stream = MCPacketOutputStream(server, p_state)
+    stream.write_packet(CSetCompression(64))
+    assert p_state.compress_threshold == 64
+    stream.write_packet(CLoginPluginRequest('test:data', b'x' * 1000))
+    assert stream.flush()
+    received = b''
+    while len(received) < 3:
+        received += client.recv(65536)
+    # Set Compression itself goes out uncompressed
+    assert received[:3] == b'\x02\x03\x40'
+    expected_after = bytes(CLoginPluginRequest('test:data', b'x' * 1000).get_bytes(p_state, 64).buffer)
+    while len(received) < 3 + len(expected_after):
+        received += client.recv(65536)
+    assert received[3:] == expected_after
+
+def test_inbound_uncompressed_under_threshold(pair):
+    packet = _read(*pair, frame(b'\x00', _ping(42)), 256)
+    assert isinstance(packet, SPingRequest)
+    assert packet._timestamp == 42
+
+def test_inbound_compressed(pair):
+    packet = _read(*pair, _compressed_frame(_ping(7)), 0)
+    assert isinstance(packet, SPingRequest)
+    assert packet._timestamp == 7
+
+def test_undersized_compressed_rejected(pair):
+    with pytest.raises(ProtocolError):
+        _read(*pair, _compressed_frame(_ping(7)), 256)
+
+def test_oversized_data_length_rejected(pair):
+    with pytest.raises(ProtocolError):
+        _read(*pair, _compressed_frame(_ping(7), data_length=MCPacketInputStream.MAX_DATA_LENGTH + 1), 0)
+
+def test_data_length_mismatch_rejected(pair):
+    with pytest.raises(DataCorruptedError):
+        _read(*pair, _compressed_frame(_ping(7), data_length=20), 0)
+
+def test_offloaded_frames_keep_order_under_encryption(pair):
+    server, client = pair
+    server.setblocking(False)
+    shared_secret = os.urandom(16)
+    p_state = PacketConnectionState()
+    p_state.encrypt_cipher, _ = gen_ciphers(shared_secret)
+    p_state.encrypted = True
+    p_state.compress_threshold = 256
+    _, decrypt_cipher = gen_ciphers(shared_secret)
+    packets = []
+    for i in range(12):
+        size = MCPacketOutputStream.OFFLOAD_THRESHOLD * 4 if i % 3 == 0 else 300 * i
+        packets.append(CLoginPluginRequest(f'test:{i}', os.urandom(size // 2) * 2))
+    expected = b''.join(bytes(packet.get_bytes(p_state, 256).buffer) for packet in packets)
+
+    with ThreadPoolExecutor(4) as pool:
+        stream = MCPacketOutputStream(server, p_state, pool)
+        for packet in packets:
+            stream.write_packet(packet)
+        deadline = time.monotonic() + 5.0
+        while stream.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert not stream.pending
+    received = b''
+    while not stream.flush() or len(received) < len(expected):
+        received += client.recv(1 << 20)
+    assert decrypt_cipher.update(received) == expected
+
+_frame_body = socket_io.frame_body
+
+def _failing_frame_body(packet_id, body, threshold, level):
+    if len(body) >= MCPacketOutputStream.OFFLOAD_THRESHOLD:
+        raise MemoryError('framing failed')
+    return _frame_body(packet_id, body, threshold, level)
+
+def test_failed_offloaded_frame_stops_the_stream(pair, monkeypatch):
+    monkeypatch.setattr(socket_io, 'frame_body', _failing_frame_body)
+    server, client = pair
+    p_state = PacketConnectionState()
+    p_state.compress_threshold = 256
+    with ThreadPoolExecutor(1) as pool:
+        stream = MCPacketOutputStream(server, p_state, pool)
+        stream.write_packet(CLoginPluginRequest('test:small', b'x' * 10))
+        stream.write_packet(CLoginPluginRequest('test:large', b'x' * MCPacketOutputStream.OFFLOAD_THRESHOLD))
+        stream.write_packet(CLoginPluginRequest('test:after', b'x' * 10))
+    assert isinstance(stream.error, MemoryError)
+    assert not stream.pending and stream.queued_bytes == len(CLoginPluginRequest('test:small', b'x' * 10).get_bytes(p_state, 256).buffer)
+    stream.write_packet(CLoginPluginRequest('test:later', b'x' * 10))
+    assert not stream.pending
+
+def test_failed_offloaded_frame_closes_the_connection(listener, monkeypatch):
+    monkeypatch.setattr(socket_io, 'frame_body', _failing_frame_body)
+    connection, client = connect(listener, ConnectionState.LOGIN)
+    connection.packet_state.compress_threshold = 256
+    try:
+        sent = connection.send(CLoginPluginRequest('test:large', b'x' * MCPacketOutputStream.OFFLOAD_THRESHOLD))
+        with pytest.raises(MemoryError):
+            sent.result(timeout=5.0)
+        assert connection.connection_closed_event.wait(5.0)
+        while client.recv(65536):
+            pass
+    finally:
+        client.close()
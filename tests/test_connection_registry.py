@@ -0,0 +1,98 @@
+import sys
+import threading
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.connection_registry import ConnectionRegistry
+from networking.packet.packet_connection import PacketConnectionState
+
+
+class _FakeConnection:
+    def __init__(self, ip: str = '10.0.0.1'):
+        self.packet_state = PacketConnectionState()
+        self.packet_state.client_ip = ip
+
+    def log_in(self, username: str) -> '_FakeConnection':
+        self.packet_state.username = username
+        self.packet_state.uuid = uuid.uuid3(uuid.NAMESPACE_OID, username)
+        return self
+
+
+def test_ids_are_never_reused():
+    registry = ConnectionRegistry()
+    first, second = _FakeConnection(), _FakeConnection()
+    assert registry.add(first) == 1 and registry.add(second) == 2
+    registry.remove(first)
+    third = _FakeConnection()
+    assert registry.add(third) == 3
+    assert registry.get(1) is None and registry.get(3) is third
+    assert first not in registry and third in registry
+    assert len(registry) == 2
+
+def test_lookups():
+    registry = ConnectionRegistry()
+    steve, alex, other = _FakeConnection(), _FakeConnection(), _FakeConnection('10.0.0.2')
+    for connection in (steve, alex, other):
+        registry.add(connection)
+    assert registry.identify(steve.log_in('Steve')) is None
+    registry.identify(alex.log_in('Alex'))
+    assert registry.by_username('sTEVE') is steve
+    assert registry.by_uuid(alex.packet_state.uuid) is alex
+    assert registry.by_ip('10.0.0.1') == (steve, alex) and registry.count_ip('10.0.0.1') == 2
+    # Not logged in yet
+    assert registry.by_username('nobody') is None
+
+    registry.remove(steve)
+    assert registry.by_username('Steve') is None and registry.by_ip('10.0.0.1') == (alex,)
+    registry.remove(alex)
+    assert registry.count_ip('10.0.0.1') == 0 and registry.by_ip('10.0.0.1') == ()
+    # Removing twice is harmless
+    registry.remove(alex)
+    assert list(registry) == [other]
+
+def test_second_login_replaces_the_first():
+    registry = ConnectionRegistry()
+    first, second = _FakeConnection(), _FakeConnection()
+    registry.add(first)
+    registry.add(second)
+    registry.identify(first.log_in('Steve'))
+    assert registry.identify(second.log_in('Steve')) is first
+    assert registry.by_username('Steve') is second
+    # The first connection closing later must not unindex the second
+    registry.remove(first)
+    assert registry.by_uuid(second.packet_state.uuid) is second
+
+def test_closed_connection_is_not_identified():
+    registry = ConnectionRegistry()
+    connection = _FakeConnection()
+    registry.add(connection)
+    registry.remove(connection)
+    assert registry.identify(connection.log_in('Steve')) is None
+    assert registry.by_username('Steve') is None
+
+def test_snapshot_is_stable_while_connections_change():
+    registry = ConnectionRegistry()
+    connections = [_FakeConnection() for _ in range(100)]
+    for connection in connections:
+        registry.add(connection)
+    snapshot = registry.snapshot()
+    assert registry.snapshot() is snapshot
+
+    stop = threading.Event()
+    def churn():
+        while not stop.is_set():
+            connection = _FakeConnection()
+            registry.add(connection)
+            registry.remove(connection)
+    thread = threading.Thread(target=churn)
+    thread.start()
+    try:
+        for _ in range(200):
+            # Iterating never sees the registry change underneath it
+            assert all(connection in connections for connection in registry if connection.packet_state.connection_id <= 100)
+    finally:
+        stop.set()
+        thread.join()
+    assert snapshot == tuple(connections)
+    assert registry.snapshot() == tuple(connections)
@@ -0,0 +1,137 @@
+import pytest
+import struct
+import sys
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import connect, packet_frame, wait_for
+from networking.exception import ServerBusyError
+from networking.packet.client_bound.play import CKeepAlive
+from networking.packet.dispatch import GameQueue, HandlerPool, Route
+from networking.packet.server_bound.login import SEncryptionResponse, SLoginAcknowledged, SLoginPluginResponse, SLoginStart
+from networking.packet.server_bound.play import SKeepAlive, SSetPlayerMovementFlags
+from networking.protocol import ConnectionState
+from networking.varint import encode_varint
+
+
+class _Handled:
+    def __init__(self, handle):
+        self.handle = handle
+
+
+class _FakeConnection:
+    def __init__(self):
+        self.connection_stop_event = threading.Event()
+        self.packet_state = object()
+        self.sent = []
+
+    def send(self, *packets):
+        self.sent.append(packets)
+
+    def interrupt(self):
+        self.connection_stop_event.set()
+
+
+def test_routes():
+    assert SLoginStart.route == SEncryptionResponse.route == SLoginPluginResponse.route == Route.WORKER
+    assert SLoginAcknowledged.route == Route.LOOP
+    assert SSetPlayerMovementFlags.route == Route.GAME
+    assert SKeepAlive.route == Route.LOOP
+
+def test_handler_pool_is_bounded():
+    pool = HandlerPool(workers=1, max_queued=2)
+    release = threading.Event()
+    try:
+        blocked = [pool.submit(_Handled(lambda p_state: release.wait()), None) for _ in range(2)]
+        assert pool.queue_depth == 2
+        with pytest.raises(ServerBusyError):
+            pool.submit(_Handled(lambda p_state: None), None).result(1.0)
+        release.set()
+        assert all(future.result(2.0) for future in blocked)
+        assert wait_for(lambda: pool.queue_depth == 0)
+        assert set(pool.latency_percentiles()) == {50, 90, 99}
+    finally:
+        release.set()
+        pool.shutdown()
+
+def test_handler_pool_follows_returned_futures():
+    pool = HandlerPool(workers=1)
+    external = Future()
+    try:
+        future = pool.submit(_Handled(lambda p_state: external), None)
+        assert wait_for(lambda: pool.queue_depth == 0)
+        # The thread is free while the external service answers
+        assert pool.submit(_Handled(lambda p_state: 'other'), None).result(1.0) == 'other'
+        assert not future.done()
+        external.set_result('response')
+        assert future.result(1.0) == 'response'
+        failing = pool.submit(_Handled(lambda p_state: 1 / 0), None)
+        with pytest.raises(ZeroDivisionError):
+            failing.result(1.0)
+    finally:
+        pool.shutdown()
+
+def test_game_queue_keeps_order_and_limits_floods():
+    queue = GameQueue(max_per_connection=3)
+    first, second = _FakeConnection(), _FakeConnection()
+    handled = []
+    for i in range(3):
+        assert queue.put(first, _Handled(lambda p_state, i=i: handled.append(('first', i)) or CKeepAlive(i)))
+    assert not queue.put(first, _Handled(lambda p_state: None))
+    assert queue.put(second, _Handled(lambda p_state: 1 / 0))
+    assert queue.queue_depth == 4
+    assert queue.drain() == 4
+    assert handled == [('first', 0), ('first', 1), ('first', 2)]
+    assert [packets[0].keep_alive_id for packets in first.sent] == [0, 1, 2]
+    assert second.connection_stop_event.is_set()
+    # Draining makes room again
+    assert queue.put(first, _Handled(lambda p_state: None))
+    assert queue.drain() == 1
+
+@pytest.fixture
+def listener_options() -> dict:
+    return {'handler_workers': 1}
+
+def test_slow_handler_blocks_only_its_connection(listener, monkeypatch):
+    release = threading.Event()
+    handled = []
+    def handle(self, p_state):
+        handled.append((self._message_id, threading.current_thread().name))
+        if self._message_id == 1:
+            release.wait(5.0)
+    monkeypatch.setattr(SLoginPluginResponse, 'handle', handle)
+
+    logging_in, login_client = connect(listener, ConnectionState.LOGIN)
+    playing, play_client = connect(listener, ConnectionState.PLAY)
+    try:
+        login_client.sendall(packet_frame(0x02, encode_varint(1) + b'\x00') + packet_frame(0x02, encode_varint(2) + b'\x00'))
+        assert wait_for(lambda: handled)
+        # The other connection keeps being served while the handler blocks
+        reply = playing.request(CKeepAlive(7), SKeepAlive, timeout=5.0)
+        assert play_client.recv(64)
+        play_client.sendall(packet_frame(0x1A, struct.pack('>q', 7)))
+        assert reply.result(2.0).keep_alive_id == 7
+        # Frames behind the blocked one wait their turn
+        assert len(handled) == 1
+        release.set()
+        assert wait_for(lambda: len(handled) == 2)
+        assert [message_id for message_id, _ in handled] == [1, 2]
+        assert all(name.startswith('PacketHandler') for _, name in handled)
+    finally:
+        release.set()
+        login_client.close()
+        play_client.close()
+
+def test_play_packets_run_on_game_thread(listener, monkeypatch):
+    handled = []
+    monkeypatch.setattr(SSetPlayerMovementFlags, 'handle', lambda self, p_state: handled.append((self.flags, threading.current_thread().name)))
+    connection, client = connect(listener, ConnectionState.PLAY)
+    try:
+        client.sendall(b''.join(packet_frame(0x1F, bytes([flags])) for flags in range(5)))
+        assert wait_for(lambda: len(handled) == 5)
+        assert handled == [(flags, 'GameTicker') for flags in range(5)]
+        assert set(listener.game_queue.latency_percentiles()) == {50, 90, 99}
+    finally:
+        client.close()
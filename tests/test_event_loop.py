@@ -0,0 +1,74 @@
+import pytest
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import wait_for
+from networking.connection import Connection
+from networking.event_loop import EventLoop
+from networking.exception import ConnectionClosedError
+from networking.packet.client_bound.configuration import CFinishConfiguration
+from networking.packet.server_bound.configuration import SFinishConfigurationAcknowledged
+from networking.protocol import ConnectionState
+
+
+def test_timers_run_in_deadline_order():
+    loop = EventLoop('TestLoop')
+    loop.start()
+    try:
+        fired = []
+        done = threading.Event()
+        loop.call_later(0.05, fired.append, 'second')
+        loop.call_later(0.01, fired.append, 'first')
+        cancelled = loop.call_later(0.02, fired.append, 'cancelled')
+        cancelled.cancel()
+        loop.call_later(0.1, done.set)
+        assert done.wait(2.0)
+        assert fired == ['first', 'second']
+    finally:
+        loop.stop()
+        loop.join()
+
+def test_iteration_end_runs_after_ready_callbacks():
+    loop = EventLoop('TestLoop')
+    try:
+        order = []
+        done = threading.Event()
+
+        def schedule():
+            loop.call_at_iteration_end(order.append, 'end')
+            loop.call_at_iteration_end(done.set)
+            loop.call_soon(order.append, 'soon')
+            order.append('ready')
+
+        # Both queued before the loop runs, so they are ready in the same iteration
+        loop.call_soon(schedule)
+        loop.call_soon(order.append, 'ready')
+        loop.start()
+        assert done.wait(2.0)
+        assert order[:3] == ['ready', 'ready', 'end']
+    finally:
+        loop.stop()
+        loop.join()
+
+def test_silent_connection_times_out(monkeypatch, listener):
+    monkeypatch.setitem(Connection.READ_TIMEOUTS, ConnectionState.HANDSHAKE, 0.2)
+    with socket.create_connection(listener.server.getsockname()) as client:
+        client.settimeout(5.0)
+        start = time.monotonic()
+        assert client.recv(1) == b''
+        assert time.monotonic() - start < 2.0
+
+# A Connection is set up right away, not once a login handshake arrives
+@pytest.mark.parametrize('listener', [{'fast_status': False}], indirect=True)
+def test_interrupt_fails_pending_requests(listener):
+    with socket.create_connection(listener.server.getsockname()):
+        assert wait_for(lambda: listener.connections)
+        connection = listener.connections.snapshot()[0]
+        reply = connection.request(CFinishConfiguration(), SFinishConfigurationAcknowledged)
+        threading.Timer(0.1, connection.interrupt).start()
+        with pytest.raises(ConnectionClosedError):
+            reply.result(2.0)
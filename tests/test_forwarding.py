@@ -0,0 +1,129 @@
+import hashlib
+import hmac
+import socket
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import frame, handshake, recv_frame, string
+from networking.auth import offline_uuid
+from networking.connection import ConnectionListener
+from networking.data_type import BufferedPacket
+from networking.exception import AuthenticationError
+from networking.forwarding import CHANNEL, read_forwarded_player
+from networking.varint import encode_varint
+
+SECRET = b'forwarding secret'
+PLAYER_UUID = uuid.UUID('069a79f4-44e9-4726-a5be-fca90e38aaf5')
+
+
+def _player_info(secret: bytes, version: int = 1) -> bytes:
+    data = (encode_varint(version) + string('203.0.113.7') + PLAYER_UUID.bytes + string('Notch')
+            + encode_varint(1) + string('textures') + string('e30=') + b'\x01' + string('c2ln'))
+    return hmac.new(secret, data, hashlib.sha256).digest() + data
+
+def _login(listener: ConnectionListener, username: str) -> tuple:
+    client = socket.create_connection(listener.server.getsockname())
+    client.settimeout(5.0)
+    port = listener.server.getsockname()[1]
+    client.sendall(handshake(port, 2) + frame(b'\x00', string(username), uuid.uuid4().bytes))
+    return client, bytearray()
+
+def _read_login_success(client: socket.socket, received: bytearray, listener: ConnectionListener) -> BufferedPacket:
+    assert recv_frame(client, received) == b'\x03' + encode_varint(listener.compression_threshold)
+    login_success = BufferedPacket().wrap(recv_frame(client, received)[1:], auto_flip=True)
+    assert login_success.read_varint() == 0x02
+    return login_success
+
+
+def test_offline_uuid():
+    # As the Notchian server derives it
+    assert offline_uuid('Notch') == uuid.UUID('b50ad385-829d-3141-a216-7e7d7539ba7f')
+    assert offline_uuid('Notch').version == 3
+
+def test_read_forwarded_player():
+    player = read_forwarded_player(SECRET, _player_info(SECRET))
+    assert (player.address, player.uuid, player.username) == ('203.0.113.7', PLAYER_UUID, 'Notch')
+    assert player.properties == [('textures', 'e30=', 'c2ln')]
+
+@pytest.mark.parametrize('data', [_player_info(b'other secret'), _player_info(SECRET)[:-1], _player_info(SECRET, version=0), b''])
+def test_forwarded_player_is_verified(data):
+    with pytest.raises(AuthenticationError):
+        read_forwarded_player(SECRET, data)
+
+@pytest.mark.parametrize('listener', [{'online_mode': False}], indirect=True)
+def test_offline_login(listener):
+    client, received = _login(listener, 'Notch')
+    try:
+        login_success = _read_login_success(client, received, listener)
+        assert login_success.read_uuid() == offline_uuid('Notch')
+        assert login_success.read_utf8_string(16) == 'Notch'
+        assert login_success.read_varint() == 0
+        assert listener.connections.by_username('notch').packet_state.uuid == offline_uuid('Notch')
+        assert listener.admission.pending == 0
+    finally:
+        client.close()
+
+@pytest.mark.parametrize('listener', [{'forwarding_secret': SECRET}], indirect=True)
+def test_forwarded_login(listener):
+    client, received = _login(listener, 'Notch')
+    try:
+        request = BufferedPacket().wrap(recv_frame(client, received), auto_flip=True)
+        assert request.read_varint() == 0x04
+        message_id = request.read_varint()
+        assert request.read_utf8_string(32767) == CHANNEL
+        assert request.read(request.length() - request.pos()) == b'\x01'
+        client.sendall(frame(b'\x02', encode_varint(message_id), b'\x01', _player_info(SECRET)))
+
+        login_success = _read_login_success(client, received, listener)
+        assert login_success.read_uuid() == PLAYER_UUID
+        assert login_success.read_utf8_string(16) == 'Notch'
+        assert login_success.read_varint() == 1
+        assert [login_success.read_utf8_string(32767) for _ in range(2)] == ['textures', 'e30=']
+        assert login_success.read_bool() and login_success.read_utf8_string(32767) == 'c2ln'
+        connection = listener.connections.by_uuid(PLAYER_UUID)
+        assert connection.packet_state.forwarded_ip == '203.0.113.7'
+        assert connection.packet_state.client_ip == '127.0.0.1'
+    finally:
+        client.close()
+
+@pytest.mark.parametrize('listener', [{'forwarding_secret': SECRET}], indirect=True)
+def test_proxy_ip_is_not_throttled(listener):
+    clients = [_login(listener, f'Player{i}') for i in range(2 * listener.admission.ip_burst)]
+    try:
+        for client, received in clients:
+            assert recv_frame(client, received)[0] == 0x04
+    finally:
+        for client, _ in clients:
+            client.close()
+
+@pytest.mark.parametrize('listener', [{'forwarding_secret': SECRET}], indirect=True)
+def test_forwarded_address_is_throttled(listener):
+    for _ in range(listener.admission.ip_burst + 1):
+        client, received = _login(listener, 'Notch')
+        try:
+            request = BufferedPacket().wrap(recv_frame(client, received), auto_flip=True)
+            assert request.read_varint() == 0x04
+            client.sendall(frame(b'\x02', encode_varint(request.read_varint()), b'\x01', _player_info(SECRET)))
+            # Login Success after Set Compression, or a Disconnect
+            reply = recv_frame(client, received)
+        finally:
+            client.close()
+    assert reply[0] == 0x00 and b'throttled' in reply
+    assert listener.admission.rejected['throttled'] == 1
+
+@pytest.mark.parametrize('listener', [{'forwarding_secret': SECRET}], indirect=True)
+def test_login_not_through_the_proxy_is_refused(listener):
+    client, received = _login(listener, 'Notch')
+    try:
+        request = BufferedPacket().wrap(recv_frame(client, received), auto_flip=True)
+        assert request.read_varint() == 0x04
+        # The Notchian client does not understand the request
+        client.sendall(frame(b'\x02', encode_varint(request.read_varint()), b'\x00'))
+        assert recv_frame(client, received)[0] == 0x00
+        assert listener.connections.by_uuid(PLAYER_UUID) is None
+    finally:
+        client.close()
@@ -0,0 +1,45 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import connect, packet_frame, recv_frame, wait_for
+from networking.connection import Connection
+from networking.protocol import ConnectionState
+
+
+@pytest.fixture(autouse=True)
+def keep_alive_intervals(monkeypatch):
+    monkeypatch.setattr(Connection, 'KEEP_ALIVE_INTERVAL', 0.2)
+    monkeypatch.setattr(Connection, 'KEEP_ALIVE_TIMEOUT', 0.5)
+
+@pytest.mark.parametrize('state, keep_alive, answer', [
+    (ConnectionState.CONFIGURATION, 0x04, 0x04),
+    (ConnectionState.PLAY, 0x27, 0x1A),
+])
+def test_answered_keep_alives_measure_latency(listener, state, keep_alive, answer):
+    connection, client = connect(listener, state)
+    try:
+        received = bytearray()
+        for _ in range(3):
+            frame = recv_frame(client, received)
+            assert frame[0] == keep_alive
+            time.sleep(0.02)
+            client.sendall(packet_frame(answer, frame[1:9]))
+        assert wait_for(lambda: connection._keep_alive_id is None)
+        # Smoothed like the Notchian server, from 0
+        assert 5 <= connection.packet_state.latency < 100
+        assert not connection.connection_stop_event.is_set()
+    finally:
+        client.close()
+
+def test_unanswered_keep_alive_disconnects(listener):
+    connection, client = connect(listener)
+    try:
+        assert recv_frame(client, bytearray())[0] == 0x27
+        assert connection.connection_closed_event.wait(2.0)
+        assert connection not in listener.connections
+    finally:
+        client.close()
@@ -0,0 +1,46 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from cryptography.hazmat.primitives.serialization import load_der_public_key
+from networking.mc_crypto import ServerKeyPair, decrypt_rsa, encode_public_key_der, encrypt_rsa
+from networking.packet.client_bound.login import CEncryptionRequest
+from networking.packet.packet_connection import PacketConnectionState
+
+
+def test_logins_share_keypair_with_fresh_tokens():
+    key_pair = ServerKeyPair()
+    first = CEncryptionRequest(True, key_pair)
+    second = CEncryptionRequest(True, key_pair)
+    assert first.private_key is second.private_key
+    assert first.public_der == encode_public_key_der(key_pair.snapshot()[1])
+    assert len(first.verify_token) == ServerKeyPair.VERIFY_TOKEN_SIZE
+    assert first.verify_token != second.verify_token
+
+def test_encryption_request_body_roundtrip():
+    key_pair = ServerKeyPair()
+    p_state = PacketConnectionState()
+    request = CEncryptionRequest(True, key_pair)
+    body = bytes(request.packet_body(p_state).buffer)
+    assert p_state.public_der in body
+    # The client encrypts with the key it was sent
+    client_key = load_der_public_key(p_state.public_der)
+    secret = os.urandom(16)
+    assert decrypt_rsa(encrypt_rsa(secret, client_key), p_state.private_key) == secret
+    assert decrypt_rsa(encrypt_rsa(p_state.verify_token, client_key), p_state.private_key) == p_state.verify_token
+
+def test_rotate_keeps_inflight_snapshot():
+    key_pair = ServerKeyPair()
+    p_state = PacketConnectionState()
+    CEncryptionRequest(True, key_pair).packet_body(p_state)
+    key_pair.rotate()
+    assert key_pair.snapshot()[2] != p_state.public_der
+    secret = os.urandom(16)
+    assert decrypt_rsa(encrypt_rsa(secret, load_der_public_key(p_state.public_der)), p_state.private_key) == secret
+
+def test_save_and_load(tmp_path):
+    key_pair = ServerKeyPair()
+    path = tmp_path / 'server.pem'
+    key_pair.save(str(path))
+    assert ServerKeyPair.load(str(path)).snapshot()[2] == key_pair.snapshot()[2]
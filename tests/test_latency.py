@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.latency import LatencySamples
+
+
+def test_nearest_rank_percentiles():
+    samples = LatencySamples()
+    assert samples.percentiles() == {}
+    for seconds in range(100, 0, -1):
+        samples.add(seconds / 1000)
+    assert samples.percentiles((1, 50, 99, 100)) == {1: 0.001, 50: 0.05, 99: 0.099, 100: 0.1}
+
+def test_only_recent_samples_count():
+    samples = LatencySamples(size=10)
+    for seconds in [5.0] * 100 + [1.0] * 10:
+        samples.add(seconds)
+    assert samples.percentiles() == {50: 1.0, 90: 1.0, 99: 1.0}
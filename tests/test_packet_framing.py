@@ -0,0 +1,136 @@
+import os
+import pytest
+import random
+import socket
+import sys
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.data_type import BufferedPacket
+from networking.mc_crypto import gen_ciphers
+from networking.packet.client_bound.login import CLoginPluginRequest
+from networking.packet.client_bound.status import CPongResponse
+from networking.packet.packet_connection import PacketConnectionState
+from networking.socket_io import MCPacketOutputStream
+
+
+def _varint(value: int) -> bytes:
+    buf = BufferedPacket()
+    buf.write_varint(value)
+    return bytes(buf.buffer)
+
+def _reference(packet_id: int, body: bytes, threshold: int) -> bytes:
+    '''
+    Frame layout straight from the protocol documentation.
+    '''
+    data = _varint(packet_id) + body
+    if threshold < 0:
+        return _varint(len(data)) + data
+    if len(data) < threshold:
+        return _varint(len(data) + 1) + b'\x00' + data
+    compressed = zlib.compress(data)
+    data_length = _varint(len(data))
+    return _varint(len(data_length) + len(compressed)) + data_length + compressed
+
+def _body(packet, p_state) -> bytes:
+    return bytes(packet.packet_body(p_state).buffer)
+
+@pytest.mark.parametrize('threshold', [-1, 0, 64, 256, 1 << 20])
+@pytest.mark.parametrize('payload_size', [0, 100, 300000])
+def test_frame_matches_protocol(threshold, payload_size):
+    p_state = PacketConnectionState()
+    packet = CLoginPluginRequest('test:chunk', os.urandom(payload_size // 2) * 2)
+    expected = _reference(packet.packet_id, _body(packet, p_state), threshold)
+    assert b''.join(bytes(piece) for piece in packet.frame(p_state, threshold)) == expected
+    assert bytes(packet.get_bytes(p_state, threshold).buffer) == expected
+
+def test_write_packet_encrypts_in_order():
+    server, client = socket.socketpair()
+    try:
+        p_state = PacketConnectionState()
+        shared_secret = os.urandom(16)
+        p_state.encrypt_cipher, _ = gen_ciphers(shared_secret)
+        _, decrypt_cipher = gen_ciphers(shared_secret)
+        p_state.encrypted = True
+        stream = MCPacketOutputStream(server, p_state)
+
+        packets = [CPongResponse(1), CLoginPluginRequest('test:data', b'x' * 5000), CPongResponse(2)]
+        for packet in packets:
+            stream.write_packet(packet)
+        assert stream.flush()
+        expected = b''.join(bytes(packet.get_bytes(p_state).buffer) for packet in packets)
+        received = b''
+        while len(received) < len(expected):
+            received += client.recv(65536)
+        assert decrypt_cipher.update(received) == expected
+    finally:
+        server.close()
+        client.close()
+
+def test_partial_flush_resumes():
+    server, client = socket.socketpair()
+    try:
+        server.setblocking(False)
+        p_state = PacketConnectionState()
+        stream = MCPacketOutputStream(server, p_state)
+        packet = CLoginPluginRequest('test:chunk', os.urandom(1 << 22))
+        stream.write_packet(packet)
+        expected = bytes(packet.get_bytes(p_state).buffer)
+        received = bytearray()
+        while not stream.flush():
+            received += client.recv(1 << 20)
+        while len(received) < len(expected):
+            received += client.recv(1 << 20)
+        assert received == expected
+    finally:
+        server.close()
+        client.close()
+
+def test_flush_gathers_packets_into_one_call():
+    server, client = socket.socketpair()
+    try:
+        p_state = PacketConnectionState()
+        stream = MCPacketOutputStream(server, p_state)
+        packets = [CPongResponse(1), CLoginPluginRequest('test:data', os.urandom(8192)), CPongResponse(2),
+                   CLoginPluginRequest('test:data', os.urandom(4096))]
+        for packet in packets:
+            stream.write_packet(packet)
+        assert stream.flush()
+        assert stream.send_calls == 1
+        expected = b''.join(bytes(packet.get_bytes(p_state).buffer) for packet in packets)
+        assert stream.bytes_sent == len(expected)
+        received = b''
+        while len(received) < len(expected):
+            received += client.recv(65536)
+        assert received == expected
+    finally:
+        server.close()
+        client.close()
+
+def test_partial_gathered_flush_keeps_order():
+    server, client = socket.socketpair()
+    try:
+        server.setblocking(False)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        client.settimeout(5.0)
+        p_state = PacketConnectionState()
+        stream = MCPacketOutputStream(server, p_state)
+        rng = random.Random(16)
+        expected = bytearray()
+        received = bytearray()
+        for i in range(300):
+            packet = CLoginPluginRequest('test:data', os.urandom(rng.choice((10, 100, 3000, 20000))))
+            stream.write_packet(packet)
+            expected += packet.get_bytes(p_state).buffer
+            if i % 7 == 0:
+                stream.flush()
+                received += client.recv(1 << 16)
+        while not stream.flush():
+            received += client.recv(1 << 16)
+        while len(received) < len(expected):
+            received += client.recv(1 << 16)
+        assert received == expected
+    finally:
+        server.close()
+        client.close()
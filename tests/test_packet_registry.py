@@ -0,0 +1,57 @@
+import pytest
+import struct
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import packet_frame
+from networking.exception import DataCorruptedError
+from networking.packet import ServerboundPacket, registry
+from networking.packet.packet_connection import PacketConnectionState
+from networking.packet.server_bound import play as s_play
+from networking.packet.server_bound import status as s_status
+from networking.protocol import ConnectionState
+from networking.socket_io import MCPacketInputStream
+
+
+def _read_all(pair: tuple, state: ConnectionState, data: bytes) -> list:
+    server, client = pair
+    p_state = PacketConnectionState()
+    p_state.state = state
+    stream = MCPacketInputStream(server, p_state)
+    client.sendall(data)
+    stream.fill()
+    packets = []
+    while stream.frame_available():
+        packets.append(stream.read_packet(p_state))
+    return packets
+
+def test_lookup_by_state_and_id():
+    assert registry.decoder(ConnectionState.STATUS, 0x01) is s_status.SPingRequest
+    assert registry.decoder(ConnectionState.PLAY, 0x1D) is s_play.SSetPlayerPositionRotation
+    assert registry.decoder(ConnectionState.PLAY, 0x7F) is None
+    assert registry.decoder(ConnectionState.PLAY, 300) is None
+    assert s_status.SPingRequest(0).packet_id == 0x01
+
+def test_movement_decode(pair):
+    body = struct.pack('>dddffB', 1.5, 64.0, -3.25, 90.0, 12.5, 1)
+    packet, = _read_all(pair, ConnectionState.PLAY, packet_frame(0x1D, body))
+    assert isinstance(packet, s_play.SSetPlayerPositionRotation)
+    assert (packet.x, packet.y, packet.z, packet.yaw, packet.pitch, packet.flags) == (1.5, 64.0, -3.25, 90.0, 12.5, 1)
+
+def test_unknown_packets_are_skipped(pair):
+    data = packet_frame(0x7F, b'\xff' * 100) + packet_frame(1000, b'') + packet_frame(0x01, struct.pack('>q', 99))
+    unknown, out_of_range, ping = _read_all(pair, ConnectionState.STATUS, data)
+    assert unknown is None and out_of_range is None
+    assert isinstance(ping, s_status.SPingRequest)
+
+def test_truncated_fields(pair):
+    with pytest.raises(DataCorruptedError):
+        _read_all(pair, ConnectionState.PLAY, packet_frame(0x1C, b'\x00' * 10))
+
+def test_duplicate_registration():
+    with pytest.raises(ValueError):
+        class SDuplicate(ServerboundPacket, state=ConnectionState.STATUS, packet_id=0x01):
+            def handle(self, p_state):
+                return None
+    assert registry.decoder(ConnectionState.STATUS, 0x01) is s_status.SPingRequest
@@ -0,0 +1,94 @@
+import os
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import connect, recv_frame, wait_for
+from networking.connection import Connection
+from networking.packet import ClientboundPacket
+from networking.packet.client_bound.play import CChunkBatchFinished, CChunkBatchStart, CKeepAlive, CUpdateEntityPosition
+from networking.packet.scheduler import PacketScheduler, Priority
+from networking.packet.schema import RemainingBytes
+
+
+class CChunk(ClientboundPacket, packet_id=0x28):
+    priority = Priority.BULK
+    fields = [('data', RemainingBytes)]
+
+
+def test_priorities_are_declared():
+    assert CKeepAlive.priority == Priority.CONTROL
+    assert CUpdateEntityPosition.priority == Priority.MOVEMENT
+    assert CChunkBatchStart.priority == CChunkBatchFinished.priority == Priority.BULK
+    assert ClientboundPacket.priority == Priority.WORLD
+
+def test_control_goes_first():
+    scheduler = PacketScheduler()
+    scheduler.push(Priority.BULK, 100, 'chunk')
+    scheduler.push(Priority.MOVEMENT, 10, 'move')
+    scheduler.push(Priority.CONTROL, 10, 'keep alive')
+    assert len(scheduler) == 3 and scheduler.queued_bytes == 120
+    assert [scheduler.pop() for _ in range(3)] == ['keep alive', 'move', 'chunk']
+    assert scheduler.pop() is None and scheduler.queued_bytes == 0
+
+def test_classes_share_by_quanta():
+    scheduler = PacketScheduler({Priority.MOVEMENT: 300, Priority.WORLD: 200, Priority.BULK: 100})
+    for i in range(30):
+        scheduler.push(Priority.MOVEMENT, 100, ('move', i))
+        scheduler.push(Priority.WORLD, 100, ('world', i))
+        scheduler.push(Priority.BULK, 100, ('bulk', i))
+    popped = [scheduler.pop() for _ in range(30)]
+    assert [kind for kind, _ in popped].count('move') == 15
+    assert [kind for kind, _ in popped].count('world') == 10
+    assert [kind for kind, _ in popped].count('bulk') == 5
+    # FIFO within a class
+    for kind in ('move', 'world', 'bulk'):
+        ids = [i for popped_kind, i in popped if popped_kind == kind]
+        assert ids == sorted(ids) and ids[0] == 0
+
+def test_large_entries_are_never_split_or_starved():
+    scheduler = PacketScheduler({Priority.MOVEMENT: 100, Priority.BULK: 100})
+    scheduler.push(Priority.BULK, 1000, 'batch')
+    for i in range(100):
+        scheduler.push(Priority.MOVEMENT, 50, i)
+    popped = [scheduler.pop() for _ in range(101)]
+    # The batch banks credit round after round until it fits
+    assert 'batch' in popped[:40]
+    assert [entry for entry in popped if entry != 'batch'] == list(range(100))
+
+def test_idle_class_does_not_bank_credit():
+    scheduler = PacketScheduler({Priority.MOVEMENT: 100, Priority.BULK: 100})
+    for _ in range(5):
+        scheduler.push(Priority.MOVEMENT, 100, 'move')
+    assert [scheduler.pop() for _ in range(5)] == ['move'] * 5
+    for i in range(4):
+        scheduler.push(Priority.BULK, 100, ('bulk', i))
+        scheduler.push(Priority.MOVEMENT, 100, ('move', i))
+    popped = [scheduler.pop() for _ in range(4)]
+    assert sorted(kind for kind, _ in popped) == ['bulk', 'bulk', 'move', 'move']
+
+def test_clear_returns_waiting_entries():
+    scheduler = PacketScheduler()
+    scheduler.push(Priority.WORLD, 10, 'a')
+    scheduler.push(Priority.CONTROL, 10, 'b')
+    assert sorted(scheduler.clear()) == ['a', 'b']
+    assert not scheduler and scheduler.queued_bytes == 0
+
+@pytest.mark.parametrize('listener', [{'compression_threshold': -1, 'high_water_mark': 16 << 20, 'max_queued_bytes': 32 << 20}], indirect=True)
+def test_keep_alive_overtakes_queued_chunks(listener):
+    connection, client = connect(listener, buffer_size=16384)
+    try:
+        chunks = [connection.send(CChunk(os.urandom(32768))) for _ in range(64)]
+        wait_for(lambda: connection.queued_bytes >= 1 << 20)
+        keep_alive = connection.send(CKeepAlive(42))
+
+        received = bytearray()
+        packet_ids = [recv_frame(client, received)[0] for _ in range(65)]
+        position = packet_ids.index(0x27)
+        # Only what was already released into the arena goes out ahead of the keep alive
+        assert position <= Connection.SCHEDULE_AHEAD // 32768 + 2
+        assert keep_alive.result(5.0) is None
+        assert all(future.result(5.0) is None for future in chunks)
+    finally:
+        client.close()
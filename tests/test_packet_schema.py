@@ -0,0 +1,114 @@
+import pytest
+import random
+import struct
+import sys
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.data_type import BufferedPacket
+from networking.packet import ClientboundPacket
+from networking.packet.client_bound import play as c_play
+from networking.packet.packet_connection import PacketConnectionState
+from networking.packet.schema import (Angle, Bool, ByteArray, Double, Int, Long, RemainingBytes, Short, String, UUID,
+                                      VarInt, VarLong, compile_fields)
+from networking.packet.server_bound import play as s_play
+
+
+def _hand_written(entity_id, dx, dy, dz, yaw, pitch, on_ground) -> bytes:
+    packet = BufferedPacket(byte_order='big')
+    packet.write_varint(entity_id)
+    packet.write_int16(dx)
+    packet.write_int16(dy)
+    packet.write_int16(dz)
+    packet.write_uint8(yaw)
+    packet.write_uint8(pitch)
+    packet.write_bool(on_ground)
+    return bytes(packet.buffer)
+
+def _wrap(data: bytes) -> BufferedPacket:
+    return BufferedPacket(byte_order='big').wrap(data, auto_flip=True)
+
+def test_matches_hand_written_encoding():
+    rng = random.Random(13)
+    p_state = PacketConnectionState()
+    for _ in range(200):
+        values = (rng.randrange(-2**31, 2**31), rng.randrange(-2**15, 2**15), rng.randrange(-2**15, 2**15),
+                  rng.randrange(-2**15, 2**15), rng.randrange(256), rng.randrange(256), rng.random() < 0.5)
+        packet = c_play.CUpdateEntityPositionRotation(*values)
+        assert packet.encode_body(p_state) == _hand_written(*values)
+        assert bytes(packet.packet_body(p_state).buffer) == _hand_written(*values)
+        decoded = c_play.CUpdateEntityPositionRotation.decode(_wrap(_hand_written(*values)))
+        assert (decoded.entity_id, decoded.delta_x, decoded.delta_y, decoded.delta_z,
+                decoded.yaw, decoded.pitch, decoded.on_ground) == values
+
+def test_packet_id_and_frame():
+    packet = c_play.CSetCenterChunk(-1, 300)
+    assert packet.packet_id == 0x58
+    assert b''.join(packet.frame(PacketConnectionState())) == b'\x08\x58\xff\xff\xff\xff\x0f\xac\x02'
+
+def test_decode_advances_position():
+    buffer = _wrap(struct.pack('>dddB', 1.0, 2.0, 3.0, 1) + b'tail')
+    packet = s_play.SPlayerPosition.decode(buffer)
+    assert (packet.x, packet.y, packet.z, packet.flags) == (1.0, 2.0, 3.0, 1)
+    assert buffer.read(4) == b'tail'
+
+def test_truncated_input():
+    with pytest.raises(struct.error):
+        s_play.SPlayerPosition.decode(_wrap(b'\x00' * 24))
+    with pytest.raises(struct.error):
+        c_play.CUpdateEntityPositionRotation.decode(_wrap(b'\x01\x00\x00'))
+
+def test_variable_width_fields():
+    class CEverything(ClientboundPacket, packet_id=0x7F):
+        fields = [('name', String(16)), ('id', UUID), ('seed', VarLong), ('x', Double),
+                  ('blob', ByteArray), ('rest', RemainingBytes)]
+
+    values = ('Notch ✓', uuid.uuid4(), -2**40, 0.5, b'\x00\x01', b'trailing')
+    data = CEverything(*values).encode_body(None)
+    decoded = CEverything.decode(_wrap(data))
+    assert (decoded.name, decoded.id, decoded.seed, decoded.x, decoded.blob, decoded.rest) == values
+    assert CEverything('', values[1], 0, 0.0, b'', b'').encode_body(None)[:1] == b'\x00'
+    with pytest.raises(ValueError):
+        CEverything('x' * 17, *values[1:]).encode_body(None)
+
+def test_custom_init_is_kept():
+    class CCentered(ClientboundPacket, packet_id=0x58):
+        fields = [('chunk_x', VarInt), ('chunk_z', VarInt)]
+
+        def __init__(self, chunk_x: int, chunk_z: int = 0):
+            self.chunk_x = chunk_x
+            self.chunk_z = chunk_z
+
+    assert CCentered(3).encode_body(None) == b'\x03\x00'
+    assert CCentered.__init__.__code__.co_argcount == 3
+
+def test_fixed_width_runs_collapse():
+    encode, decode, _ = compile_fields('Run', [('a', Short), ('b', Angle), ('c', Bool), ('d', Long)])
+    assert [name for name in decode.__globals__ if name.startswith('_s')] == ['_s0']
+    assert decode.__globals__['_s0'].format == '>hB?q'
+    assert encode.__code__.co_names == ('_s0', 'pack', 'a', 'b', 'c', 'd')
+
+def test_invalid_layouts():
+    with pytest.raises(ValueError):
+        compile_fields('Bad', [('rest', RemainingBytes), ('x', VarInt)])
+    with pytest.raises(ValueError):
+        compile_fields('Bad', [('x', VarInt), ('x', VarInt)])
+    with pytest.raises(ValueError):
+        compile_fields('Bad', [('class', VarInt)])
+    with pytest.raises(ValueError, match='underscore'):
+        compile_fields('Bad', [('_data', VarInt)])
+    with pytest.raises(TypeError):
+        compile_fields('Bad', [('x', int)])
+    with pytest.raises(ValueError):
+        String(40000)
+
+def test_field_names_do_not_clash_with_the_generated_code():
+    class CShadowing(ClientboundPacket, packet_id=0x7E):
+        fields = [('data', VarInt), ('offset', Int), ('limit', ByteArray), ('buffer', String(16)), ('cls', Long),
+                  ('self', Short), ('len', VarInt), ('bytes', RemainingBytes)]
+
+    values = (300, -7, b'\x01\x02', 'name', 2**40, 12, 5, b'tail')
+    data = CShadowing(*values).encode_body(None)
+    decoded = CShadowing.decode(_wrap(data))
+    assert tuple(getattr(decoded, name) for name, _ in CShadowing.fields) == values
@@ -0,0 +1,62 @@
+import os
+import socket
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.mc_crypto import gen_ciphers
+from networking.packet.packet_connection import PacketConnectionState
+from networking.socket_io import ReceiveBuffer, MCPacketInputStream
+
+
+def _write(buffer: ReceiveBuffer, data: bytes):
+    tail = buffer.writable(len(data))
+    tail[:len(data)] = data
+    buffer.commit(len(data))
+
+def test_read_returns_views_in_order():
+    buffer = ReceiveBuffer(capacity=16)
+    _write(buffer, b'abcdef')
+    assert bytes(buffer.read(2)) == b'ab'
+    assert buffer[0] == ord('c')
+    assert bytes(buffer.read(10)) == b'cdef'
+    assert len(buffer) == 0
+
+def test_compaction_keeps_capacity():
+    buffer = ReceiveBuffer(capacity=16)
+    _write(buffer, b'0123456789')
+    buffer.read(8)
+    _write(buffer, b'abcdefghij')
+    assert buffer.capacity() == 16
+    assert bytes(buffer.read(12)) == b'89abcdefghij'
+
+def test_growth_preserves_unread():
+    buffer = ReceiveBuffer(capacity=16)
+    _write(buffer, b'0123456789')
+    buffer.read(2)
+    _write(buffer, bytes(range(40)))
+    assert buffer.capacity() >= 48
+    assert bytes(buffer.read(8)) == b'23456789'
+    assert bytes(buffer.read(40)) == bytes(range(40))
+
+def test_fill_decrypts_in_place():
+    server, client = socket.socketpair()
+    try:
+        p_state = PacketConnectionState()
+        shared_secret = os.urandom(16)
+        encrypt_cipher, p_state.decrypt_cipher = gen_ciphers(shared_secret)
+        p_state.encrypted = True
+        stream = MCPacketInputStream(server, p_state)
+
+        frame = b'\x06\x00hello'
+        client.sendall(encrypt_cipher.update(frame[:3]))
+        assert stream.fill()
+        assert not stream.frame_available()
+        client.sendall(encrypt_cipher.update(frame[3:]))
+        assert stream.fill()
+        assert stream.frame_available()
+        assert stream.read_varint() == 6
+        assert bytes(stream.read(6)) == b'\x00hello'
+    finally:
+        server.close()
+        client.close()
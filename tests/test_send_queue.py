@@ -0,0 +1,71 @@
+import pytest
+import struct
+import sys
+import threading
+from concurrent.futures import wait
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import connect, packet_frame, recv_frame
+from networking.connection import Connection
+from networking.exception import ConnectionClosedError
+from networking.packet.client_bound.play import CKeepAlive
+from networking.packet.server_bound.play import SKeepAlive
+
+
+@pytest.fixture
+def play_connection(listener):
+    connection, client = connect(listener)
+    yield connection, client
+    client.close()
+
+def test_sends_from_many_threads_keep_order(play_connection):
+    connection, client = play_connection
+    futures = []
+    futures_lock = threading.Lock()
+
+    def game_logic(thread: int):
+        sent = [connection.send(CKeepAlive(thread * 1000 + i)) for i in range(250)]
+        with futures_lock:
+            futures.extend(sent)
+
+    threads = [threading.Thread(target=game_logic, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    received = bytearray()
+    ids = [struct.unpack('>q', recv_frame(client, received)[1:])[0] for _ in range(1000)]
+    for thread in range(4):
+        assert [i for i in ids if i // 1000 == thread] == [thread * 1000 + i for i in range(250)]
+    done, not_done = wait(futures, 5.0)
+    assert not not_done and all(future.result() is None for future in done)
+
+def test_request_resolves_to_matching_reply(play_connection):
+    connection, client = play_connection
+    reply = connection.request(CKeepAlive(7), SKeepAlive, match=lambda packet: packet.keep_alive_id == 7, timeout=5.0)
+    assert recv_frame(client, bytearray()) == b'\x27' + struct.pack('>q', 7)
+    client.sendall(packet_frame(0x1A, struct.pack('>q', 3)) + packet_frame(0x1A, struct.pack('>q', 7)))
+    assert reply.result(5.0).keep_alive_id == 7
+
+def test_request_times_out(play_connection):
+    connection, client = play_connection
+    reply = connection.request(CKeepAlive(1), SKeepAlive, timeout=0.1)
+    with pytest.raises(TimeoutError):
+        reply.result(5.0)
+
+def test_send_before_start_fails(listener, pair):
+    connection = Connection(pair[0], ('127.0.0.1', 0), listener)
+    with pytest.raises(ConnectionClosedError):
+        connection.send(CKeepAlive(1)).result(1.0)
+    with pytest.raises(ConnectionClosedError):
+        connection.request(CKeepAlive(1), SKeepAlive).result(1.0)
+    with pytest.raises(ConnectionClosedError):
+        connection.when_writable().result(1.0)
+
+def test_send_after_close_fails(play_connection):
+    connection, client = play_connection
+    connection.interrupt()
+    connection.join()
+    with pytest.raises(ConnectionClosedError):
+        connection.send(CKeepAlive(1)).result(1.0)
@@ -0,0 +1,145 @@
+import base64
+import json
+import selectors
+import socket
+import struct
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from helpers import frame, handshake, recv_frame, wait_for
+from networking.event_loop import TimerHandle
+from networking.protocol import ConnectionState
+from networking.status import PNG_SIGNATURE, ServerStatus, StatusResponder, read_favicon
+from networking.varint import decode_varint
+
+FAVICON = PNG_SIGNATURE + b'\x00' * 32
+
+
+def _unframe(data: bytes) -> bytes:
+    length, offset = decode_varint(data)
+    assert len(data) == offset + length
+    return data[offset:]
+
+def _json(data: bytes) -> dict:
+    assert data[0] == 0x00
+    size, start = decode_varint(data, 1)
+    return json.loads(data[start:start + size])
+
+def test_response_frame_is_cached():
+    online = [3]
+    calls = []
+    status = ServerStatus(max_players=10, online_players=lambda: calls.append(None) or online[0], favicon=FAVICON)
+    frame = status.response_frame()
+    response = _json(_unframe(frame))
+    assert response['players'] == {'max': 10, 'online': 3, 'sample': []}
+    assert response['favicon'] == 'data:image/png;base64,' + base64.b64encode(FAVICON).decode('ascii')
+    # Within the TTL the count is not even asked
+    online[0] = 4
+    assert status.response_frame() is frame and len(calls) == 1
+    status._cache = (0.0,) + status._cache[1:]
+    online[0] = 3
+    assert status.response_frame() is frame and len(calls) == 2
+    status._cache = (0.0,) + status._cache[1:]
+    online[0] = 4
+    changed = status.response_frame()
+    assert _json(_unframe(changed))['players']['online'] == 4
+
+def test_read_favicon(tmp_path):
+    assert read_favicon(tmp_path / 'server-icon.png') is None
+    (tmp_path / 'server-icon.png').write_bytes(FAVICON)
+    assert read_favicon(tmp_path / 'server-icon.png') == FAVICON
+    (tmp_path / 'server-icon.png').write_bytes(b'GIF89a')
+    with pytest.raises(ValueError):
+        read_favicon(tmp_path / 'server-icon.png')
+
+class _WouldBlockSocket:
+    '''
+    A socket whose first recv and send would block, as after a spurious readiness event or with a full send buffer.
+    '''
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.blocks = {'recv', 'send'}
+
+    def recv(self, size: int) -> bytes:
+        if 'recv' in self.blocks:
+            self.blocks.discard('recv')
+            raise BlockingIOError()
+        return self.sock.recv(size)
+
+    def send(self, data: bytes) -> int:
+        if 'send' in self.blocks:
+            self.blocks.discard('send')
+            raise BlockingIOError()
+        return self.sock.send(data)
+
+    def __getattr__(self, name: str):
+        return getattr(self.sock, name)
+
+class _Loop:
+    def __init__(self):
+        self.interest = None
+
+    def register(self, sock, events: int, callback):
+        self.interest = events
+
+    modify = register
+
+    def unregister(self, sock):
+        self.interest = None
+
+    def call_timeout(self, delay: float, callback, *args):
+        return TimerHandle(0.0, callback, args)
+
+def test_would_block_keeps_the_socket(pair):
+    server, client = pair
+    client.settimeout(5.0)
+    loop = _Loop()
+    responder = StatusResponder(ServerStatus(), _WouldBlockSocket(server), ('127.0.0.1', 0), loop, None)
+    try:
+        responder._on_attach()
+        responder._on_event(selectors.EVENT_READ)
+        assert not responder.closed
+        client.sendall(handshake(25565, 1) + frame(b'\x00'))
+        responder._on_event(selectors.EVENT_READ)
+        # The response waits for the socket to be writable
+        assert not responder.closed and loop.interest == selectors.EVENT_READ | selectors.EVENT_WRITE
+        responder._on_event(selectors.EVENT_WRITE)
+        assert _json(recv_frame(client, bytearray()))['version']['protocol'] == 769
+        assert loop.interest == selectors.EVENT_READ
+    finally:
+        responder.close()
+
+@pytest.fixture
+def listener_options() -> dict:
+    return {'favicon': FAVICON}
+
+def test_status_ping_is_served_without_a_connection(listener):
+    port = listener.server.getsockname()[1]
+    with socket.create_connection(('127.0.0.1', port), timeout=5.0) as client:
+        received = bytearray()
+        # Split mid frame, as a slow link would deliver it
+        request = handshake(port, 1) + frame(b'\x00')
+        client.sendall(request[:5])
+        time.sleep(0.05)
+        client.sendall(request[5:])
+        response = _json(recv_frame(client, received))
+        assert response['version']['protocol'] == 769
+        assert response['favicon'].startswith('data:image/png;base64,')
+        client.sendall(frame(b'\x01', struct.pack('>q', 42)))
+        assert recv_frame(client, received) == b'\x01' + struct.pack('>q', 42)
+        assert client.recv(64) == b''
+    assert len(listener.connections) == 0
+
+def test_login_is_handed_over(listener):
+    port = listener.server.getsockname()[1]
+    with socket.create_connection(('127.0.0.1', port), timeout=5.0) as client:
+        client.sendall(handshake(port, 2))
+        assert wait_for(lambda: len(listener.connections) == 1)
+        connection = listener.connections.snapshot()[0]
+        # The handshake read by the responder was handled by the connection
+        assert wait_for(lambda: connection.packet_state.state == ConnectionState.LOGIN)
@@ -0,0 +1,95 @@
+import random
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.event_loop import EventLoop, TimingWheel
+
+
+def _fired(due: list) -> list:
+    return [timer.callback for timer in due]
+
+def test_timers_fire_in_order_and_never_early():
+    wheel = TimingWheel(resolution=0.1, slots=8, levels=3)
+    fired = []
+    whens = [random.uniform(0.0, 100.0) for _ in range(500)]
+    for when in whens:
+        wheel.schedule(when, when)
+    now = 0.0
+    while len(wheel):
+        now += random.uniform(0.0, 1.0)
+        for timer in wheel.advance(now):
+            assert timer.when <= now
+            fired.append(timer.callback)
+            # At most one tick late
+            assert now - timer.when < 1.0 + 0.1
+    assert sorted(fired) == sorted(whens)
+
+def test_cascades_through_every_level():
+    wheel = TimingWheel(resolution=1.0, slots=4, levels=3)
+    # Beyond the top level, the wheel holds it until it comes within reach
+    wheel.schedule(100.0, 'far')
+    wheel.schedule(20.0, 'level 2')
+    wheel.schedule(5.0, 'level 1')
+    wheel.schedule(2.0, 'level 0')
+    assert wheel.next_deadline() == 2.0
+    fired = []
+    for now in range(101):
+        fired += [(now, callback) for callback in _fired(wheel.advance(float(now)))]
+    assert fired == [(2, 'level 0'), (5, 'level 1'), (20, 'level 2'), (100, 'far')]
+    assert wheel.next_deadline() is None
+
+def test_cancel_removes_the_timer():
+    wheel = TimingWheel(resolution=0.1)
+    timers = [wheel.schedule(1.0 + i, i) for i in range(10)]
+    for timer in timers[::2]:
+        timer.cancel()
+    timers[0].cancel()
+    assert len(wheel) == 5
+    assert _fired(wheel.advance(20.0)) == [1, 3, 5, 7, 9]
+    assert len(wheel) == 0
+
+def test_idle_wheel_skips_ahead():
+    wheel = TimingWheel(resolution=0.1)
+    assert wheel.advance(1e6) == []
+    wheel.schedule(1e6 + 1.0, 'after idle')
+    assert wheel.advance(1e6 + 0.5) == []
+    assert _fired(wheel.advance(1e6 + 1.1)) == ['after idle']
+
+def test_event_loop_timeouts():
+    loop = EventLoop('TestLoop')
+    loop.start()
+    try:
+        fired = threading.Event()
+        cancelled = []
+        def schedule():
+            loop.call_timeout(10.0, cancelled.append, 'cancelled').cancel()
+            loop.call_timeout(0.05, fired.set)
+        loop.call_soon(schedule)
+        assert fired.wait(2.0)
+        assert not cancelled
+    finally:
+        loop.stop()
+        loop.join()
+
+def test_next_deadline_at_a_turn_boundary():
+    wheel = TimingWheel(now=90.0)
+    wheel.schedule(103.0, 'boundary')
+    assert wheel.advance(90.05) == []
+    assert wheel.advance(102.35) == []
+    # The next turn starts at 102.4, with the timer still one level up
+    assert wheel.next_deadline() <= 103.0
+    assert wheel.advance(102.45) == []
+    assert wheel.next_deadline() <= 103.0
+    assert _fired(wheel.advance(103.05)) == ['boundary']
+
+def test_driven_by_next_deadline_no_timer_fires_late():
+    wheel = TimingWheel(resolution=0.1, slots=8, levels=3)
+    for _ in range(2000):
+        when = random.uniform(0.0, 200.0)
+        wheel.schedule(when, when)
+    while len(wheel):
+        now = wheel.next_deadline() + 0.05
+        for timer in wheel.advance(now):
+            assert timer.when <= now < timer.when + 0.2
@@ -0,0 +1,86 @@
+import pytest
+import random
+import struct
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from networking.exception import DataCorruptedError
+from networking.varint import (
+    decode_varint,
+    decode_varlong,
+    decode_varints,
+    encode_varint,
+    encode_varlong,
+    encode_varints,
+    varint_size,
+    write_varint,
+)
+
+INT_BOUNDARIES = [0, 1, 127, 128, 16383, 16384, 2097151, 2097152, 2147483647, -1, -2147483648]
+LONG_BOUNDARIES = INT_BOUNDARIES + [2 ** 35, 9223372036854775807, -9223372036854775808]
+
+def _random_ints(seed: int, bits: int, count=2000):
+    rng = random.Random(seed)
+    values = []
+    for _ in range(count):
+        # Spread samples over every encoded size, not just the huge ones
+        width = rng.randint(1, bits)
+        values.append(rng.randint(-(1 << (width - 1)), (1 << (width - 1)) - 1))
+    return values
+
+def _reference_varint(value: int) -> bytes:
+    unsigned = value & 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        temp = unsigned & 0x7F
+        unsigned >>= 7
+        out.append(temp | (0x80 if unsigned else 0))
+        if not unsigned:
+            return bytes(out)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_varint_roundtrip_property(seed):
+    for value in INT_BOUNDARIES + _random_ints(seed, 32):
+        encoded = encode_varint(value)
+        assert encoded == _reference_varint(value)
+        assert len(encoded) == varint_size(value)
+        assert decode_varint(b'\xff' + encoded, 1) == (value, 1 + len(encoded))
+
+@pytest.mark.parametrize('seed', range(5))
+def test_varlong_roundtrip_property(seed):
+    for value in LONG_BOUNDARIES + _random_ints(seed, 64):
+        encoded = encode_varlong(value)
+        assert len(encoded) <= 10
+        assert decode_varlong(encoded) == (value, len(encoded))
+
+@pytest.mark.parametrize('seed', range(3))
+def test_batch_roundtrip_property(seed):
+    values = _random_ints(seed, 32)
+    encoded = encode_varints(values)
+    assert encoded == b''.join(encode_varint(value) for value in values)
+    assert decode_varints(memoryview(encoded), len(values)) == (values, len(encoded))
+
+def test_write_into_buffer():
+    buffer = bytearray(8)
+    offset = write_varint(buffer, 1, 300)
+    assert offset == 3
+    assert len(buffer) == 8
+    assert decode_varint(buffer, 1) == (300, 3)
+
+def test_out_of_range():
+    with pytest.raises(ValueError):
+        encode_varint(2147483648)
+    with pytest.raises(ValueError):
+        encode_varlong(-9223372036854775809)
+
+def test_truncated_and_limit():
+    with pytest.raises(struct.error):
+        decode_varint(b'\x80\x80')
+    with pytest.raises(struct.error):
+        decode_varint(b'\xac\x02', 0, 1)
+
+def test_too_big():
+    with pytest.raises(DataCorruptedError):
+        decode_varint(b'\xff\xff\xff\xff\xff\x01')
+    assert decode_varlong(b'\xff\xff\xff\xff\xff\x01')[1] == 6